@@ -4,7 +4,7 @@ DrugTox-AI Clean Backend API
 ===========================
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
 import sys
@@ -19,7 +19,11 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'config'))
 sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
 
 # Import caching system
-from utils.cache import PredictionCache, CachedPredictionWrapper, prediction_cache
+from utils.cache import PredictionCache, CachedPredictionWrapper, prediction_cache, negative_cache
+from utils.batcher import prediction_batcher_from_env
+from utils.shared_cache import shared_cache_from_env
+from utils.cache_snapshot import cache_snapshotter_from_env
+from utils.jobs import job_runner_from_env
 
 # Import MedToXAi feature
 try:
@@ -38,11 +42,13 @@ predictor_cached = None  # Cached predictor wrapper
 db_service = None
 groq_client = None
 medtoxai_analyzer = None
+job_runner = None  # Background batch job runner
+cache_snapshotter = None  # Periodic prediction cache snapshots (warm restarts)
 cache = prediction_cache  # Use global cache instance
 
 def initialize_services():
     """Initialize all services (ML predictor, database, AI, MedToXAi)"""
-    global predictor, predictor_cached, db_service, groq_client, medtoxai_analyzer, cache
+    global predictor, predictor_cached, db_service, groq_client, medtoxai_analyzer, cache, job_runner, cache_snapshotter
     
     # Initialize ML predictor with caching
     try:
@@ -50,9 +56,17 @@ def initialize_services():
         predictor = SimpleDrugToxPredictor()
         if predictor.is_loaded:
             # Wrap predictor with caching
-            predictor_cached = CachedPredictionWrapper(predictor, cache)
+            predictor_cached = CachedPredictionWrapper(
+                predictor, cache, batcher=prediction_batcher_from_env(predictor),
+                shared_cache=shared_cache_from_env(), negative_cache=negative_cache
+            )
             print("✅ DrugTox predictor initialized successfully")
-            print(f"✅ Prediction caching enabled (TTL: 1 hour, Max size: 10000)")
+            print(f"✅ Prediction caching enabled (TTL: {cache.ttl}s, Max size: {cache.max_size}, Admission: {cache.admission})")
+            print(f"✅ Negative cache for invalid SMILES (TTL: {negative_cache.ttl}s, Max size: {negative_cache.max_size})")
+            if predictor_cached.shared_cache:
+                print(f"✅ Shared L2 prediction cache: {predictor_cached.shared_cache.path}")
+            if predictor_cached.batcher:
+                print(f"✅ Micro-batching enabled (window: {predictor_cached.batcher.window * 1000:g} ms)")
         else:
             print("❌ DrugTox predictor failed to load")
             return False
@@ -60,6 +74,28 @@ def initialize_services():
         print(f"❌ Error initializing predictor: {e}")
         return False
     
+    # Warm the prediction cache from the last snapshot (worker recycles and
+    # deploys would otherwise start with an empty cache)
+    try:
+        cache_snapshotter = cache_snapshotter_from_env(cache)
+        if cache_snapshotter:
+            loaded = cache_snapshotter.start()
+            print(f"✅ Prediction cache snapshots: {cache_snapshotter.path} ({loaded} entries restored)")
+    except Exception as e:
+        print(f"⚠️ Prediction cache snapshots disabled: {e}")
+        cache_snapshotter = None
+    
+    # Initialize background batch job runner
+    try:
+        job_runner = job_runner_from_env(
+            lambda smiles_list, options: predictor.predict_batch(smiles_list, endpoints=options.get('endpoints'))
+        )
+        job_runner.start()
+        print(f"✅ Batch job runner started ({job_runner.workers} worker(s), store: {job_runner.store.path})")
+    except Exception as e:
+        print(f"⚠️ Batch job runner disabled: {e}")
+        job_runner = None
+    
     # Initialize Supabase database service
     try:
         from config.supabase import supabase_config
@@ -103,6 +139,7 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'predictor_loaded': predictor is not None and predictor.is_loaded,
+        'models': predictor.get_model_status() if predictor is not None and predictor.is_loaded else None,
         'cache_enabled': True,
         'cache_stats': cache.get_stats() if cache else None
     })
@@ -111,8 +148,12 @@ def health_check():
 def get_cache_stats():
     """Get prediction cache statistics"""
     try:
-        stats = cache.get_stats()
+        stats = predictor_cached.get_cache_stats() if predictor_cached else cache.get_stats()
         stats['cache_size_mb'] = cache.get_cache_size_mb()
+        if predictor_cached:
+            stats['singleflight'] = predictor_cached.flights.get_stats()
+        if cache_snapshotter:
+            stats['snapshot'] = cache_snapshotter.get_stats()
         return jsonify({
             'success': True,
             'cache_stats': stats
@@ -121,11 +162,28 @@ def get_cache_stats():
         print(f"❌ Error getting cache stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/batching/stats', methods=['GET'])
+def get_batching_stats():
+    """Get micro-batching statistics (batch sizes and queueing delay)"""
+    try:
+        batcher = predictor_cached.batcher if predictor_cached else None
+        return jsonify({
+            'success': True,
+            'enabled': batcher is not None,
+            'batching_stats': batcher.get_stats() if batcher else None
+        })
+    except Exception as e:
+        print(f"❌ Error getting batching stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/cache/clear', methods=['POST'])
 def clear_cache():
-    """Clear prediction cache"""
+    """Clear prediction cache (in every worker when the shared cache is enabled)"""
     try:
-        cache.clear()
+        if predictor_cached:
+            predictor_cached.clear_cache()
+        else:
+            cache.clear()
         return jsonify({
             'success': True,
             'message': 'Cache cleared successfully'
@@ -146,6 +204,26 @@ def get_endpoints():
         'description': 'Available toxicity prediction endpoints'
     })
 
+def parse_endpoints_param(value):
+    """
+    Read the optional 'endpoints' request field
+    
+    Accepts a list of endpoint names or a comma-separated string.
+    
+    Returns:
+        Requested endpoints in predictor order, or None for all endpoints
+    
+    Raises:
+        ValueError: For a malformed value or unknown endpoint names
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',') if name.strip()]
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise ValueError("endpoints must be a list of endpoint names or a comma-separated string")
+    return predictor.resolve_endpoints(value)
+
 @app.route('/api/predict', methods=['POST'])
 def predict_single():
     """Predict toxicity for a single molecule with AI analysis"""
@@ -161,11 +239,16 @@ def predict_single():
         if not smiles:
             return jsonify({'error': 'Empty SMILES string'}), 400
         
+        try:
+            endpoints = parse_endpoints_param(data.get('endpoints'))
+        except ValueError as e:
+            return jsonify({'error': str(e), 'available_endpoints': predictor.endpoints}), 400
+        
         # Get prediction with caching enabled
         if predictor_cached:
-            result = predictor_cached.predict_single(smiles)
+            result = predictor_cached.predict_single(smiles, endpoints=endpoints)
         else:
-            result = predictor.predict_single(smiles)
+            result = predictor.predict_single(smiles, endpoints=endpoints)
         
         if 'error' in result:
             return jsonify({'error': result['error']}), 500
@@ -195,7 +278,14 @@ def predict_single():
         ai_analysis = None
         if groq_client:
             try:
-                ai_analysis = groq_client.analyze_molecule(smiles, result['endpoints'])
+                if predictor_cached:
+                    # Concurrent requests for the same molecule share one analysis
+                    ai_analysis = predictor_cached.deduplicate(
+                        smiles, ('ai_analysis', tuple(result['endpoints'])),
+                        lambda: groq_client.analyze_molecule(smiles, result['endpoints'])
+                    )
+                else:
+                    ai_analysis = groq_client.analyze_molecule(smiles, result['endpoints'])
                 formatted_result['ai_analysis'] = ai_analysis
             except Exception as e:
                 print(f"⚠️ AI analysis failed: {e}")
@@ -229,6 +319,58 @@ def predict_single():
         traceback.print_exc()
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
+def format_batch_result(result):
+    """Format one batch prediction result for the API response"""
+    if 'error' in result:
+        return {
+            'smiles': result.get('smiles', 'unknown'),
+            'error': result['error']
+        }
+    return {
+        'smiles': result['smiles'],
+        'timestamp': result['timestamp'],
+        'predictions': result['endpoints'],
+        'overall_toxicity': result['summary']['overall_assessment'],
+        'confidence': result['summary']['recommendation'],
+        'toxic_endpoints': result['summary']['toxic_endpoints'],
+        'average_probability': result['summary']['average_toxicity_probability']
+    }
+
+# Molecules predicted per step when streaming a batch as NDJSON: small
+# first chunks for an early first result, then larger ones for throughput
+STREAM_FIRST_CHUNK = 4
+STREAM_MAX_CHUNK = 64
+
+def wants_ndjson():
+    """Whether the client asked for a streamed application/x-ndjson response"""
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def stream_batch_results(smiles_list, predict_chunk):
+    """
+    Stream batch results as NDJSON, one line per molecule
+    
+    Molecules are predicted in chunks (doubling from STREAM_FIRST_CHUNK
+    up to STREAM_MAX_CHUNK) and each chunk's lines are sent as soon as it
+    finishes, so the client sees the first results early and the full
+    response is never held in memory.
+    """
+    def generate():
+        start, chunk_size = 0, STREAM_FIRST_CHUNK
+        while start < len(smiles_list):
+            chunk = smiles_list[start:start + chunk_size]
+            try:
+                results = predict_chunk(chunk)
+            except Exception as e:
+                print(f"❌ Batch prediction error: {e}")
+                results = [{'smiles': smiles, 'error': f'Batch prediction failed: {str(e)}'} for smiles in chunk]
+            for offset, result in enumerate(results):
+                yield json.dumps(dict(format_batch_result(result), index=start + offset)) + '\n'
+            start += len(chunk)
+            chunk_size = min(chunk_size * 2, STREAM_MAX_CHUNK)
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
 @app.route('/api/predict/batch', methods=['POST'])
 def predict_batch():
     """Predict toxicity for multiple molecules"""
@@ -245,29 +387,26 @@ def predict_batch():
             return jsonify({'error': 'SMILES list must be an array'}), 400
         
         if len(smiles_list) > 100:
-            return jsonify({'error': 'Maximum 100 molecules per batch'}), 400
+            return jsonify({'error': 'Maximum 100 molecules per batch (use /api/jobs for larger batches)'}), 400
+        
+        try:
+            endpoints = parse_endpoints_param(data.get('endpoints'))
+        except ValueError as e:
+            return jsonify({'error': str(e), 'available_endpoints': predictor.endpoints}), 400
+        
+        def predict_chunk(chunk):
+            if predictor_cached:
+                return predictor_cached.predict_batch(chunk, endpoints=endpoints)
+            return predictor.predict_batch(chunk, endpoints=endpoints)
+        
+        if wants_ndjson():
+            return stream_batch_results(smiles_list, predict_chunk)
         
         # Get predictions
-        results = predictor.predict_batch(smiles_list)
+        results = predict_chunk(smiles_list)
         
         # Format results
-        formatted_results = []
-        for result in results:
-            if 'error' not in result:
-                formatted_results.append({
-                    'smiles': result['smiles'],
-                    'timestamp': result['timestamp'],
-                    'predictions': result['endpoints'],
-                    'overall_toxicity': result['summary']['overall_assessment'],
-                    'confidence': result['summary']['recommendation'],
-                    'toxic_endpoints': result['summary']['toxic_endpoints'],
-                    'average_probability': result['summary']['average_toxicity_probability']
-                })
-            else:
-                formatted_results.append({
-                    'smiles': result.get('smiles', 'unknown'),
-                    'error': result['error']
-                })
+        formatted_results = [format_batch_result(result) for result in results]
         
         return jsonify({
             'results': formatted_results,
@@ -280,6 +419,112 @@ def predict_batch():
         traceback.print_exc()
         return jsonify({'error': f'Batch prediction failed: {str(e)}'}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def create_batch_job():
+    """Queue an asynchronous batch prediction job"""
+    try:
+        if not predictor or not predictor.is_loaded:
+            return jsonify({'error': 'Predictor not initialized'}), 500
+        if not job_runner:
+            return jsonify({'error': 'Batch jobs not available'}), 503
+        
+        data = request.get_json()
+        if not data or 'smiles_list' not in data:
+            return jsonify({'error': 'SMILES list required'}), 400
+        
+        smiles_list = data['smiles_list']
+        if not isinstance(smiles_list, list) or not all(isinstance(s, str) for s in smiles_list):
+            return jsonify({'error': 'SMILES list must be an array of strings'}), 400
+        if not smiles_list:
+            return jsonify({'error': 'SMILES list is empty'}), 400
+        
+        max_molecules = int(os.getenv('JOB_MAX_MOLECULES', '500000'))
+        if len(smiles_list) > max_molecules:
+            return jsonify({'error': f'Maximum {max_molecules} molecules per job'}), 400
+        
+        try:
+            endpoints = parse_endpoints_param(data.get('endpoints'))
+        except ValueError as e:
+            return jsonify({'error': str(e), 'available_endpoints': predictor.endpoints}), 400
+        
+        job_id = job_runner.submit(smiles_list, {'endpoints': endpoints})
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'total': len(smiles_list),
+            'status_url': f'/api/jobs/{job_id}',
+            'results_url': f'/api/jobs/{job_id}/results'
+        }), 202
+        
+    except Exception as e:
+        print(f"❌ Job submission error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': f'Job submission failed: {str(e)}'}), 500
+
+def job_results_page(job_id):
+    """One page of a job's results (offset/limit query parameters, in input order)"""
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    results = job_runner.store.get_results(job_id, offset, limit)
+    return {
+        'offset': offset,
+        'limit': limit,
+        'results': [dict(format_batch_result(result), index=result['index']) for result in results],
+        'next_offset': results[-1]['index'] + 1 if len(results) == limit else None
+    }
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_batch_job(job_id):
+    """Job status, progress and a page of the results finished so far"""
+    try:
+        if not job_runner:
+            return jsonify({'error': 'Batch jobs not available'}), 503
+        job = job_runner.store.get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        job.update(job_results_page(job_id))
+        return jsonify(dict(job, success=True))
+        
+    except Exception as e:
+        print(f"❌ Error getting job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+def get_batch_job_results(job_id):
+    """Page through a job's results"""
+    try:
+        if not job_runner:
+            return jsonify({'error': 'Batch jobs not available'}), 503
+        job = job_runner.store.get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        page = job_results_page(job_id)
+        page.update({'success': True, 'job_id': job_id, 'status': job['status'], 'processed': job['processed']})
+        return jsonify(page)
+        
+    except Exception as e:
+        print(f"❌ Error getting results of job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_batch_job(job_id):
+    """Cancel a queued or running job (results finished so far are kept)"""
+    try:
+        if not job_runner:
+            return jsonify({'error': 'Batch jobs not available'}), 503
+        if job_runner.store.get_job(job_id) is None:
+            return jsonify({'error': 'Job not found'}), 404
+        if not job_runner.store.cancel_job(job_id):
+            return jsonify({'error': 'Job already finished'}), 409
+        return jsonify({'success': True, 'job_id': job_id, 'status': 'cancelled'})
+        
+    except Exception as e:
+        print(f"❌ Error cancelling job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/analyze-image-vision', methods=['POST'])
 def analyze_image_vision():
     """AI-powered vision analysis using Groq Vision + OCR fallback"""
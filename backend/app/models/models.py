@@ -33,6 +33,11 @@ except ImportError:
     RDKIT_AVAILABLE = False
     logging.warning("RDKit not available - using mock predictions")
 
+try:
+    from models.model_store import load_model_file, store_path_for
+except ImportError:
+    load_model_file = None
+
 class ModelManager:
     """Manages DrugTox-AI model loading and predictions"""
     
@@ -59,11 +64,16 @@ class ModelManager:
             model_loaded = False
             
             for model_name, path in [("optimized", optimized_path), ("baseline", baseline_path)]:
-                if path.exists():
+                has_store = load_model_file is not None and os.path.exists(store_path_for(str(path)))
+                if path.exists() or has_store:
                     try:
                         self.logger.info(f"Loading {model_name} models from {path}")
-                        with open(path, 'rb') as f:
-                            self.models = pickle.load(f)
+                        if load_model_file is not None:
+                            # Memory-mapped store when converted, pickle otherwise
+                            self.models = load_model_file(str(path))
+                        else:
+                            with open(path, 'rb') as f:
+                                self.models = pickle.load(f)
                         
                         self.endpoints = list(self.models.keys())
                         self.model_metadata['type'] = model_name
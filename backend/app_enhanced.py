@@ -9,7 +9,7 @@ New Features:
 - API rate limiting
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
 import sys
@@ -26,7 +26,11 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
 from utils.rate_limiter import rate_limit, get_rate_limit_info, rate_limiter
 
 # Import caching system
-from utils.cache import PredictionCache, CachedPredictionWrapper, prediction_cache
+from utils.cache import PredictionCache, CachedPredictionWrapper, prediction_cache, negative_cache
+from utils.batcher import prediction_batcher_from_env
+from utils.shared_cache import shared_cache_from_env
+from utils.cache_snapshot import cache_snapshotter_from_env
+from utils.jobs import job_runner_from_env
 
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:3000", "http://localhost:3001", "http://localhost:3002"])
@@ -36,20 +40,30 @@ predictor = None
 predictor_cached = None
 db_service = None
 groq_client = None
+job_runner = None
+cache_snapshotter = None
 cache = prediction_cache
 
 def initialize_services():
     """Initialize all services with enhanced predictor"""
-    global predictor, predictor_cached, db_service, groq_client, cache
+    global predictor, predictor_cached, db_service, groq_client, cache, job_runner, cache_snapshotter
     
     # Try to use enhanced predictor with RDKit
     try:
         from models.rdkit_predictor import EnhancedDrugToxPredictor
         predictor = EnhancedDrugToxPredictor(use_rdkit=True)
         if predictor.is_loaded:
-            predictor_cached = CachedPredictionWrapper(predictor, cache)
+            predictor_cached = CachedPredictionWrapper(
+                predictor, cache, batcher=prediction_batcher_from_env(predictor),
+                shared_cache=shared_cache_from_env(), negative_cache=negative_cache
+            )
             print("✅ Enhanced DrugTox predictor initialized (RDKit enabled)")
-            print(f"✅ Prediction caching enabled (TTL: 1 hour, Max size: 10000)")
+            print(f"✅ Prediction caching enabled (TTL: {cache.ttl}s, Max size: {cache.max_size}, Admission: {cache.admission})")
+            print(f"✅ Negative cache for invalid SMILES (TTL: {negative_cache.ttl}s, Max size: {negative_cache.max_size})")
+            if predictor_cached.shared_cache:
+                print(f"✅ Shared L2 prediction cache: {predictor_cached.shared_cache.path}")
+            if predictor_cached.batcher:
+                print(f"✅ Micro-batching enabled (window: {predictor_cached.batcher.window * 1000:g} ms)")
             print(f"✅ {len(predictor.endpoints)} toxicity endpoints available")
         else:
             print("❌ Enhanced predictor failed to load")
@@ -61,7 +75,10 @@ def initialize_services():
             from models.simple_predictor import SimpleDrugToxPredictor
             predictor = SimpleDrugToxPredictor()
             if predictor.is_loaded:
-                predictor_cached = CachedPredictionWrapper(predictor, cache)
+                predictor_cached = CachedPredictionWrapper(
+                    predictor, cache, batcher=prediction_batcher_from_env(predictor),
+                    shared_cache=shared_cache_from_env(), negative_cache=negative_cache
+                )
                 print("✅ Simple DrugTox predictor initialized")
             else:
                 print("❌ Simple predictor failed to load")
@@ -70,6 +87,28 @@ def initialize_services():
             print(f"❌ Error initializing simple predictor: {e2}")
             return False
     
+    # Warm the prediction cache from the last snapshot (worker recycles and
+    # deploys would otherwise start with an empty cache)
+    try:
+        cache_snapshotter = cache_snapshotter_from_env(cache)
+        if cache_snapshotter:
+            loaded = cache_snapshotter.start()
+            print(f"✅ Prediction cache snapshots: {cache_snapshotter.path} ({loaded} entries restored)")
+    except Exception as e:
+        print(f"⚠️ Prediction cache snapshots disabled: {e}")
+        cache_snapshotter = None
+    
+    # Initialize background batch job runner
+    try:
+        job_runner = job_runner_from_env(lambda smiles_list, options: predictor.predict_batch(
+            smiles_list, validate=options.get('validate', True), endpoints=options.get('endpoints')
+        ))
+        job_runner.start()
+        print(f"✅ Batch job runner started ({job_runner.workers} worker(s), store: {job_runner.store.path})")
+    except Exception as e:
+        print(f"⚠️ Batch job runner disabled: {e}")
+        job_runner = None
+    
     # Initialize Supabase database service
     try:
         from config.supabase import supabase_config
@@ -109,6 +148,7 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'predictor_loaded': predictor is not None and predictor.is_loaded,
+        'models': predictor.get_model_status() if predictor is not None and predictor.is_loaded else None,
         'rdkit_enabled': has_rdkit,
         'cache_enabled': True,
         'cache_stats': cache.get_stats() if cache else None,
@@ -176,8 +216,20 @@ def validate_smiles():
         
         # Check if predictor has validation method
         if hasattr(predictor, 'validate_smiles'):
-            is_valid, canonical_smiles, error_msg = predictor.validate_smiles(smiles)
-            
+            # Known-invalid SMILES are answered from the negative cache
+            cached_error = predictor_cached.negative_cache.get(smiles) if predictor_cached else None
+            if cached_error is not None:
+                is_valid, canonical_smiles, error_msg = False, None, cached_error['error']
+            else:
+                is_valid, canonical_smiles, error_msg = predictor.validate_smiles(smiles)
+                if not is_valid and predictor_cached:
+                    predictor_cached.negative_cache.set(smiles, {
+                        'error': error_msg,
+                        'invalid_smiles': True,
+                        'original_smiles': smiles,
+                        'timestamp': datetime.now().isoformat()
+                    })
+
             return jsonify({
                 'success': is_valid,
                 'original_smiles': smiles,
@@ -209,10 +261,49 @@ def validate_smiles():
         return jsonify({'error': f'Validation failed: {str(e)}'}), 500
 
 
+@app.route('/api/features/timing', methods=['GET'])
+@rate_limit(tier='default', cost=1)
+def feature_timing():
+    """Get per-descriptor RDKit featurization timing"""
+    try:
+        plan = getattr(predictor, 'descriptor_plan', None)
+        if plan is None:
+            return jsonify({'error': 'RDKit descriptors not enabled'}), 404
+        
+        return jsonify({
+            'success': True,
+            'descriptor_timing': plan.get_timing_report(),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        print(f"❌ Error getting feature timing: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 # ============================================================================
 # PREDICTION ENDPOINTS
 # ============================================================================
 
+def parse_endpoints_param(value):
+    """
+    Read the optional 'endpoints' request field
+    
+    Accepts a list of endpoint names or a comma-separated string.
+    
+    Returns:
+        Requested endpoints in predictor order, or None for all endpoints
+    
+    Raises:
+        ValueError: For a malformed value or unknown endpoint names
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',') if name.strip()]
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise ValueError("endpoints must be a list of endpoint names or a comma-separated string")
+    return predictor.resolve_endpoints(value)
+
 @app.route('/api/predict', methods=['POST'])
 @rate_limit(tier='prediction', cost=1)
 def predict_single():
@@ -231,15 +322,21 @@ def predict_single():
         if not smiles:
             return jsonify({'error': 'Empty SMILES string'}), 400
         
-        # Get prediction with caching and validation
-        if predictor_cached:
-            result = predictor_cached.predict_single(smiles)
+        try:
+            endpoints = parse_endpoints_param(data.get('endpoints'))
+        except ValueError as e:
+            return jsonify({'error': str(e), 'available_endpoints': predictor.endpoints}), 400
+        
+        # Get prediction with caching and validation (cache keys are
+        # canonical SMILES, so unvalidated requests bypass the cache)
+        if predictor_cached and validate:
+            result = predictor_cached.predict_single(smiles, endpoints=endpoints)
         else:
             # Use validation if available
             if hasattr(predictor, 'predict_single'):
-                result = predictor.predict_single(smiles, validate=validate)
+                result = predictor.predict_single(smiles, validate=validate, endpoints=endpoints)
             else:
-                result = predictor.predict_single(smiles)
+                result = predictor.predict_single(smiles, endpoints=endpoints)
         
         if 'error' in result:
             return jsonify({'error': result['error']}), 400
@@ -275,7 +372,14 @@ def predict_single():
         # Generate AI analysis if Groq is available
         if groq_client:
             try:
-                ai_analysis = groq_client.analyze_molecule(smiles, result['endpoints'])
+                if predictor_cached:
+                    # Concurrent requests for the same molecule share one analysis
+                    ai_analysis = predictor_cached.deduplicate(
+                        smiles, ('ai_analysis', validate, tuple(result['endpoints'])),
+                        lambda: groq_client.analyze_molecule(smiles, result['endpoints'])
+                    )
+                else:
+                    ai_analysis = groq_client.analyze_molecule(smiles, result['endpoints'])
                 formatted_result['ai_analysis'] = ai_analysis
             except Exception as e:
                 print(f"⚠️ AI analysis failed: {e}")
@@ -314,6 +418,65 @@ def predict_single():
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
 
+def format_batch_result(result):
+    """Format one batch prediction result for the API response"""
+    if 'error' in result:
+        return {
+            'smiles': result.get('smiles', result.get('original_smiles', 'unknown')),
+            'error': result['error']
+        }
+    return {
+        'smiles': result['smiles'],
+        'canonical_smiles': result.get('canonical_smiles'),
+        'validated': result.get('validated', False),
+        'timestamp': result['timestamp'],
+        'predictions': result['endpoints'],
+        'overall_toxicity': result['summary']['overall_assessment'],
+        'confidence': result['summary']['recommendation'],
+        'toxic_endpoints': result['summary']['toxic_endpoints'],
+        'average_probability': result['summary']['average_toxicity_probability'],
+        'risk_category': result['summary'].get('risk_category', 'Unknown')
+    }
+
+
+# Molecules predicted per step when streaming a batch as NDJSON: small
+# first chunks for an early first result, then larger ones for throughput
+STREAM_FIRST_CHUNK = 4
+STREAM_MAX_CHUNK = 64
+
+
+def wants_ndjson():
+    """Whether the client asked for a streamed application/x-ndjson response"""
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+
+def stream_batch_results(smiles_list, predict_chunk):
+    """
+    Stream batch results as NDJSON, one line per molecule
+    
+    Molecules are predicted in chunks (doubling from STREAM_FIRST_CHUNK
+    up to STREAM_MAX_CHUNK) and each chunk's lines are sent as soon as it
+    finishes, so the client sees the first results early and the full
+    response is never held in memory.
+    """
+    def generate():
+        start, chunk_size = 0, STREAM_FIRST_CHUNK
+        while start < len(smiles_list):
+            chunk = smiles_list[start:start + chunk_size]
+            try:
+                results = predict_chunk(chunk)
+            except Exception as e:
+                print(f"❌ Batch prediction error: {e}")
+                results = [{'smiles': smiles, 'error': f'Batch prediction failed: {str(e)}'} for smiles in chunk]
+            for offset, result in enumerate(results):
+                yield json.dumps(dict(format_batch_result(result), index=start + offset)) + '\n'
+            start += len(chunk)
+            chunk_size = min(chunk_size * 2, STREAM_MAX_CHUNK)
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
 @app.route('/api/predict/batch', methods=['POST'])
 @rate_limit(tier='batch', cost=1)
 def predict_batch():
@@ -331,37 +494,31 @@ def predict_batch():
             return jsonify({'error': 'SMILES list must be an array'}), 400
         
         if len(smiles_list) > 100:
-            return jsonify({'error': 'Maximum 100 molecules per batch'}), 400
+            return jsonify({'error': 'Maximum 100 molecules per batch (use /api/jobs for larger batches)'}), 400
         
         validate = data.get('validate', True)
         
+        try:
+            endpoints = parse_endpoints_param(data.get('endpoints'))
+        except ValueError as e:
+            return jsonify({'error': str(e), 'available_endpoints': predictor.endpoints}), 400
+        
+        def predict_chunk(chunk):
+            # Cached results are always validated ones
+            if predictor_cached and validate:
+                return predictor_cached.predict_batch(chunk, endpoints=endpoints)
+            elif hasattr(predictor, 'predict_batch'):
+                return predictor.predict_batch(chunk, validate=validate, endpoints=endpoints)
+            return predictor.predict_batch(chunk, endpoints=endpoints)
+        
+        if wants_ndjson():
+            return stream_batch_results(smiles_list, predict_chunk)
+        
         # Get predictions
-        if hasattr(predictor, 'predict_batch'):
-            results = predictor.predict_batch(smiles_list, validate=validate)
-        else:
-            results = predictor.predict_batch(smiles_list)
+        results = predict_chunk(smiles_list)
         
         # Format results
-        formatted_results = []
-        for result in results:
-            if 'error' not in result:
-                formatted_results.append({
-                    'smiles': result['smiles'],
-                    'canonical_smiles': result.get('canonical_smiles'),
-                    'validated': result.get('validated', False),
-                    'timestamp': result['timestamp'],
-                    'predictions': result['endpoints'],
-                    'overall_toxicity': result['summary']['overall_assessment'],
-                    'confidence': result['summary']['recommendation'],
-                    'toxic_endpoints': result['summary']['toxic_endpoints'],
-                    'average_probability': result['summary']['average_toxicity_probability'],
-                    'risk_category': result['summary'].get('risk_category', 'Unknown')
-                })
-            else:
-                formatted_results.append({
-                    'smiles': result.get('smiles', 'unknown'),
-                    'error': result['error']
-                })
+        formatted_results = [format_batch_result(result) for result in results]
         
         return jsonify({
             'results': formatted_results,
@@ -375,6 +532,125 @@ def predict_batch():
         return jsonify({'error': f'Batch prediction failed: {str(e)}'}), 500
 
 
+# ============================================================================
+# BATCH JOB ENDPOINTS
+# ============================================================================
+
+@app.route('/api/jobs', methods=['POST'])
+@rate_limit(tier='batch', cost=1)
+def create_batch_job():
+    """Queue an asynchronous batch prediction job"""
+    try:
+        if not predictor or not predictor.is_loaded:
+            return jsonify({'error': 'Predictor not initialized'}), 500
+        if not job_runner:
+            return jsonify({'error': 'Batch jobs not available'}), 503
+        
+        data = request.get_json()
+        if not data or 'smiles_list' not in data:
+            return jsonify({'error': 'SMILES list required'}), 400
+        
+        smiles_list = data['smiles_list']
+        if not isinstance(smiles_list, list) or not all(isinstance(s, str) for s in smiles_list):
+            return jsonify({'error': 'SMILES list must be an array of strings'}), 400
+        if not smiles_list:
+            return jsonify({'error': 'SMILES list is empty'}), 400
+        
+        max_molecules = int(os.getenv('JOB_MAX_MOLECULES', '500000'))
+        if len(smiles_list) > max_molecules:
+            return jsonify({'error': f'Maximum {max_molecules} molecules per job'}), 400
+        
+        try:
+            endpoints = parse_endpoints_param(data.get('endpoints'))
+        except ValueError as e:
+            return jsonify({'error': str(e), 'available_endpoints': predictor.endpoints}), 400
+        
+        job_id = job_runner.submit(smiles_list, {'endpoints': endpoints, 'validate': bool(data.get('validate', True))})
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'total': len(smiles_list),
+            'status_url': f'/api/jobs/{job_id}',
+            'results_url': f'/api/jobs/{job_id}/results'
+        }), 202
+        
+    except Exception as e:
+        print(f"❌ Job submission error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': f'Job submission failed: {str(e)}'}), 500
+
+
+def job_results_page(job_id):
+    """One page of a job's results (offset/limit query parameters, in input order)"""
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    results = job_runner.store.get_results(job_id, offset, limit)
+    return {
+        'offset': offset,
+        'limit': limit,
+        'results': [dict(format_batch_result(result), index=result['index']) for result in results],
+        'next_offset': results[-1]['index'] + 1 if len(results) == limit else None
+    }
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@rate_limit(tier='default', cost=1)
+def get_batch_job(job_id):
+    """Job status, progress and a page of the results finished so far"""
+    try:
+        if not job_runner:
+            return jsonify({'error': 'Batch jobs not available'}), 503
+        job = job_runner.store.get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        job.update(job_results_page(job_id))
+        return jsonify(dict(job, success=True))
+        
+    except Exception as e:
+        print(f"❌ Error getting job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+@rate_limit(tier='default', cost=1)
+def get_batch_job_results(job_id):
+    """Page through a job's results"""
+    try:
+        if not job_runner:
+            return jsonify({'error': 'Batch jobs not available'}), 503
+        job = job_runner.store.get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        page = job_results_page(job_id)
+        page.update({'success': True, 'job_id': job_id, 'status': job['status'], 'processed': job['processed']})
+        return jsonify(page)
+        
+    except Exception as e:
+        print(f"❌ Error getting results of job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+@rate_limit(tier='default', cost=1)
+def cancel_batch_job(job_id):
+    """Cancel a queued or running job (results finished so far are kept)"""
+    try:
+        if not job_runner:
+            return jsonify({'error': 'Batch jobs not available'}), 503
+        if job_runner.store.get_job(job_id) is None:
+            return jsonify({'error': 'Job not found'}), 404
+        if not job_runner.store.cancel_job(job_id):
+            return jsonify({'error': 'Job already finished'}), 409
+        return jsonify({'success': True, 'job_id': job_id, 'status': 'cancelled'})
+        
+    except Exception as e:
+        print(f"❌ Error cancelling job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 # ============================================================================
 # CACHE MANAGEMENT ENDPOINTS
 # ============================================================================
@@ -384,8 +660,12 @@ def predict_batch():
 def get_cache_stats():
     """Get prediction cache statistics"""
     try:
-        stats = cache.get_stats()
+        stats = predictor_cached.get_cache_stats() if predictor_cached else cache.get_stats()
         stats['cache_size_mb'] = cache.get_cache_size_mb()
+        if predictor_cached:
+            stats['singleflight'] = predictor_cached.flights.get_stats()
+        if cache_snapshotter:
+            stats['snapshot'] = cache_snapshotter.get_stats()
         return jsonify({
             'success': True,
             'cache_stats': stats
@@ -395,12 +675,31 @@ def get_cache_stats():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/batching/stats', methods=['GET'])
+@rate_limit(tier='default', cost=1)
+def get_batching_stats():
+    """Get micro-batching statistics (batch sizes and queueing delay)"""
+    try:
+        batcher = predictor_cached.batcher if predictor_cached else None
+        return jsonify({
+            'success': True,
+            'enabled': batcher is not None,
+            'batching_stats': batcher.get_stats() if batcher else None
+        })
+    except Exception as e:
+        print(f"❌ Error getting batching stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/cache/clear', methods=['POST'])
 @rate_limit(tier='default', cost=5)  # Higher cost for cache clearing
 def clear_cache():
-    """Clear prediction cache"""
+    """Clear prediction cache (in every worker when the shared cache is enabled)"""
     try:
-        cache.clear()
+        if predictor_cached:
+            predictor_cached.clear_cache()
+        else:
+            cache.clear()
         return jsonify({
             'success': True,
             'message': 'Cache cleared successfully'
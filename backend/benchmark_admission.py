@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Prediction Cache Admission Benchmark
+====================================
+Replays a mixed interactive and batch trace through PredictionCache and
+compares the hit rate of the admission policies (see CACHE_ADMISSION).
+
+The trace interleaves:
+    interactive  lookups of a fixed set of molecules with Zipf-distributed
+                 popularity (a few common drugs are requested constantly)
+    batch        runs of molecules that are requested once (screening
+                 uploads), which flush an LRU cache of the popular ones
+
+Every request is a lookup followed, on a miss, by a set, as
+CachedPredictionWrapper does.
+
+Usage:
+    python benchmark_admission.py
+    python benchmark_admission.py --sizes 1000 5000 --batch-share 0.8 --batch-run 20000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+
+from utils.cache import PredictionCache, ADMISSION_POLICIES
+
+RESULT = {
+    'timestamp': '2025-01-01T00:00:00',
+    'endpoints': {'NR-AR': {'probability': 0.25, 'prediction': 'Non-toxic', 'confidence': 'Medium'}}
+}
+
+
+def make_trace(requests, hot, zipf, batch_share, batch_run, seed=0):
+    """
+    Request trace as (smiles, is_batch) pairs: spans of interactive
+    lookups alternating with batch runs of batch_run new molecules, so
+    that batch_share of all requests are batch ones
+    """
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, hot + 1) ** zipf
+    popularity /= popularity.sum()
+    span = max(1, round(batch_run * (1 - batch_share) / batch_share)) if batch_share > 0 else requests
+    
+    trace = []
+    batch_molecules = 0
+    while len(trace) < requests:
+        trace.extend((f"I{i}", False) for i in rng.choice(hot, size=span, p=popularity))
+        if batch_share > 0:
+            trace.extend((f"B{batch_molecules + i}", True) for i in range(batch_run))
+            batch_molecules += batch_run
+    return trace[:requests]
+
+
+def replay(trace, size, admission):
+    """Hit rates (all, interactive, batch) and microseconds per request"""
+    cache = PredictionCache(ttl_seconds=10 ** 9, max_size=size, admission=admission)
+    hits = {False: 0, True: 0}
+    requests = {False: 0, True: 0}
+    start = time.perf_counter()
+    for smiles, is_batch in trace:
+        fields, _ = cache.lookup(smiles)
+        requests[is_batch] += 1
+        if fields is None:
+            cache.set(smiles, RESULT)
+        else:
+            hits[is_batch] += 1
+    elapsed = time.perf_counter() - start
+    
+    rate = lambda hit, total: hit / total if total else 0.0
+    return (rate(hits[False] + hits[True], len(trace)), rate(hits[False], requests[False]),
+            rate(hits[True], requests[True]), elapsed / len(trace) * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare PredictionCache admission policies on a mixed trace')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 1000, 2000, 5000],
+                        help='cache sizes (max_size) to replay the trace with')
+    parser.add_argument('--requests', type=int, default=300000,
+                        help='requests in the trace')
+    parser.add_argument('--hot', type=int, default=10000,
+                        help='distinct molecules requested interactively')
+    parser.add_argument('--zipf', type=float, default=0.9,
+                        help='Zipf exponent of interactive popularity')
+    parser.add_argument('--batch-share', type=float, default=0.5,
+                        help='fraction of requests that come from batch runs')
+    parser.add_argument('--batch-run', type=int, default=5000,
+                        help='one-off molecules per batch run')
+    args = parser.parse_args()
+    
+    logging.disable(logging.INFO)  # the cache logs every hit and set
+    trace = make_trace(args.requests, args.hot, args.zipf, args.batch_share, args.batch_run)
+    
+    print(f"{args.requests} requests: {args.hot} interactive molecules (zipf {args.zipf}), "
+          f"{args.batch_share:.0%} batch in runs of {args.batch_run}")
+    print(f"{'size':>7}  {'admission':<9} {'hit rate':>9} {'interactive':>12} {'batch':>7} {'us/request':>11}")
+    for size in args.sizes:
+        for admission in ADMISSION_POLICIES:
+            total, interactive, batch, latency = replay(trace, size, admission)
+            print(f"{size:>7}  {admission:<9} {total:>9.1%} {interactive:>12.1%} {batch:>7.1%} {latency:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
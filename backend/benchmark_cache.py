@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Prediction Cache Benchmark
+==========================
+Measures PredictionCache set/get latency at increasing cache sizes, to
+check that per-operation cost stays flat as max_size grows.
+
+For every size the cache is filled to capacity, then timed for:
+    set (evict)  inserting new molecules into the full cache (each evicts one)
+    get (hit)    looking up molecules that are cached
+    get (miss)   looking up molecules that are not cached
+
+--compact stores entries as float32 probability records (as the API does)
+instead of result dicts, and --memory reports the memory used per entry
+(measured with tracemalloc, which slows the fill down).
+
+Usage:
+    python benchmark_cache.py
+    python benchmark_cache.py --sizes 1000 10000 100000 1000000 --ops 20000
+    python benchmark_cache.py --compact --memory
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+
+from utils.cache import PredictionCache, CompactRecordCodec
+
+ENDPOINTS = ('NR-AR-LBD', 'NR-AhR', 'SR-MMP', 'NR-ER-LBD', 'NR-AR')
+
+
+def endpoint_prediction(endpoint, probability):
+    """Endpoint prediction dict like SimpleDrugToxPredictor's"""
+    return {'probability': probability, 'prediction': 'Non-toxic', 'confidence': 'Medium'}
+
+
+def make_result(smiles):
+    """A prediction result shaped like SimpleDrugToxPredictor's"""
+    return {
+        'smiles': smiles,
+        'timestamp': '2025-01-01T00:00:00',
+        'endpoints': {endpoint: endpoint_prediction(endpoint, 0.25) for endpoint in ENDPOINTS}
+    }
+
+
+def time_operations(operation, arguments):
+    """Per-call latencies in microseconds"""
+    clock = time.perf_counter
+    latencies = np.empty(len(arguments))
+    for i, argument in enumerate(arguments):
+        start = clock()
+        operation(argument)
+        latencies[i] = clock() - start
+    return latencies * 1e6
+
+
+def benchmark_size(size, ops, compact=False, memory=False):
+    """Fill a cache of max_size=size and time set/get on it"""
+    codec = CompactRecordCodec(ENDPOINTS, endpoint_prediction) if compact else None
+    cache = PredictionCache(ttl_seconds=3600, max_size=size, codec=codec)
+    if memory:
+        tracemalloc.start()
+    for i in range(size):
+        cache.set(f"C{i}", make_result(f"C{i}"))
+    if memory:
+        bytes_per_entry = tracemalloc.get_traced_memory()[0] / size
+        tracemalloc.stop()
+        print(f"{size:>9}  memory       {bytes_per_entry:>8.0f} bytes/entry")
+
+    new_results = [(f"N{i}", make_result(f"N{i}")) for i in range(ops)]
+    timings = {'set (evict)': time_operations(lambda item: cache.set(*item), new_results)}
+
+    # The cache now holds the last `size` molecules inserted
+    inserted = [f"C{i}" for i in range(size)] + [smiles for smiles, _ in new_results]
+    hits = random.choices(inserted[-size:], k=ops)
+    misses = [f"M{i}" for i in range(ops)]
+    timings['get (hit)'] = time_operations(cache.get, hits)
+    timings['get (miss)'] = time_operations(cache.get, misses)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PredictionCache set/get latency by cache size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='cache sizes (max_size) to benchmark')
+    parser.add_argument('--ops', type=int, default=20000,
+                        help='timed operations per measurement')
+    parser.add_argument('--compact', action='store_true',
+                        help='store float32 probability records instead of result dicts')
+    parser.add_argument('--memory', action='store_true',
+                        help='report memory per cached entry')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # the cache logs every hit and set
+    random.seed(0)
+
+    print(f"{'size':>9}  {'operation':<12} {'mean us':>8} {'p50 us':>8} {'p99 us':>8}")
+    for size in args.sizes:
+        for operation, latencies in benchmark_size(size, args.ops, args.compact, args.memory).items():
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"{size:>9}  {operation:<12} {latencies.mean():>8.2f} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
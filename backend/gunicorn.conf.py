@@ -59,6 +59,40 @@ def when_ready(server):
     """Called just after the server is started."""
     print("✅ Server is ready. Accepting connections")
 
+def post_worker_init(worker):
+    """Called in each worker after it loaded the app: initialize its services.
+
+    With preload_app the app module is imported once in the master, but
+    initialize_services() only runs under __main__. Running it here gives
+    every worker (including ones recycled by max_requests) its own
+    predictor, and its prediction cache is restored from the latest
+    snapshot rather than inherited from the master.
+
+    Each worker also starts its own cache snapshot thread and batch job
+    runner (JOB_WORKERS threads per worker). That is safe: workers replace
+    the shared snapshot file atomically (last writer wins) and claim jobs
+    from the shared job store in a transaction, so a job runs only once.
+
+    The app module is the one that created the Flask app (its import
+    name); serve wsgi:app, since app:app imports the app/ dashboard
+    package, which has no services to initialize.
+    """
+    import sys
+    import_name = getattr(worker.wsgi, 'import_name', '')
+    module = sys.modules.get(import_name)
+    initialize_services = getattr(module, 'initialize_services', None)
+    if initialize_services is None:
+        worker.log.error(f"Worker {worker.pid}: {import_name or worker.wsgi!r} has no initialize_services() "
+                         "(serve wsgi:app, not app:app)")
+        raise RuntimeError(f"No initialize_services() in app module {import_name!r}")
+    if not initialize_services():
+        print(f"❌ Worker {worker.pid}: failed to initialize services")
+
+def worker_exit(server, worker):
+    """Called in the worker process just after it exited (e.g. recycled by max_requests)."""
+    from utils.cache_snapshot import save_snapshots
+    save_snapshots()
+
 def on_exit(server):
     """Called just before exiting."""
     print("👋 Server shutting down")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Parallel Featurization Pool
+===========================
+RDKit descriptor calculation holds the GIL, so featurizing a large batch
+with threads runs on one core. FeaturizationPool keeps a persistent pool
+of worker processes, splits SMILES lists into chunks across them and has
+the workers write feature rows straight into a shared-memory NumPy block,
+so only the small per-molecule validation outcome is pickled back.
+
+The pool is opt-in (see FEATURIZATION_WORKERS in .env.example) and is
+used by EnhancedDrugToxPredictor.predict_batch and score_library.py.
+"""
+
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Per-process featurizer, created once by the pool initializer
+_worker_featurizer = None
+
+
+def _init_worker(featurizer_class, featurizer_kwargs):
+    """Create the featurizer used by every chunk this worker handles"""
+    global _worker_featurizer
+    _worker_featurizer = featurizer_class(**featurizer_kwargs)
+
+
+def _attach_shared_memory(name):
+    """Attach to an existing block without this process taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: the registration goes to the parent's resource
+        # tracker, which already tracks this block, so it is harmless
+        return shared_memory.SharedMemory(name=name)
+
+
+def _featurize_chunk(shm_name, shape, start, smiles_chunk, validate, feature_slots=None):
+    """
+    Featurize one chunk into rows start..start+len(chunk) of the shared block
+
+    Returns:
+        List of (smiles_used, error_message) per molecule in the chunk
+    """
+    shm = _attach_shared_memory(shm_name)
+    try:
+        features = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        outcomes = []
+        for offset, smiles in enumerate(smiles_chunk):
+            row, smiles_used, error_msg = _worker_featurizer.featurize(smiles, validate, feature_slots)
+            if row is not None:
+                features[start + offset] = row
+            outcomes.append((smiles_used, error_msg))
+        del features  # release the buffer before closing the block
+        return outcomes
+    finally:
+        shm.close()
+
+
+class FeaturizationPool:
+    """Persistent process pool that featurizes SMILES lists into shared memory"""
+
+    def __init__(self, featurizer_class, featurizer_kwargs=None, processes=None,
+                 chunk_size=64, n_features=50):
+        """
+        Initialize the pool
+
+        Args:
+            featurizer_class: Class with featurize(smiles, validate, feature_slots)
+                returning (features, smiles_used, error_message); one instance is built
+                in every worker process
+            featurizer_kwargs: Keyword arguments for featurizer_class
+            processes: Number of worker processes (default: CPU count)
+            chunk_size: Molecules per task sent to a worker
+            n_features: Width of each feature row
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.n_features = n_features
+        # spawn keeps workers independent of the parent's threads and locks
+        # (Flask runs threaded) and behaves the same on Windows
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(featurizer_class, featurizer_kwargs or {})
+        )
+        atexit.register(self.close)
+
+    def featurize(self, smiles_list, validate=True, feature_slots=None):
+        """
+        Featurize molecules across the worker processes
+
+        Args:
+            smiles_list: SMILES strings
+            validate: Validate and canonicalize each SMILES first
+            feature_slots: Optional feature indices to compute (others stay 0)
+
+        Returns:
+            (features, outcomes) where features is an (n, n_features)
+            matrix in input order (all-zero rows for molecules that failed
+            validation) and outcomes holds (smiles_used, error_message)
+        """
+        smiles_list = list(smiles_list)
+        shape = (len(smiles_list), self.n_features)
+        if not smiles_list:
+            return np.zeros(shape), []
+
+        shm = shared_memory.SharedMemory(create=True, size=shape[0] * shape[1] * 8)
+        try:
+            np.ndarray(shape, dtype=np.float64, buffer=shm.buf).fill(0.0)
+            futures = [
+                self._executor.submit(
+                    _featurize_chunk, shm.name, shape, start,
+                    smiles_list[start:start + self.chunk_size], validate, feature_slots
+                )
+                for start in range(0, len(smiles_list), self.chunk_size)
+            ]
+            outcomes = []
+            try:
+                for future in futures:
+                    outcomes.extend(future.result())
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+            features = np.ndarray(shape, dtype=np.float64, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return features, outcomes
+
+    def close(self):
+        """Shut down the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
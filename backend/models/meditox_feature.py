@@ -39,6 +39,14 @@ try:
 except ImportError:
     REQUESTS_AVAILABLE = False
 
+try:
+    from models.model_store import load_model_file, store_path_for
+except ImportError:
+    try:
+        from model_store import load_model_file, store_path_for
+    except ImportError:
+        load_model_file = None
+
 warnings.filterwarnings('ignore')
 
 class MedToXAi:
@@ -63,7 +71,10 @@ class MedToXAi:
     def load_models(self):
         """Load toxicity prediction models"""
         try:
-            if os.path.exists(self.models_path):
+            if load_model_file is not None and os.path.exists(store_path_for(self.models_path)):
+                self.models = load_model_file(self.models_path)
+                return True
+            elif os.path.exists(self.models_path):
                 with open(self.models_path, 'rb') as f:
                     self.models = pickle.load(f)
                 return True
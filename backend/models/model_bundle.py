@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Endpoint Model Bundle
+=====================
+Holds every endpoint model behind one predict_all(X) call that returns an
+(n, n_endpoints) probability matrix, with the endpoint (column) order
+fixed when the bundle is built.
+
+Endpoints whose models compile to a CompiledTreeEnsemble are merged into
+one node array, so all of their trees are walked in a single vectorized
+traversal. The remaining models are called once each on the whole matrix.
+The merged traversal wins for request-sized inputs; large batches go to
+the original models' native predict_proba, which is faster once there
+are a few hundred rows.
+
+Callers turn rows of the matrix into response dicts only when building
+the API response.
+"""
+
+import numpy as np
+
+try:
+    from models.tree_ensemble import CompiledTreeEnsemble, compile_model
+except ImportError:  # running this file directly from backend/models
+    from tree_ensemble import CompiledTreeEnsemble, compile_model
+
+# Largest input scored with the merged compiled trees; above this the
+# original models' predict_proba is faster
+COMPILED_MAX_ROWS = 128
+
+
+def resolve_feature_width(model):
+    """
+    Determine how many input features a model expects
+
+    Reads the width the estimator recorded at fit time (n_features_in_
+    or the XGBoost booster's feature count). Models that record neither
+    are probed once here with a zero row of each candidate width.
+
+    Returns:
+        Feature width, or None if no candidate width works
+    """
+    width = getattr(model, 'n_features_in_', None)
+    if width is None and hasattr(model, 'get_booster'):
+        width = model.get_booster().num_features()
+    if width is not None:
+        return int(width)
+
+    predict = model.predict_proba if hasattr(model, 'predict_proba') else model.predict
+    for n_features in [50, 100, 200, 1026]:
+        try:
+            predict(np.zeros((1, n_features)))
+            return n_features
+        except Exception:
+            continue
+    return None
+
+
+def adapt_features(features_matrix, width):
+    """Zero-pad or truncate a feature matrix to a model's input width"""
+    n_base = features_matrix.shape[1]
+    if width > n_base:
+        return np.pad(features_matrix, ((0, 0), (0, width - n_base)), 'constant')
+    if width < n_base:
+        return features_matrix[:, :width]
+    return features_matrix
+
+
+def _positive_proba(model, X):
+    """Positive-class probability from predict_proba (or predict for regressors)"""
+    if hasattr(model, 'predict_proba'):
+        pred_proba = model.predict_proba(X)
+        return pred_proba[:, 1] if pred_proba.shape[1] > 1 else pred_proba[:, 0]
+    return model.predict(X)
+
+
+def _merge_ensembles(ensembles):
+    """
+    Concatenate compiled ensembles into one node array
+
+    XGBoost's strict x < t splits are rewritten as x <= (largest float32
+    below t), so every tree of the merged ensemble uses scikit-learn's
+    comparison.
+    """
+    arrays = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'missing', 'value', 'roots')}
+    offset = 0
+    for ensemble in ensembles:
+        threshold = ensemble.threshold
+        if ensemble.strict_less:
+            threshold = np.nextafter(threshold, np.float32(-np.inf))
+        arrays['feature'].append(ensemble.feature)
+        arrays['threshold'].append(threshold)
+        for name in ('left', 'right', 'missing', 'roots'):
+            arrays[name].append(getattr(ensemble, name) + offset)
+        arrays['value'].append(ensemble.value)
+        offset += ensemble.n_nodes
+
+    merged = {name: np.concatenate(parts) for name, parts in arrays.items()}
+    return CompiledTreeEnsemble(
+        max_depth=max(e.max_depth for e in ensembles),
+        n_features=max(e.n_features for e in ensembles),
+        output='mean',
+        allow_missing=all(e.allow_missing for e in ensembles),
+        **merged
+    )
+
+
+class ModelBundle:
+    """All endpoint models behind a single (n, n_endpoints) prediction call"""
+
+    def __init__(self, endpoints, models, compile_models=True, compiled=None):
+        """
+        Build the bundle
+
+        Args:
+            endpoints: Endpoint names in output column order; endpoints
+                without a model are left out
+            models: Dict of endpoint -> fitted model
+            compile_models: Compile tree ensembles for grouped traversal
+            compiled: Optional dict of endpoint -> CompiledTreeEnsemble (or
+                None) already compiled for these models
+
+        Raises:
+            ValueError: If a model's input width cannot be determined
+        """
+        self.endpoints = [endpoint for endpoint in endpoints if endpoint in models]
+        self.models = [models[endpoint] for endpoint in self.endpoints]
+        self.column_index = {endpoint: i for i, endpoint in enumerate(self.endpoints)}
+        compiled = compiled or {}
+
+        self.widths = []
+        for endpoint, model in zip(self.endpoints, self.models):
+            width = resolve_feature_width(model)
+            if width is None:
+                raise ValueError(f"Could not determine input width for {endpoint} model")
+            self.widths.append(width)
+
+        compiled = [
+            compiled[endpoint] if endpoint in compiled
+            else compile_model(model, width) if compile_models else None
+            for endpoint, model, width in zip(self.endpoints, self.models, self.widths)
+        ]
+        self.compiled_columns = [i for i, c in enumerate(compiled) if c is not None]
+        self.model_columns = [i for i, c in enumerate(compiled) if c is None]
+
+        self._group = None
+        if self.compiled_columns:
+            members = [compiled[i] for i in self.compiled_columns]
+            self._group = _merge_ensembles(members)
+            # Trees of each endpoint are contiguous in the merged ensemble
+            n_trees = np.array([m.n_trees for m in members])
+            self._tree_starts = np.concatenate([[0], np.cumsum(n_trees)[:-1]])
+            self._n_trees = n_trees
+            self._is_mean = np.array([m.output == 'mean' for m in members])
+            self._base_margin = np.array([m.base_margin for m in members])
+            self._scale = np.array([m.scale for m in members])
+
+        # Feature columns the split nodes read; None when an uncompiled
+        # model may read any of them
+        self.used_features = None
+        if not self.model_columns:
+            used = np.array([], dtype=np.int32)
+            if self._group is not None:
+                used = np.unique(self._group.feature[self._group.threshold < np.inf])
+            self.used_features = used
+
+    @property
+    def n_endpoints(self):
+        return len(self.endpoints)
+
+    @property
+    def n_compiled(self):
+        return len(self.compiled_columns)
+
+    def feature_slots(self, n_features):
+        """
+        Feature columns (below n_features) that need computing for this bundle
+
+        Returns:
+            Sorted list of column indices, or None when every column is needed
+        """
+        if self.used_features is None:
+            return None
+        slots = [int(f) for f in self.used_features if f < n_features]
+        return None if len(slots) == n_features else slots
+
+    def predict_all(self, features_matrix, errors=None):
+        """
+        Toxicity probabilities for every endpoint
+
+        Args:
+            features_matrix: (n, n_features) feature matrix; it is padded or
+                truncated to each model's input width
+            errors: Optional dict that receives endpoint -> error message for
+                models that fail; their columns are NaN. Without it the
+                failure is raised.
+
+        Returns:
+            (n, n_endpoints) float64 array in self.endpoints column order
+        """
+        features_matrix = np.asarray(features_matrix, dtype=np.float64)
+        probabilities = np.full((len(features_matrix), self.n_endpoints), np.nan)
+        if len(features_matrix) == 0:
+            return probabilities
+
+        use_group = (
+            self._group is not None
+            and len(features_matrix) <= COMPILED_MAX_ROWS
+            # Let the original models report NaN inputs they cannot handle
+            and (self._group.allow_missing or not np.isnan(features_matrix).any())
+        )
+        fallback_columns = list(self.model_columns if use_group else range(self.n_endpoints))
+        if use_group:
+            try:
+                probabilities[:, self.compiled_columns] = self._predict_group(features_matrix)
+            except Exception as e:
+                print(f"⚠️ Grouped tree traversal failed ({e}), using the original models")
+                fallback_columns += self.compiled_columns
+
+        for column in sorted(fallback_columns):
+            model_input = adapt_features(features_matrix, self.widths[column])
+            try:
+                probabilities[:, column] = _positive_proba(self.models[column], model_input)
+            except Exception as e:
+                if errors is None:
+                    raise
+                print(f"⚠️ Prediction failed for {self.endpoints[column]}: {e}")
+                errors[self.endpoints[column]] = str(e)
+
+        return probabilities
+
+    def _predict_group(self, features_matrix):
+        """Probabilities for the compiled endpoints from one merged traversal"""
+        X = adapt_features(features_matrix, self._group.n_features)
+        sums = np.add.reduceat(self._group.leaf_values(X), self._tree_starts, axis=1)
+
+        mean = sums / self._n_trees
+        logistic = 1.0 / (1.0 + np.exp(-(self._base_margin + self._scale * sums)))
+        return np.where(self._is_mean, mean, logistic)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Lazy Endpoint Model Loader
+==========================
+Loads endpoint models one at a time, on first use or from a background
+warmup thread, so the server can answer /api/health while models are
+still loading. Each endpoint reports its own readiness.
+
+Models come from the converted model store when one exists (each endpoint
+is read on its own) or from the pickle (read once, on the first load).
+Endpoints missing from both can be served by placeholder models; those
+are trained once and persisted to a placeholder store next to the real
+models, so later restarts read them instead of training again.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+import weakref
+
+try:
+    from models.model_store import open_model_store, resolve_model_source, write_store
+    from models.tree_ensemble import compile_model
+except ImportError:  # running this file directly from backend/models
+    from model_store import open_model_store, resolve_model_source, write_store
+    from tree_ensemble import compile_model
+
+PLACEHOLDER_STORE_NAME = 'placeholder_models.store'
+
+# Loaders whose locks and warmup threads are reset in forked children
+_loaders = weakref.WeakSet()
+
+
+def _reset_loaders_after_fork():
+    for loader in list(_loaders):
+        loader._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_loaders_after_fork)
+
+
+class LazyModelLoader:
+    """Per-endpoint model loading with readiness tracking"""
+
+    def __init__(self, model_file, endpoints, placeholder_factory=None, placeholder_store=None,
+                 placeholder_spec=''):
+        """
+        Initialize the loader (nothing is read until a model is needed)
+
+        Args:
+            model_file: Model pickle path; its converted .store is preferred
+            endpoints: Endpoints to load, in order
+            placeholder_factory: Optional function(endpoint) returning a
+                {'model': ..., ...} entry for endpoints missing from the files
+            placeholder_store: Where trained placeholders are persisted
+                (default: placeholder_models.store next to model_file)
+            placeholder_spec: Identifies how placeholder_factory builds its
+                models (part of model_version; change it with the factory)
+        """
+        self.model_file = model_file
+        self.endpoints = list(endpoints)
+        self.placeholder_factory = placeholder_factory
+        self.placeholder_spec = placeholder_spec
+        self.placeholder_store = placeholder_store or os.path.join(
+            os.path.dirname(model_file), PLACEHOLDER_STORE_NAME
+        )
+
+        self.lock = threading.RLock()  # held while loading; shared with callers
+        self._entries = {}   # endpoint -> {'model': ..., metadata...}
+        self.compiled = {}   # endpoint -> CompiledTreeEnsemble or None
+        self.metadata = {}   # endpoint -> entry without the model (roc_auc, ...), once loaded
+        self._status = {endpoint: {'status': 'pending'} for endpoint in self.endpoints}
+        self._pickle_models = None
+        self._warmup_thread = None
+        self._warmup_state = 'not_started'
+        self._warmup_callback = None
+        _loaders.add(self)
+
+    @property
+    def has_source(self):
+        """Whether a model file (store or pickle) exists"""
+        return resolve_model_source(self.model_file)[0] is not None
+
+    @property
+    def model_version(self):
+        """
+        Short identifier of the models in use: name, size and mtime of the
+        model source (changes when it is replaced) and the placeholder spec
+        
+        The placeholder store is left out: warmup writes it lazily, after
+        the version has gone into cache keys, and its contents follow from
+        the spec anyway.
+        """
+        parts = []
+        path = resolve_model_source(self.model_file)[1]
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+        if self.placeholder_factory is not None:
+            parts.append(f"placeholders:{self.placeholder_spec}")
+        if not parts:
+            return 'none'
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:12]
+
+    @property
+    def is_ready(self):
+        """Whether every endpoint has been loaded (or failed or is missing)"""
+        return all(s['status'] not in ('pending', 'loading') for s in self._status.values())
+
+    def load(self, endpoint):
+        """
+        Load one endpoint model if it is not loaded yet
+
+        Returns:
+            The endpoint's entry dict, or None if it is missing or failed
+        """
+        if endpoint in self._entries:
+            return self._entries[endpoint]
+
+        with self.lock:
+            if self._status[endpoint]['status'] in ('ready', 'missing', 'failed'):
+                return self._entries.get(endpoint)
+
+            self._status[endpoint] = {'status': 'loading'}
+            start = time.perf_counter()
+            try:
+                entry, source = self._read_entry(endpoint)
+                if entry is None:
+                    self._status[endpoint] = {'status': 'missing'}
+                    return None
+                compiled = compile_model(entry['model'])
+                self.compiled[endpoint] = compiled
+                self.metadata[endpoint] = {k: v for k, v in entry.items() if k != 'model'}
+                self._entries[endpoint] = entry
+                self._status[endpoint] = {
+                    'status': 'ready',
+                    'source': source,
+                    'compiled': compiled is not None,
+                    'load_seconds': round(time.perf_counter() - start, 3)
+                }
+            except Exception as e:
+                print(f"❌ Error loading model for {endpoint}: {e}")
+                self._status[endpoint] = {'status': 'failed', 'error': str(e)}
+            return self._entries.get(endpoint)
+
+    def load_all(self, endpoints=None):
+        """
+        Load every endpoint (or only the given ones)
+
+        Returns:
+            Dict of endpoint -> entry for the loaded endpoints that are available
+        """
+        endpoints = self.endpoints if endpoints is None else endpoints
+        with self.lock:
+            for endpoint in endpoints:
+                self.load(endpoint)
+            return {endpoint: self._entries[endpoint] for endpoint in endpoints if endpoint in self._entries}
+
+    def get_errors(self, endpoints=None):
+        """Endpoint -> error message for models that failed to load"""
+        return {
+            endpoint: status['error']
+            for endpoint, status in self._status.items()
+            if status['status'] == 'failed' and (endpoints is None or endpoint in endpoints)
+        }
+
+    def _read_entry(self, endpoint):
+        """Read an endpoint entry from the store, the pickle or the placeholders"""
+        source, path = resolve_model_source(self.model_file)
+        if source == 'store':
+            store = open_model_store(path)
+            if endpoint in store.header['endpoints']:
+                return self._as_entry(store.get_entry(endpoint)), 'store'
+        elif source == 'pickle':
+            if self._pickle_models is None:
+                with open(path, 'rb') as f:
+                    self._pickle_models = pickle.load(f)
+            if endpoint in self._pickle_models:
+                return self._as_entry(self._pickle_models[endpoint]), 'pickle'
+
+        if self.placeholder_factory is None:
+            return None, None
+        return self._placeholder_entry(endpoint), 'placeholder'
+
+    def _as_entry(self, entry):
+        return entry if isinstance(entry, dict) and 'model' in entry else {'model': entry}
+
+    def _placeholder_entry(self, endpoint):
+        """Read a persisted placeholder, or train one and persist it"""
+        persisted = {}
+        if os.path.exists(self.placeholder_store):
+            try:
+                store = open_model_store(self.placeholder_store)
+                persisted = store.as_model_dict()
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable placeholder store {self.placeholder_store}: {e}")
+        if endpoint in persisted:
+            return persisted[endpoint]
+
+        print(f"⚠️ Creating placeholder model for {endpoint}")
+        entry = self.placeholder_factory(endpoint)
+        persisted[endpoint] = entry
+        try:
+            write_store(persisted, self.placeholder_store, source='placeholders', verbose=False)
+        except Exception as e:
+            print(f"⚠️ Could not persist placeholder models to {self.placeholder_store}: {e}")
+        return entry
+
+    def start_warmup(self, on_complete=None):
+        """
+        Load every endpoint in a background thread
+
+        Args:
+            on_complete: Optional function called in the thread once all
+                endpoints are loaded
+        """
+        with self.lock:
+            if self._warmup_thread is not None and self._warmup_thread.is_alive():
+                return
+            self._warmup_callback = on_complete
+            self._warmup_state = 'running'
+            self._warmup_thread = threading.Thread(target=self._warmup, name='model-warmup', daemon=True)
+            self._warmup_thread.start()
+
+    def _warmup(self):
+        start = time.perf_counter()
+        try:
+            for endpoint in self.endpoints:
+                self.load(endpoint)
+            if self._warmup_callback is not None:
+                self._warmup_callback()
+            self._warmup_state = 'done'
+            print(f"✅ Model warmup finished in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            self._warmup_state = 'failed'
+            print(f"❌ Model warmup failed: {e}")
+
+    def _after_fork(self):
+        """Forked children get a fresh lock and restart an unfinished warmup"""
+        self.lock = threading.RLock()
+        for endpoint, status in self._status.items():
+            if status['status'] == 'loading':
+                self._status[endpoint] = {'status': 'pending'}
+        if self._warmup_state == 'running':
+            self._warmup_thread = None
+            self.start_warmup(self._warmup_callback)
+
+    def get_status(self):
+        """Readiness of every endpoint plus the warmup state"""
+        statuses = {endpoint: dict(status) for endpoint, status in self._status.items()}
+        return {
+            'ready': self.is_ready,
+            'ready_endpoints': sum(1 for s in statuses.values() if s['status'] == 'ready'),
+            'total_endpoints': len(statuses),
+            'warmup': self._warmup_state,
+            'endpoints': statuses
+        }
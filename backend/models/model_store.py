@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Memory-Mapped Model Store
+=========================
+Read-only model artifact whose numeric arrays (tree nodes, thresholds,
+leaf values) live in one memory-mapped file instead of inside unpickled
+Python objects.
+
+Unpickled scikit-learn/XGBoost models are ordinary heap objects: every
+gunicorn worker either unpickles its own copy or, with preload_app, copies
+the pages the parent loaded as soon as reference counting touches them.
+Pages of a read-only mmap are never written, so every worker (and every
+predictor class inside a worker) shares one copy through the page cache.
+
+File layout:
+    8 bytes   magic b'TOXSTORE'
+    8 bytes   little-endian uint64 length of the JSON header
+    header    UTF-8 JSON: format version, source, and per endpoint the
+              compiled ensemble parameters, array offsets/dtypes/shapes
+              and the JSON-serializable model metadata (roc_auc, ...)
+    data      arrays, each starting on a 64-byte boundary
+
+Endpoints whose models cannot be compiled are stored as pickled blobs and
+unpickled on first use, so a converted store always serves every endpoint
+of the source file.
+
+Convert an existing pickle (writes best_optimized_models.store next to it):
+    python models/model_store.py models/best_optimized_models.pkl
+"""
+
+import argparse
+import json
+import os
+import pickle
+import struct
+import sys
+import threading
+from datetime import datetime
+
+import numpy as np
+
+try:
+    from models.tree_ensemble import CompiledTreeEnsemble, compile_model
+except ImportError:  # running this file directly from backend/models
+    from tree_ensemble import CompiledTreeEnsemble, compile_model
+
+MAGIC = b'TOXSTORE'
+FORMAT_VERSION = 1
+STORE_EXTENSION = '.store'
+ALIGNMENT = 64
+
+ENSEMBLE_ARRAYS = ('feature', 'threshold', 'left', 'right', 'missing', 'value', 'roots')
+ENSEMBLE_PARAMS = ('max_depth', 'n_features', 'output', 'base_margin', 'scale',
+                   'strict_less', 'allow_missing')
+
+# Process-wide registry: path -> (file signature, ModelStore), so all
+# predictors share one mapping until the file is replaced
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_path_for(pickle_path):
+    """Path of the converted store belonging to a model pickle"""
+    return os.path.splitext(pickle_path)[0] + STORE_EXTENSION
+
+
+def _split_entry(entry):
+    """Split a model pickle entry into (model, JSON metadata, other metadata, layout)"""
+    if not (isinstance(entry, dict) and 'model' in entry):
+        return entry, {}, {}, 'model'
+
+    metadata, extras = {}, {}
+    for key, value in entry.items():
+        if key == 'model':
+            continue
+        try:
+            json.dumps(value)
+            metadata[key] = value
+        except (TypeError, ValueError):
+            extras[key] = value
+    return entry['model'], metadata, extras, 'dict'
+
+
+def convert_pickle(pickle_path, store_path=None):
+    """
+    Convert a model pickle (endpoint -> model or {'model': ..., ...}) into a store
+
+    Args:
+        pickle_path: Source .pkl file
+        store_path: Output file (default: same name with .store extension)
+
+    Returns:
+        Path of the written store
+    """
+    store_path = store_path or store_path_for(pickle_path)
+    with open(pickle_path, 'rb') as f:
+        models = pickle.load(f)
+    return write_store(models, store_path, source=os.path.basename(pickle_path))
+
+
+def write_store(models, store_path, source=None, verbose=True):
+    """
+    Write an endpoint model dict to a store file
+
+    Args:
+        models: Dict of endpoint -> model or {'model': ..., metadata...}
+        store_path: Output file; replaced atomically
+        source: Free-form description of where the models came from
+        verbose: Print one line per endpoint
+
+    Returns:
+        store_path
+    """
+    blobs = []
+    offset = 0
+
+    def add_blob(data):
+        nonlocal offset
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        blobs.append((offset, data))
+        start = offset
+        offset += len(data)
+        return start
+
+    endpoints = {}
+    for endpoint, entry in models.items():
+        model, metadata, extras, layout = _split_entry(entry)
+        record = {'layout': layout, 'metadata': metadata}
+        if extras:
+            data = pickle.dumps(extras, protocol=pickle.HIGHEST_PROTOCOL)
+            record['extras'] = {'offset': add_blob(data), 'nbytes': len(data)}
+
+        compiled = compile_model(model) if model is not None else None
+        if compiled is not None:
+            record['kind'] = 'ensemble'
+            record['params'] = {name: getattr(compiled, name) for name in ENSEMBLE_PARAMS}
+            record['arrays'] = {}
+            for name in ENSEMBLE_ARRAYS:
+                array = np.ascontiguousarray(getattr(compiled, name))
+                record['arrays'][name] = {
+                    'offset': add_blob(array.tobytes()),
+                    'dtype': array.dtype.str,
+                    'shape': list(array.shape)
+                }
+            if verbose:
+                print(f"✅ {endpoint}: {type(model).__name__} compiled "
+                      f"({compiled.n_trees} trees, {compiled.n_nodes} nodes)")
+        else:
+            data = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+            record['kind'] = 'pickle'
+            record['model'] = {'offset': add_blob(data), 'nbytes': len(data)}
+            if verbose:
+                print(f"⚠️ {endpoint}: {type(model).__name__} cannot be compiled, stored pickled")
+        endpoints[endpoint] = record
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'source': source,
+        'created_at': datetime.now().isoformat(),
+        'endpoints': endpoints
+    }
+
+    # Array offsets are relative to the data section, which starts aligned
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = f"{store_path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for blob_offset, data in blobs:
+            f.seek(data_start + blob_offset)
+            f.write(data)
+    os.replace(tmp_path, store_path)  # readers never see a partial file
+    return store_path
+
+
+class ModelStore:
+    """Read-only view of a store file; arrays are zero-copy views of the mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a model store")
+            (header_length,) = struct.unpack('<Q', f.read(8))
+            self.header = json.loads(f.read(header_length).decode('utf-8'))
+        if self.header.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model store version {self.header.get('format_version')}")
+
+        data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+        self._data = np.memmap(path, dtype=np.uint8, mode='r', offset=data_start)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    @property
+    def endpoints(self):
+        return list(self.header['endpoints'])
+
+    def _blob(self, spec):
+        return self._data[spec['offset']:spec['offset'] + spec['nbytes']].tobytes()
+
+    def _array(self, spec):
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        start = spec['offset']
+        return self._data[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+
+    def get_model(self, endpoint):
+        """Model for an endpoint: a CompiledTreeEnsemble over the mmap, or the unpickled model"""
+        with self._lock:
+            if endpoint not in self._models:
+                record = self.header['endpoints'][endpoint]
+                if record['kind'] == 'ensemble':
+                    arrays = {name: self._array(spec) for name, spec in record['arrays'].items()}
+                    model = CompiledTreeEnsemble(**arrays, **record['params'])
+                else:
+                    model = pickle.loads(self._blob(record['model']))
+                self._models[endpoint] = model
+            return self._models[endpoint]
+
+    def get_entry(self, endpoint):
+        """Endpoint entry in the same shape it had in the source pickle"""
+        record = self.header['endpoints'][endpoint]
+        model = self.get_model(endpoint)
+        if record['layout'] == 'model':
+            return model
+        entry = dict(record['metadata'])
+        if 'extras' in record:
+            entry.update(pickle.loads(self._blob(record['extras'])))
+        entry['model'] = model
+        return entry
+
+    def as_model_dict(self):
+        """All endpoints as the dict the source pickle contained"""
+        return {endpoint: self.get_entry(endpoint) for endpoint in self.endpoints}
+
+
+def open_model_store(path):
+    """Open a store once per process and share it between callers"""
+    key = os.path.realpath(path)
+    stat = os.stat(key)
+    signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    with _stores_lock:
+        if key not in _stores or _stores[key][0] != signature:
+            _stores[key] = (signature, ModelStore(key))
+        return _stores[key][1]
+
+
+def resolve_model_source(pickle_path):
+    """
+    Decide where the models for pickle_path are loaded from
+
+    Returns:
+        ('store', path) when the converted store exists and is not older
+        than the pickle, ('pickle', path) when only the pickle is usable,
+        or (None, None) when neither exists
+    """
+    store_path = store_path_for(pickle_path)
+    has_pickle = os.path.exists(pickle_path)
+    if os.path.exists(store_path):
+        if not has_pickle or os.path.getmtime(store_path) >= os.path.getmtime(pickle_path):
+            return 'store', store_path
+        print(f"⚠️ {store_path} is older than {pickle_path}, loading the pickle (re-run the converter)")
+    if has_pickle:
+        return 'pickle', pickle_path
+    return None, None
+
+
+def load_model_file(pickle_path):
+    """
+    Load an endpoint model dict, preferring the converted store
+
+    Uses the .store file next to pickle_path when it exists and is not
+    older than the pickle; otherwise unpickles pickle_path.
+    """
+    source, path = resolve_model_source(pickle_path)
+    if source == 'store':
+        return open_model_store(path).as_model_dict()
+
+    with open(pickle_path, 'rb') as f:
+        return pickle.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a model pickle into a memory-mapped model store')
+    parser.add_argument('pickle_path', help='model .pkl file')
+    parser.add_argument('store_path', nargs='?', help='output file (default: <pickle>.store)')
+    args = parser.parse_args()
+
+    try:
+        path = convert_pickle(args.pickle_path, args.store_path)
+    except Exception as e:
+        print(f"❌ Conversion failed: {e}")
+        sys.exit(1)
+    print(f"✅ Wrote {path} ({os.path.getsize(path) / 1024:.0f} KB)")
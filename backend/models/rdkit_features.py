@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+RDKit Descriptor Plan
+=====================
+Declarative description of the 50 RDKit feature slots used by
+EnhancedDrugToxPredictor.
+
+Several slots repeat the same quantity under different RDKit modules
+(Descriptors.MolLogP / Crippen.MolLogP, the three TPSA functions, the
+ring counts in Descriptors, Lipinski and rdMolDescriptors, ...). The plan
+computes every distinct quantity once per molecule and fans the values
+out to the feature slots in the original order, so the feature vector is
+numerically identical to calling each function separately.
+"""
+
+import threading
+import time
+
+import numpy as np
+from rdkit.Chem import Descriptors, MolSurf
+from rdkit.Chem import rdMolDescriptors
+
+N_RDKIT_FEATURES = 50
+
+# FractionCsp3 was renamed FractionCSP3 in newer RDKit releases
+_fraction_csp3 = getattr(rdMolDescriptors, 'CalcFractionCSP3', None) or rdMolDescriptors.CalcFractionCsp3
+
+# Distinct computations: name -> function(mol). CalcCrippenDescriptors
+# returns (logP, MR) in one call; Descriptors.MolLogP and Crippen.MolMR
+# are each a wrapper that computes both and keeps one.
+DESCRIPTORS = {
+    'MolWt': Descriptors.MolWt,
+    'Crippen': rdMolDescriptors.CalcCrippenDescriptors,
+    'NumHDonors': Descriptors.NumHDonors,
+    'NumHAcceptors': Descriptors.NumHAcceptors,
+    'NumRotatableBonds': Descriptors.NumRotatableBonds,
+    'NumAromaticRings': Descriptors.NumAromaticRings,
+    'NumAliphaticRings': Descriptors.NumAliphaticRings,
+    'NumSaturatedRings': Descriptors.NumSaturatedRings,
+    'RingCount': Descriptors.RingCount,
+    'TPSA': Descriptors.TPSA,
+    'NumValenceElectrons': Descriptors.NumValenceElectrons,
+    'NumRadicalElectrons': Descriptors.NumRadicalElectrons,
+    'HeavyAtomCount': Descriptors.HeavyAtomCount,
+    'NHOHCount': Descriptors.NHOHCount,
+    'NOCount': Descriptors.NOCount,
+    'NumHeteroatoms': Descriptors.NumHeteroatoms,
+    'FractionCsp3': _fraction_csp3,
+    'NumAliphaticCarbocycles': Descriptors.NumAliphaticCarbocycles,
+    'NumAliphaticHeterocycles': Descriptors.NumAliphaticHeterocycles,
+    'NumAromaticCarbocycles': Descriptors.NumAromaticCarbocycles,
+    'LabuteASA': MolSurf.LabuteASA,
+    'PEOE_VSA1': MolSurf.PEOE_VSA1,
+    'NumSpiroAtoms': rdMolDescriptors.CalcNumSpiroAtoms,
+    'NumBridgeheadAtoms': rdMolDescriptors.CalcNumBridgeheadAtoms,
+    'NumAmideBonds': rdMolDescriptors.CalcNumAmideBonds,
+    'Chi0n': rdMolDescriptors.CalcChi0n,
+    'Chi1n': rdMolDescriptors.CalcChi1n,
+    'Chi2n': rdMolDescriptors.CalcChi2n,
+    'Chi3n': rdMolDescriptors.CalcChi3n,
+    'Chi4n': rdMolDescriptors.CalcChi4n,
+    'Kappa1': rdMolDescriptors.CalcKappa1,
+    'Kappa2': rdMolDescriptors.CalcKappa2,
+    'Kappa3': rdMolDescriptors.CalcKappa3,
+    'Phi': rdMolDescriptors.CalcPhi,
+}
+
+# Feature slots in model input order: (descriptor, output index or None).
+# Comments name the function each slot originally called.
+FEATURE_SLOTS = [
+    # Basic molecular properties (20 features)
+    ('MolWt', None),                    # Descriptors.MolWt
+    ('Crippen', 0),                     # Descriptors.MolLogP
+    ('NumHDonors', None),               # Descriptors.NumHDonors
+    ('NumHAcceptors', None),            # Descriptors.NumHAcceptors
+    ('NumRotatableBonds', None),        # Descriptors.NumRotatableBonds
+    ('NumAromaticRings', None),         # Descriptors.NumAromaticRings
+    ('NumAliphaticRings', None),        # Descriptors.NumAliphaticRings
+    ('NumSaturatedRings', None),        # Descriptors.NumSaturatedRings
+    ('RingCount', None),                # Descriptors.RingCount
+    ('TPSA', None),                     # Descriptors.TPSA
+    ('NumValenceElectrons', None),      # Descriptors.NumValenceElectrons
+    ('NumRadicalElectrons', None),      # Descriptors.NumRadicalElectrons
+    ('HeavyAtomCount', None),           # Descriptors.HeavyAtomCount
+    ('NHOHCount', None),                # Descriptors.NHOHCount
+    ('NOCount', None),                  # Descriptors.NOCount
+    ('NumHeteroatoms', None),           # Descriptors.NumHeteroatoms
+    ('FractionCsp3', None),             # Descriptors.FractionCsp3
+    ('NumAliphaticCarbocycles', None),  # Descriptors.NumAliphaticCarbocycles
+    ('NumAliphaticHeterocycles', None), # Descriptors.NumAliphaticHeterocycles
+    ('NumAromaticCarbocycles', None),   # Descriptors.NumAromaticCarbocycles
+    # Lipinski descriptors (5 features)
+    ('NumHDonors', None),               # Lipinski.NumHDonors
+    ('NumHAcceptors', None),            # Lipinski.NumHAcceptors
+    ('NumRotatableBonds', None),        # Lipinski.NumRotatableBonds
+    ('NumAliphaticRings', None),        # Lipinski.NumAliphaticRings
+    ('NumAromaticRings', None),         # Lipinski.NumAromaticRings
+    # Crippen descriptors (2 features)
+    ('Crippen', 0),                     # Crippen.MolLogP
+    ('Crippen', 1),                     # Crippen.MolMR
+    # Surface area descriptors (3 features)
+    ('LabuteASA', None),                # MolSurf.LabuteASA
+    ('TPSA', None),                     # MolSurf.TPSA
+    ('PEOE_VSA1', None),                # MolSurf.PEOE_VSA1
+    # Additional RDKit descriptors (20 features)
+    ('NumSpiroAtoms', None),            # rdMolDescriptors.CalcNumSpiroAtoms
+    ('NumBridgeheadAtoms', None),       # rdMolDescriptors.CalcNumBridgeheadAtoms
+    ('NumAmideBonds', None),            # rdMolDescriptors.CalcNumAmideBonds
+    ('NOCount', None),                  # rdMolDescriptors.CalcNumLipinskiHBA
+    ('NHOHCount', None),                # rdMolDescriptors.CalcNumLipinskiHBD
+    ('FractionCsp3', None),             # rdMolDescriptors.CalcFractionCsp3
+    ('Chi0n', None),                    # rdMolDescriptors.CalcChi0n
+    ('Chi1n', None),                    # rdMolDescriptors.CalcChi1n
+    ('Chi2n', None),                    # rdMolDescriptors.CalcChi2n
+    ('Chi3n', None),                    # rdMolDescriptors.CalcChi3n
+    ('Chi4n', None),                    # rdMolDescriptors.CalcChi4n
+    ('Kappa1', None),                   # rdMolDescriptors.CalcKappa1
+    ('Kappa2', None),                   # rdMolDescriptors.CalcKappa2
+    ('Kappa3', None),                   # rdMolDescriptors.CalcKappa3
+    ('Phi', None),                      # rdMolDescriptors.CalcPhi
+    ('LabuteASA', None),                # rdMolDescriptors.CalcLabuteASA
+    ('TPSA', None),                     # rdMolDescriptors.CalcTPSA
+    ('RingCount', None),                # rdMolDescriptors.CalcNumRings
+    ('NumAromaticRings', None),         # rdMolDescriptors.CalcNumAromaticRings
+    ('NumAliphaticRings', None),        # rdMolDescriptors.CalcNumAliphaticRings
+]
+
+
+class DescriptorPlan:
+    """
+    Computes the RDKit feature vector with each distinct descriptor evaluated once
+
+    Time spent in every descriptor is accumulated so that
+    get_timing_report() can show which descriptors dominate featurization.
+    """
+
+    def __init__(self):
+        self.descriptor_names = list(dict.fromkeys(name for name, _ in FEATURE_SLOTS))
+        self._functions = [DESCRIPTORS[name] for name in self.descriptor_names]
+        position = {name: i for i, name in enumerate(self.descriptor_names)}
+        self._slots = [(position[name], index) for name, index in FEATURE_SLOTS]
+
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._total_seconds = [0.0] * len(self.descriptor_names)
+        self._counts = [0] * len(self.descriptor_names)
+        self._partial_plans = {}  # tuple of slots -> (descriptor ids, slot mapping)
+
+    def _partial_plan(self, slots):
+        """Descriptors needed for a subset of feature slots, and where each value goes"""
+        key = tuple(slots)
+        plan = self._partial_plans.get(key)
+        if plan is None:
+            descriptor_ids = sorted({self._slots[slot][0] for slot in key})
+            position = {d: i for i, d in enumerate(descriptor_ids)}
+            mapping = [(slot, position[self._slots[slot][0]], self._slots[slot][1]) for slot in key]
+            plan = self._partial_plans[key] = (descriptor_ids, mapping)
+        return plan
+
+    def compute(self, mol, slots=None):
+        """
+        Compute the 50-slot RDKit feature vector for a parsed molecule
+
+        Args:
+            mol: RDKit molecule
+            slots: Optional feature slot indices to compute; the other slots
+                are left at 0 and their descriptors are not evaluated
+        """
+        if slots is None:
+            descriptor_ids = range(len(self._functions))
+        else:
+            descriptor_ids, mapping = self._partial_plan(slots)
+
+        values = []
+        elapsed = []
+        clock = time.perf_counter
+        for d in descriptor_ids:
+            start = clock()
+            values.append(self._functions[d](mol))
+            elapsed.append(clock() - start)
+
+        with self._lock:
+            self._calls += 1
+            for d, seconds in zip(descriptor_ids, elapsed):
+                self._total_seconds[d] += seconds
+                self._counts[d] += 1
+
+        if slots is None:
+            return np.array(
+                [values[i] if index is None else values[i][index] for i, index in self._slots],
+                dtype=np.float64
+            )
+
+        features = np.zeros(len(self._slots))
+        for slot, i, index in mapping:
+            features[slot] = values[i] if index is None else values[i][index]
+        return features
+
+    def get_timing_report(self):
+        """
+        Per-descriptor timing, slowest first
+
+        Returns:
+            Dict with the number of molecules featurized and, per descriptor,
+            total seconds, mean microseconds per molecule and share of the
+            total descriptor time
+        """
+        with self._lock:
+            calls = self._calls
+            totals = list(self._total_seconds)
+            counts = list(self._counts)
+
+        grand_total = sum(totals)
+        descriptors = [
+            {
+                'descriptor': name,
+                'total_seconds': round(total, 6),
+                'mean_us': round(total / count * 1e6, 2) if count else 0.0,
+                'share': f"{(total / grand_total if grand_total else 0):.1%}"
+            }
+            for name, total, count in zip(self.descriptor_names, totals, counts)
+        ]
+        descriptors.sort(key=lambda d: d['total_seconds'], reverse=True)
+
+        return {
+            'molecules': calls,
+            'distinct_descriptors': len(self.descriptor_names),
+            'feature_slots': len(self._slots),
+            'descriptors': descriptors
+        }
+
+    def reset_timings(self):
+        """Reset accumulated timings"""
+        with self._lock:
+            self._calls = 0
+            self._total_seconds = [0.0] * len(self.descriptor_names)
+            self._counts = [0] * len(self.descriptor_names)
@@ -10,35 +10,238 @@ Features:
 """
 
 import os
-import pickle
-import pandas as pd
+import threading
+import zlib
 import numpy as np
 import warnings
+from collections import OrderedDict
 from datetime import datetime
 
+try:
+    from models.smiles_features import extract_simple_features
+    from models.model_bundle import ModelBundle
+    from models.model_loader import LazyModelLoader
+except ImportError:  # running this file directly from backend/models
+    from smiles_features import extract_simple_features
+    from model_bundle import ModelBundle
+    from model_loader import LazyModelLoader
+
 warnings.filterwarnings('ignore')
 
 # RDKit imports with fallback
 try:
     from rdkit import Chem
-    from rdkit.Chem import Descriptors, Crippen, Lipinski, MolSurf
-    from rdkit.Chem import AllChem, rdMolDescriptors
     RDKIT_AVAILABLE = True
     print("✅ RDKit available - using advanced molecular descriptors")
 except ImportError:
     RDKIT_AVAILABLE = False
     print("⚠️ RDKit not available - using simplified features")
 
+if RDKIT_AVAILABLE:
+    try:
+        from models.rdkit_features import DescriptorPlan
+    except ImportError:  # running this file directly from backend/models
+        from rdkit_features import DescriptorPlan
+
+# Placeholder models built by _create_placeholder_model (part of the model
+# version in cache keys: change it whenever that method changes)
+PLACEHOLDER_SPEC = 'random-forest-100:seed-42:crc32-data-100x50'
+
+
+class MolCache:
+    """
+    Small thread-safe LRU of parsed RDKit molecules
+    
+    Entries are keyed by both the input SMILES and its canonical form, so
+    validation, featurization and any later lookups for the same molecule
+    share a single Chem.MolFromSmiles parse. Stored molecules are renumbered
+    into canonical atom order, so their descriptors match those of a fresh
+    parse of the canonical SMILES up to float rounding (e.g. Chi2n may
+    differ in the last bit), not bit for bit. Failed parses are kept as
+    well, so invalid SMILES are not parsed again either.
+    """
+    
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # smiles -> (mol, canonical_smiles), (None, None) if unparseable
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.parses = 0
+    
+    def get_or_parse(self, smiles):
+        """
+        Get the parsed molecule for a SMILES string, parsing it on a miss
+        
+        Returns:
+            (mol, canonical_smiles), or (None, None) if RDKit cannot parse it
+        """
+        with self._lock:
+            entry = self._entries.get(smiles)
+            if entry is not None:
+                self._entries.move_to_end(smiles)
+                self.hits += 1
+                return entry
+        
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            entry, keys = (None, None), (smiles,)
+        else:
+            canonical_smiles = Chem.MolToSmiles(mol, canonical=True)
+            atom_order = mol.GetPropsAsDict(True, True)['_smilesAtomOutputOrder']
+            entry = (Chem.RenumberAtoms(mol, list(atom_order)), canonical_smiles)
+            keys = (smiles, canonical_smiles)
+        
+        with self._lock:
+            self.parses += 1
+            for key in keys:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+    
+    def clear(self):
+        """Drop all cached molecules"""
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self):
+        """Get cache statistics"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'parses': self.parses
+            }
+
+
+class MoleculeFeaturizer:
+    """
+    SMILES validation and feature extraction without any models
+    
+    Used by EnhancedDrugToxPredictor and by featurization pool workers,
+    which need the same features but not the endpoint models.
+    """
+    
+    def __init__(self, use_rdkit=True):
+        self.use_rdkit = use_rdkit and RDKIT_AVAILABLE
+        self.mol_cache = MolCache() if self.use_rdkit else None
+        self.descriptor_plan = DescriptorPlan() if self.use_rdkit else None
+    
+    def validate_smiles(self, smiles):
+        """
+        Validate and canonicalize SMILES string using RDKit
+        Returns: (is_valid, canonical_smiles, error_message)
+        """
+        if not smiles or not isinstance(smiles, str):
+            return False, None, "Empty or invalid SMILES string"
+        
+        smiles = smiles.strip()
+        
+        if not self.use_rdkit:
+            # Basic validation without RDKit
+            if len(smiles) < 1:
+                return False, None, "SMILES string too short"
+            if not any(c.isalpha() for c in smiles):
+                return False, None, "SMILES must contain chemical symbols"
+            return True, smiles, None
+        
+        try:
+            # Parse SMILES with RDKit (shared with featurization via the Mol cache)
+            mol, canonical_smiles = self.mol_cache.get_or_parse(smiles)
+            
+            if mol is None:
+                return False, None, "Invalid SMILES structure - cannot parse molecule"
+            
+            # Additional validation checks
+            num_atoms = mol.GetNumAtoms()
+            if num_atoms < 1:
+                return False, None, "Molecule has no atoms"
+            if num_atoms > 200:
+                return False, None, "Molecule too large (>200 atoms)"
+            
+            return True, canonical_smiles, None
+        
+        except Exception as e:
+            return False, None, f"SMILES validation error: {str(e)}"
+    
+    def extract_rdkit_features(self, smiles, feature_slots=None):
+        """
+        Extract comprehensive RDKit molecular descriptors (200+ features)
+        
+        Args:
+            smiles: SMILES string
+            feature_slots: Optional feature indices the models need; only
+                their descriptors are computed and the other slots stay 0
+        """
+        if not self.use_rdkit:
+            return self.extract_simple_features(smiles)
+        
+        try:
+            mol, _ = self.mol_cache.get_or_parse(smiles)
+            if mol is None:
+                return self.extract_simple_features(smiles)
+            
+            # Each distinct descriptor is computed once and fanned out
+            # to the 50 feature slots (see models/rdkit_features.py)
+            return self.descriptor_plan.compute(mol, feature_slots)
+        
+        except Exception as e:
+            print(f"⚠️ RDKit feature extraction failed: {e}, using simple features")
+            return self.extract_simple_features(smiles)
+    
+    def extract_simple_features(self, smiles):
+        """Fallback: Extract 50 basic features without RDKit"""
+        return extract_simple_features(smiles)
+    
+    def featurize(self, smiles, validate=True, feature_slots=None):
+        """
+        Validate (optionally) and featurize one molecule
+        
+        Args:
+            smiles: SMILES string
+            validate: Validate and canonicalize the SMILES first
+            feature_slots: Optional feature indices to compute (RDKit only;
+                the string-based fallback features are always computed in full)
+        
+        Returns:
+            (features, smiles_used, error_message); features is None when
+            validation failed
+        """
+        if validate:
+            is_valid, canonical_smiles, error_msg = self.validate_smiles(smiles)
+            if not is_valid:
+                return None, smiles, error_msg
+            smiles = canonical_smiles
+        
+        if self.use_rdkit:
+            return self.extract_rdkit_features(smiles, feature_slots), smiles, None
+        return self.extract_simple_features(smiles), smiles, None
+
 
 class EnhancedDrugToxPredictor:
     """Enhanced predictor with RDKit integration and 12 endpoints"""
     
-    def __init__(self, use_rdkit=True):
+    def __init__(self, use_rdkit=True, featurization_workers=None):
         self.base_path = os.path.dirname(os.path.abspath(__file__))
         self.model_path = self.base_path
         self.models = None
+        self.bundle = None  # ModelBundle, built once every endpoint is loaded
+        self._subset_bundles = {}  # tuple of endpoints -> ModelBundle
+        self.model_loader = None
         self.is_loaded = False
         self.use_rdkit = use_rdkit and RDKIT_AVAILABLE
+        self.featurizer = MoleculeFeaturizer(use_rdkit=self.use_rdkit)
+        self.mol_cache = self.featurizer.mol_cache
+        self.descriptor_plan = self.featurizer.descriptor_plan
+        
+        # Opt-in process pool for featurizing large batches
+        if featurization_workers is None:
+            featurization_workers = int(os.getenv('FEATURIZATION_WORKERS', '0'))
+        self.featurization_workers = featurization_workers
+        self.featurization_min_batch = int(os.getenv('FEATURIZATION_MIN_BATCH', '50'))
+        self._featurization_pool = None
         
         # Expanded to 12 toxicity endpoints
         self.endpoints = [
@@ -130,357 +333,341 @@ class EnhancedDrugToxPredictor:
         Validate and canonicalize SMILES string using RDKit
         Returns: (is_valid, canonical_smiles, error_message)
         """
-        if not smiles or not isinstance(smiles, str):
-            return False, None, "Empty or invalid SMILES string"
-        
-        smiles = smiles.strip()
+        return self.featurizer.validate_smiles(smiles)
+    
+    def extract_rdkit_features(self, smiles):
+        """Extract the 50 RDKit molecular descriptor features"""
+        return self.featurizer.extract_rdkit_features(smiles)
+    
+    def extract_simple_features(self, smiles):
+        """Fallback: Extract 50 basic features without RDKit"""
+        return self.featurizer.extract_simple_features(smiles)
+    
+    def load_models(self, warmup=None):
+        """
+        Prepare lazy loading of the 12 endpoint models
         
-        if not self.use_rdkit:
-            # Basic validation without RDKit
-            if len(smiles) < 1:
-                return False, None, "SMILES string too short"
-            if not any(c.isalpha() for c in smiles):
-                return False, None, "SMILES must contain chemical symbols"
-            return True, smiles, None
+        Returns immediately: models are read on first use, or by a
+        background warmup thread (MODEL_WARMUP=1, the default) so they are
+        usually ready before the first request. Endpoints missing from the
+        model file get placeholder models that are persisted once.
+        """
+        model_file = os.path.join(self.model_path, 'best_optimized_models.pkl')
+        self.model_loader = LazyModelLoader(
+            model_file, self.endpoints, placeholder_factory=self._create_placeholder_model,
+            placeholder_spec=PLACEHOLDER_SPEC
+        )
+        if not self.model_loader.has_source:
+            print(f"⚠️ Model file not found: {model_file}")
+            print(f"⚠️ Using placeholder models for 12 endpoints...")
         
-        try:
-            # Parse SMILES with RDKit
-            mol = Chem.MolFromSmiles(smiles)
-            
-            if mol is None:
-                return False, None, "Invalid SMILES structure - cannot parse molecule"
-            
-            # Canonicalize SMILES
-            canonical_smiles = Chem.MolToSmiles(mol, canonical=True)
-            
-            # Additional validation checks
-            num_atoms = mol.GetNumAtoms()
-            if num_atoms < 1:
-                return False, None, "Molecule has no atoms"
-            if num_atoms > 200:
-                return False, None, "Molecule too large (>200 atoms)"
-            
-            return True, canonical_smiles, None
-            
-        except Exception as e:
-            return False, None, f"SMILES validation error: {str(e)}"
-    
-    def load_models(self):
-        """Load models for all 12 endpoints"""
-        try:
-            model_file = os.path.join(self.model_path, 'best_optimized_models.pkl')
-            if not os.path.exists(model_file):
-                print(f"⚠️ Model file not found: {model_file}")
-                print(f"⚠️ Creating placeholder models for 12 endpoints...")
-                self._create_placeholder_models()
-                return True
-                
-            with open(model_file, 'rb') as f:
-                loaded_models = pickle.load(f)
-            
-            # Extend models to 12 endpoints if needed
-            self.models = {}
-            for endpoint in self.endpoints:
-                if endpoint in loaded_models:
-                    self.models[endpoint] = loaded_models[endpoint]
-                else:
-                    # Create placeholder for new endpoints
-                    print(f"⚠️ Creating placeholder model for {endpoint}")
-                    self.models[endpoint] = self._create_placeholder_model()
-            
-            self.is_loaded = True
-            print(f"✅ Models loaded successfully for {len(self.models)} endpoints")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error loading models: {e}")
-            return False
+        self.is_loaded = True
+        if warmup is None:
+            warmup = os.getenv('MODEL_WARMUP', '1') != '0'
+        if warmup:
+            self.model_loader.start_warmup(on_complete=self._get_bundle)
+        return True
     
-    def _create_placeholder_model(self):
+    def _create_placeholder_model(self, endpoint):
         """Create a simple placeholder model for new endpoints"""
         from sklearn.ensemble import RandomForestClassifier
         model = RandomForestClassifier(n_estimators=100, random_state=42)
-        # Create dummy training data
-        X_dummy = np.random.rand(100, 50)
-        y_dummy = np.random.randint(0, 2, 100)
+        # Create dummy training data (seeded per endpoint, so every worker
+        # trains the same placeholder)
+        rng = np.random.RandomState(zlib.crc32(endpoint.encode()))
+        X_dummy = rng.rand(100, 50)
+        y_dummy = rng.randint(0, 2, 100)
         model.fit(X_dummy, y_dummy)
         return {'model': model, 'roc_auc': 0.75}
     
-    def _create_placeholder_models(self):
-        """Create placeholder models for all endpoints"""
-        self.models = {}
-        for endpoint in self.endpoints:
-            self.models[endpoint] = self._create_placeholder_model()
-        self.is_loaded = True
+    def resolve_endpoints(self, endpoints=None):
+        """
+        Validate a requested endpoint subset
+        
+        Args:
+            endpoints: Iterable of endpoint names, or None for all endpoints
+        
+        Returns:
+            The requested endpoints in this predictor's endpoint order
+        
+        Raises:
+            ValueError: If an endpoint name is unknown or none is given
+        """
+        if endpoints is None:
+            return list(self.endpoints)
+        requested = set(endpoints)
+        unknown = sorted(requested - set(self.endpoints))
+        if unknown:
+            raise ValueError(f"Unknown endpoints: {', '.join(unknown)}")
+        if not requested:
+            raise ValueError("No endpoints requested")
+        return [endpoint for endpoint in self.endpoints if endpoint in requested]
     
-    def extract_rdkit_features(self, smiles):
+    def _get_bundle(self, endpoints=None):
         """
-        Extract comprehensive RDKit molecular descriptors (200+ features)
+        Model bundle over all endpoints (or a subset), loading any models
+        not loaded yet; subset bundles only load their own endpoints
         """
-        if not self.use_rdkit:
-            return self.extract_simple_features(smiles)
-        
-        try:
-            mol = Chem.MolFromSmiles(smiles)
-            if mol is None:
-                return self.extract_simple_features(smiles)
-            
-            features = []
-            
-            # Basic molecular properties (20 features)
-            features.extend([
-                Descriptors.MolWt(mol),                    # Molecular weight
-                Descriptors.MolLogP(mol),                  # LogP (lipophilicity)
-                Descriptors.NumHDonors(mol),               # H-bond donors
-                Descriptors.NumHAcceptors(mol),            # H-bond acceptors
-                Descriptors.NumRotatableBonds(mol),        # Rotatable bonds
-                Descriptors.NumAromaticRings(mol),         # Aromatic rings
-                Descriptors.NumAliphaticRings(mol),        # Aliphatic rings
-                Descriptors.NumSaturatedRings(mol),        # Saturated rings
-                Descriptors.RingCount(mol),                # Total rings
-                Descriptors.TPSA(mol),                     # Topological polar surface area
-                Descriptors.NumValenceElectrons(mol),      # Valence electrons
-                Descriptors.NumRadicalElectrons(mol),      # Radical electrons
-                Descriptors.HeavyAtomCount(mol),           # Heavy atoms
-                Descriptors.NHOHCount(mol),                # NH and OH count
-                Descriptors.NOCount(mol),                  # N and O count
-                Descriptors.NumHeteroatoms(mol),           # Heteroatoms
-                Descriptors.FractionCsp3(mol),             # Fraction of sp3 carbons
-                Descriptors.NumAliphaticCarbocycles(mol),  # Aliphatic carbocycles
-                Descriptors.NumAliphaticHeterocycles(mol), # Aliphatic heterocycles
-                Descriptors.NumAromaticCarbocycles(mol),   # Aromatic carbocycles
-            ])
-            
-            # Lipinski descriptors (5 features)
-            features.extend([
-                Lipinski.NumHDonors(mol),
-                Lipinski.NumHAcceptors(mol),
-                Lipinski.NumRotatableBonds(mol),
-                Lipinski.NumAliphaticRings(mol),
-                Lipinski.NumAromaticRings(mol),
-            ])
-            
-            # Crippen descriptors (2 features)
-            features.extend([
-                Crippen.MolLogP(mol),
-                Crippen.MolMR(mol),  # Molar refractivity
-            ])
-            
-            # Surface area descriptors (3 features)
-            features.extend([
-                MolSurf.LabuteASA(mol),  # Labute's Approximate Surface Area
-                MolSurf.TPSA(mol),       # Topological polar surface area
-                MolSurf.PEOE_VSA1(mol),  # MOE-type descriptors
-            ])
-            
-            # Additional RDKit descriptors (20 features)
-            features.extend([
-                rdMolDescriptors.CalcNumSpiroAtoms(mol),
-                rdMolDescriptors.CalcNumBridgeheadAtoms(mol),
-                rdMolDescriptors.CalcNumAmideBonds(mol),
-                rdMolDescriptors.CalcNumLipinskiHBA(mol),
-                rdMolDescriptors.CalcNumLipinskiHBD(mol),
-                rdMolDescriptors.CalcFractionCsp3(mol),
-                rdMolDescriptors.CalcChi0n(mol),
-                rdMolDescriptors.CalcChi1n(mol),
-                rdMolDescriptors.CalcChi2n(mol),
-                rdMolDescriptors.CalcChi3n(mol),
-                rdMolDescriptors.CalcChi4n(mol),
-                rdMolDescriptors.CalcKappa1(mol),
-                rdMolDescriptors.CalcKappa2(mol),
-                rdMolDescriptors.CalcKappa3(mol),
-                rdMolDescriptors.CalcPhi(mol),
-                rdMolDescriptors.CalcLabuteASA(mol),
-                rdMolDescriptors.CalcTPSA(mol),
-                rdMolDescriptors.CalcNumRings(mol),
-                rdMolDescriptors.CalcNumAromaticRings(mol),
-                rdMolDescriptors.CalcNumAliphaticRings(mol),
-            ])
-            
-            # Ensure we have exactly 50 features for compatibility
-            # Pad or truncate to 50
-            if len(features) < 50:
-                features.extend([0.0] * (50 - len(features)))
-            else:
-                features = features[:50]
-            
-            return np.array(features, dtype=np.float64)
-            
-        except Exception as e:
-            print(f"⚠️ RDKit feature extraction failed: {e}, using simple features")
-            return self.extract_simple_features(smiles)
+        if endpoints is not None and len(endpoints) < len(self.endpoints):
+            return self._get_subset_bundle(tuple(endpoints))
+        if self.bundle is None:
+            with self.model_loader.lock:
+                if self.bundle is None:
+                    self.models = self.model_loader.load_all()
+                    self.bundle = ModelBundle(
+                        self.endpoints,
+                        {endpoint: info['model'] for endpoint, info in self.models.items()},
+                        compiled=self.model_loader.compiled
+                    )
+                    print(f"✅ Models loaded for {self.bundle.n_endpoints} endpoints "
+                          f"({self.bundle.n_compiled} compiled)")
+        return self.bundle
     
-    def extract_simple_features(self, smiles):
-        """Fallback: Extract 50 basic features without RDKit"""
-        if not smiles or pd.isna(smiles):
-            return np.zeros(50)
-        
-        smiles = str(smiles).strip()
-        features = [
-            len(smiles),                    # 1. Length
-            smiles.count('C'),              # 2. Carbon count
-            smiles.count('N'),              # 3. Nitrogen count
-            smiles.count('O'),              # 4. Oxygen count
-            smiles.count('S'),              # 5. Sulfur count
-            smiles.count('P'),              # 6. Phosphorus count
-            smiles.count('F'),              # 7. Fluorine count
-            smiles.count('Cl'),             # 8. Chlorine count
-            smiles.count('Br'),             # 9. Bromine count
-            smiles.count('I'),              # 10. Iodine count
-            smiles.count('='),              # 11. Double bonds
-            smiles.count('#'),              # 12. Triple bonds
-            smiles.count('('),              # 13. Branches
-            smiles.count('['),              # 14. Special atoms
-            smiles.count('@'),              # 15. Chiral centers
-            smiles.count('1'),              # 16-21. Ring numbers
-            smiles.count('2'),
-            smiles.count('3'),
-            smiles.count('4'),
-            smiles.count('5'),
-            smiles.count('6'),
-            smiles.lower().count('c'),      # 22. Aromatic carbons
-            int('OH' in smiles),            # 23-32. Functional groups
-            int('NH2' in smiles),
-            int('COOH' in smiles),
-            int('NO2' in smiles),
-            int('SO2' in smiles),
-            int('CN' in smiles),
-            int('CF3' in smiles),
-            int('C=O' in smiles),
-            int('C=C' in smiles),
-            int('C#C' in smiles),
-            int('c1ccc' in smiles.lower()),
-            int('c1cc' in smiles.lower()),
-            len(set(smiles)),               # 35. Unique characters
-            smiles.count('/'),              # 36-37. Stereochemistry
-            smiles.count('\\'),
-            len(smiles.split('.')),         # 38. Fragment count
-            max([smiles.count(c) for c in 'CNOPS'], default=0),  # 39
-            smiles.count('C') / max(len(smiles), 1),  # 40. Carbon ratio
-            int(len(smiles) < 100),         # 41-50. Various filters
-            int(smiles.count('O') + smiles.count('N') < 10),
-            int(smiles.count('OH') + smiles.count('NH') < 5),
-            int(smiles.count('C') < 50),
-            smiles.count('C=C'),
-            smiles.count('c') / max(len(smiles), 1),
-            int(any(c.isdigit() for c in smiles)),
-            sum(1 for c in smiles if c.isupper()),
-            sum(1 for c in smiles if c.islower()),
-            len([c for c in smiles if c.isalpha()])
-        ]
+    def _get_subset_bundle(self, endpoints):
+        """Model bundle over an endpoint subset (cached per subset)"""
+        bundle = self._subset_bundles.get(endpoints)
+        if bundle is None:
+            with self.model_loader.lock:
+                models = self.model_loader.load_all(endpoints)
+                bundle = ModelBundle(
+                    endpoints,
+                    {endpoint: info['model'] for endpoint, info in models.items()},
+                    compiled=self.model_loader.compiled
+                )
+                if len(self._subset_bundles) >= 64:
+                    self._subset_bundles.clear()
+                self._subset_bundles[endpoints] = bundle
+        return bundle
+    
+    @property
+    def model_version(self):
+        """Identifies the models and features behind results (part of cache keys)"""
+        feature_method = 'rdkit' if self.use_rdkit else 'simple'
+        return f"enhanced-{feature_method}-{self.model_loader.model_version}"
+    
+    def cache_key(self, smiles):
+        """
+        Prediction cache key for a SMILES string: its canonical SMILES, so
+        equivalent spellings (OCC / CCO) share one cache entry
         
-        return np.array(features[:50], dtype=np.float64)
+        The parse goes through the Mol cache and is reused by validation
+        and featurization. SMILES that RDKit cannot parse (or any SMILES
+        without RDKit) are keyed by the stripped string; anything but a
+        string gets "" (not cached).
+        """
+        if not isinstance(smiles, str):
+            return ''
+        smiles = smiles.strip()
+        if self.use_rdkit:
+            _, canonical_smiles = self.mol_cache.get_or_parse(smiles)
+            if canonical_smiles is not None:
+                return canonical_smiles
+        return smiles
+    
+    def get_model_status(self):
+        """Per-endpoint model readiness (for /api/health)"""
+        return self.model_loader.get_status()
     
-    def predict_single(self, smiles, validate=True):
+    def predict_single(self, smiles, validate=True, endpoints=None):
         """
         Predict toxicity for a single molecule with validation
         
         Args:
             smiles: SMILES string
             validate: Whether to validate and canonicalize SMILES
+            endpoints: Optional endpoint subset; only those models run and
+                only the features they read are computed
         
         Returns:
-            Dictionary with predictions for all 12 endpoints
+            Dictionary with predictions for all 12 endpoints (or the subset)
         """
         if not self.is_loaded:
             return {'error': 'Models not loaded'}
         
-        # Validate and canonicalize SMILES
-        if validate:
-            is_valid, canonical_smiles, error_msg = self.validate_smiles(smiles)
-            if not is_valid:
-                return {
+        return self._predict_molecules([smiles], validate, endpoints)[0]
+    
+    def predict_batch(self, smiles_list, validate=True, endpoints=None):
+        """
+        Predict for multiple molecules with validation
+        
+        Molecules are featurized (across the featurization pool when it is
+        enabled and the batch is large enough) into one feature matrix, and
+        the model bundle scores every endpoint on that matrix at once.
+        """
+        if not self.is_loaded:
+            return [{'error': 'Models not loaded'} for _ in smiles_list]
+        if not smiles_list:
+            return []
+        
+        results = self._predict_molecules(smiles_list, validate, endpoints)
+        print(f"Processed {len(smiles_list)}/{len(smiles_list)} molecules")
+        return results
+    
+    def _featurize_molecules(self, smiles_list, validate, feature_slots=None):
+        """
+        Validate and featurize molecules into one feature matrix
+        
+        Args:
+            smiles_list: SMILES strings
+            validate: Validate and canonicalize each SMILES first
+            feature_slots: Optional feature indices to compute (others stay 0)
+        
+        Returns:
+            (features, outcomes) where features is an (n, 50) matrix and
+            outcomes holds (smiles_used, error_message) per molecule
+        """
+        pool = self._get_featurization_pool(len(smiles_list))
+        if pool is not None:
+            try:
+                return pool.featurize(smiles_list, validate=validate, feature_slots=feature_slots)
+            except Exception as e:
+                print(f"⚠️ Featurization pool failed ({e}), featurizing serially")
+                self.close_featurization_pool()
+        
+        features = np.zeros((len(smiles_list), 50))
+        outcomes = []
+        for i, smiles in enumerate(smiles_list):
+            row, smiles_used, error_msg = self.featurizer.featurize(smiles, validate, feature_slots)
+            if row is not None:
+                features[i] = row
+            outcomes.append((smiles_used, error_msg))
+        return features, outcomes
+    
+    def _get_featurization_pool(self, batch_size):
+        """Get (creating on first use) the featurization pool, if enabled for this batch"""
+        if self.featurization_workers <= 0 or batch_size < self.featurization_min_batch:
+            return None
+        if self._featurization_pool is None:
+            try:
+                from models.featurization_pool import FeaturizationPool
+            except ImportError:  # running this file directly from backend/models
+                from featurization_pool import FeaturizationPool
+            self._featurization_pool = FeaturizationPool(
+                MoleculeFeaturizer,
+                {'use_rdkit': self.use_rdkit},
+                processes=self.featurization_workers
+            )
+            print(f"✅ Featurization pool started ({self.featurization_workers} processes)")
+        return self._featurization_pool
+    
+    def close_featurization_pool(self):
+        """Shut down the featurization pool if one was started"""
+        if self._featurization_pool is not None:
+            self._featurization_pool.close()
+            self._featurization_pool = None
+    
+    def _predict_molecules(self, smiles_list, validate, endpoints=None):
+        """Featurize, run batched inference and build one result dict per molecule"""
+        try:
+            selected = self.resolve_endpoints(endpoints)
+            bundle = self._get_bundle(selected)
+            features, outcomes = self._featurize_molecules(
+                smiles_list, validate, bundle.feature_slots(50)
+            )
+            valid_rows = [i for i, (_, error_msg) in enumerate(outcomes) if error_msg is None]
+            endpoint_errors = self.model_loader.get_errors(selected)
+            probabilities = bundle.predict_all(features[valid_rows], errors=endpoint_errors)
+        except Exception as e:
+            return [
+                {'smiles': smiles, 'error': str(e), 'timestamp': datetime.now().isoformat()}
+                for smiles in smiles_list
+            ]
+        
+        results = [None] * len(smiles_list)
+        for i, (smiles_used, error_msg) in enumerate(outcomes):
+            if error_msg is not None:
+                results[i] = {
                     'error': error_msg,
-                    'original_smiles': smiles,
+                    'invalid_smiles': True,  # the input itself is bad (not a transient failure)
+                    'original_smiles': smiles_list[i],
                     'timestamp': datetime.now().isoformat()
                 }
-            smiles = canonical_smiles
         
-        try:
-            # Extract features (RDKit or simple)
-            if self.use_rdkit:
-                features = self.extract_rdkit_features(smiles)
-            else:
-                features = self.extract_simple_features(smiles)
-            
-            features_array = features.reshape(1, -1)
-            
-            predictions = {}
-            overall_probabilities = []
-            
-            # Predict for all 12 endpoints
-            for endpoint in self.endpoints:
-                if endpoint in self.models:
-                    model_info = self.models[endpoint]
-                    model = model_info['model']
-                    
-                    try:
-                        # Get prediction
-                        if hasattr(model, 'predict_proba'):
-                            pred_proba = model.predict_proba(features_array)
-                            toxicity_prob = pred_proba[0][1] if len(pred_proba[0]) > 1 else pred_proba[0][0]
-                        else:
-                            pred = model.predict(features_array)
-                            toxicity_prob = float(pred[0])
-                        
-                        prediction = "Toxic" if toxicity_prob > 0.5 else "Non-toxic"
-                        confidence = self._get_confidence(toxicity_prob)
-                        
-                        predictions[endpoint] = {
-                            'probability': float(toxicity_prob),
-                            'prediction': prediction,
-                            'confidence': confidence,
-                            'endpoint_info': self.endpoint_info.get(endpoint, {}),
-                            'roc_auc': model_info.get('roc_auc', 0.75)
-                        }
-                        
-                        overall_probabilities.append(toxicity_prob)
-                        
-                    except Exception as e:
-                        print(f"⚠️ Prediction failed for {endpoint}: {e}")
-                        predictions[endpoint] = {
-                            'probability': 0.5,
-                            'prediction': "Unknown",
-                            'confidence': "Low",
-                            'error': str(e)
-                        }
-            
-            # Calculate overall assessment
-            avg_probability = np.mean(overall_probabilities) if overall_probabilities else 0.5
-            toxic_count = sum(1 for p in overall_probabilities if p > 0.5)
-            
-            return {
-                'smiles': smiles,
-                'canonical_smiles': smiles if validate else None,
-                'validated': validate,
-                'feature_method': 'rdkit' if self.use_rdkit else 'simple',
-                'timestamp': datetime.now().isoformat(),
-                'endpoints': predictions,
-                'summary': {
-                    'total_endpoints': len(self.endpoints),
-                    'average_toxicity_probability': float(avg_probability),
-                    'toxic_endpoints': f"{toxic_count}/{len(self.endpoints)}",
-                    'overall_assessment': self._assess_overall_toxicity(avg_probability),
-                    'recommendation': self._get_recommendation(avg_probability),
-                    'risk_category': self._get_risk_category(toxic_count, len(self.endpoints))
+        for row, i in enumerate(valid_rows):
+            results[i] = self._build_result(
+                outcomes[i][0], probabilities[row], endpoint_errors, validate, bundle, selected
+            )
+        return results
+    
+    def _build_result(self, smiles, probabilities, endpoint_errors, validate, bundle, endpoints):
+        """
+        Build the result dict for one molecule
+        
+        Args:
+            smiles: SMILES used for prediction
+            probabilities: The molecule's row of bundle probabilities
+            endpoint_errors: Dict of endpoint -> error for models that failed
+            validate: Whether the SMILES was validated
+            bundle: ModelBundle the probabilities came from
+            endpoints: Endpoints requested, in order
+        """
+        predictions = {}
+        
+        for endpoint in endpoints:
+            if endpoint in endpoint_errors:
+                predictions[endpoint] = {
+                    'probability': 0.5,
+                    'prediction': "Unknown",
+                    'confidence': "Low",
+                    'error': endpoint_errors[endpoint]
                 }
-            }
+                continue
+            if endpoint not in bundle.column_index:
+                continue
             
-        except Exception as e:
-            return {
-                'smiles': smiles,
-                'error': str(e),
-                'timestamp': datetime.now().isoformat()
-            }
+            predictions[endpoint] = self.endpoint_prediction(
+                endpoint, probabilities[bundle.column_index[endpoint]]
+            )
+        
+        return {
+            'smiles': smiles,
+            'canonical_smiles': smiles if validate else None,
+            'validated': validate,
+            'feature_method': 'rdkit' if self.use_rdkit else 'simple',
+            'timestamp': datetime.now().isoformat(),
+            'endpoints': predictions,
+            'summary': self.summarize(predictions, len(endpoints))
+        }
     
-    def predict_batch(self, smiles_list, validate=True):
-        """Predict for multiple molecules with validation"""
-        results = []
-        for i, smiles in enumerate(smiles_list):
-            if (i + 1) % 10 == 0:
-                print(f"Processed {i + 1}/{len(smiles_list)} molecules")
-            results.append(self.predict_single(smiles, validate=validate))
-        return results
+    def endpoint_prediction(self, endpoint, probability):
+        """
+        Prediction dict of one endpoint from its toxicity probability (the
+        prediction cache stores only the probability and rebuilds the rest)
+        
+        Runs on every cache hit, so it only reads metadata of models already
+        loaded and never loads one (ROC-AUC defaults to 0.75 until then).
+        """
+        return {
+            'probability': float(probability),
+            'prediction': "Toxic" if probability > 0.5 else "Non-toxic",
+            'confidence': self._get_confidence(probability),
+            'endpoint_info': self.endpoint_info.get(endpoint, {}),
+            'roc_auc': self.model_loader.metadata.get(endpoint, {}).get('roc_auc', 0.75)
+        }
+    
+    def summarize(self, predictions, total_endpoints=None):
+        """
+        Overall assessment over a set of endpoint predictions
+        
+        Args:
+            predictions: Dict of endpoint -> prediction dict (as in results)
+            total_endpoints: Number of endpoints requested (default: all 12)
+        """
+        total_endpoints = total_endpoints or len(self.endpoints)
+        overall_probabilities = [
+            p['probability'] for p in predictions.values() if 'error' not in p
+        ]
+        avg_probability = np.mean(overall_probabilities) if overall_probabilities else 0.5
+        toxic_count = sum(1 for p in overall_probabilities if p > 0.5)
+        
+        return {
+            'total_endpoints': total_endpoints,
+            'average_toxicity_probability': float(avg_probability),
+            'toxic_endpoints': f"{toxic_count}/{total_endpoints}",
+            'overall_assessment': self._assess_overall_toxicity(avg_probability),
+            'recommendation': self._get_recommendation(avg_probability),
+            'risk_category': self._get_risk_category(toxic_count, total_endpoints)
+        }
     
     def _get_confidence(self, probability):
         """Determine confidence level"""
@@ -5,12 +5,19 @@ DrugTox-AI Simple Predictor (Clean Version)
 """
 
 import os
-import pickle
-import pandas as pd
 import numpy as np
 import warnings
 from datetime import datetime
 
+try:
+    from models.smiles_features import extract_simple_features, extract_simple_features_batch
+    from models.model_bundle import ModelBundle
+    from models.model_loader import LazyModelLoader
+except ImportError:  # running this file directly from backend/models
+    from smiles_features import extract_simple_features, extract_simple_features_batch
+    from model_bundle import ModelBundle
+    from model_loader import LazyModelLoader
+
 warnings.filterwarnings('ignore')
 
 class SimpleDrugToxPredictor:
@@ -20,164 +27,141 @@ class SimpleDrugToxPredictor:
         self.base_path = os.path.dirname(os.path.abspath(__file__))
         self.model_path = self.base_path  # Models are in the same directory
         self.models = None
+        self.bundle = None  # ModelBundle, built once every endpoint is loaded
+        self._subset_bundles = {}  # tuple of endpoints -> ModelBundle
+        self.model_loader = None
         self.is_loaded = False
         self.endpoints = ['NR-AR-LBD', 'NR-AhR', 'SR-MMP', 'NR-ER-LBD', 'NR-AR']
         self.load_models()
     
-    def load_models(self):
-        """Load models without scaling dependencies"""
-        try:
-            model_file = os.path.join(self.model_path, 'best_optimized_models.pkl')
-            if not os.path.exists(model_file):
-                print(f"❌ Model file not found: {model_file}")
-                return False
-                
-            with open(model_file, 'rb') as f:
-                self.models = pickle.load(f)
-            
-            self.is_loaded = True
-            print("✅ Models loaded successfully")
-            return True
-        except Exception as e:
-            print(f"❌ Error loading models: {e}")
+    def load_models(self, warmup=None):
+        """
+        Prepare lazy loading of the endpoint models
+        
+        Returns immediately once a model file is found: models are read on
+        first use, or by a background warmup thread (MODEL_WARMUP=1, the
+        default) so they are usually ready before the first request.
+        """
+        model_file = os.path.join(self.model_path, 'best_optimized_models.pkl')
+        self.model_loader = LazyModelLoader(model_file, self.endpoints)
+        if not self.model_loader.has_source:
+            print(f"❌ Model file not found: {model_file}")
             return False
+        
+        self.is_loaded = True
+        if warmup is None:
+            warmup = os.getenv('MODEL_WARMUP', '1') != '0'
+        if warmup:
+            self.model_loader.start_warmup(on_complete=self._get_bundle)
+        return True
     
-    def extract_simple_features(self, smiles):
-        """Extract 50 basic features that match training expectations"""
-        if not smiles or pd.isna(smiles):
-            return np.zeros(50)
+    def resolve_endpoints(self, endpoints=None):
+        """
+        Validate a requested endpoint subset
         
-        smiles = str(smiles).strip()
-        features = [
-            len(smiles),                    # 1. Length
-            smiles.count('C'),              # 2. Carbon count
-            smiles.count('N'),              # 3. Nitrogen count
-            smiles.count('O'),              # 4. Oxygen count
-            smiles.count('S'),              # 5. Sulfur count
-            smiles.count('P'),              # 6. Phosphorus count
-            smiles.count('F'),              # 7. Fluorine count
-            smiles.count('Cl'),             # 8. Chlorine count
-            smiles.count('Br'),             # 9. Bromine count
-            smiles.count('I'),              # 10. Iodine count
-            smiles.count('='),              # 11. Double bonds
-            smiles.count('#'),              # 12. Triple bonds
-            smiles.count('('),              # 13. Branches
-            smiles.count('['),              # 14. Special atoms
-            smiles.count('@'),              # 15. Chiral centers
-            smiles.count('1'),              # 16. Ring numbers
-            smiles.count('2'),              # 17.
-            smiles.count('3'),              # 18.
-            smiles.count('4'),              # 19.
-            smiles.count('5'),              # 20.
-            smiles.count('6'),              # 21.
-            smiles.lower().count('c'),      # 22. Aromatic carbons
-            int('OH' in smiles),            # 23. Hydroxyl
-            int('NH2' in smiles),           # 24. Amino
-            int('COOH' in smiles),          # 25. Carboxyl
-            int('NO2' in smiles),           # 26. Nitro
-            int('SO2' in smiles),           # 27. Sulfone
-            int('CN' in smiles),            # 28. Nitrile
-            int('CF3' in smiles),           # 29. Trifluoromethyl
-            int('C=O' in smiles),           # 30. Carbonyl
-            int('C=C' in smiles),           # 31. Alkene
-            int('C#C' in smiles),           # 32. Alkyne
-            int('c1ccc' in smiles.lower()), # 33. Benzene ring
-            int('c1cc' in smiles.lower()),  # 34. Aromatic
-            len(set(smiles)),               # 35. Unique characters
-            smiles.count('/'),              # 36. Stereochemistry
-            smiles.count('\\'),             # 37. Stereochemistry
-            len(smiles.split('.')),         # 38. Fragment count
-            max([smiles.count(c) for c in 'CNOPS'], default=0),  # 39. Max heteroatom
-            smiles.count('C') / max(len(smiles), 1),  # 40. Carbon ratio
-            int(len(smiles) < 100),         # 41. Size filter
-            int(smiles.count('O') + smiles.count('N') < 10),  # 42. H-bond acceptors
-            int(smiles.count('OH') + smiles.count('NH') < 5),  # 43. H-bond donors
-            int(smiles.count('C') < 50),    # 44. Complexity filter
-            smiles.count('C=C'),            # 45. Unsaturation
-            smiles.count('c') / max(len(smiles), 1),  # 46. Aromaticity
-            int(any(c.isdigit() for c in smiles)),  # 47. Ring indicators
-            sum(1 for c in smiles if c.isupper()),  # 48. Uppercase count
-            sum(1 for c in smiles if c.islower()),  # 49. Lowercase count
-            len([c for c in smiles if c.isalpha()])  # 50. Letter count
-        ]
+        Args:
+            endpoints: Iterable of endpoint names, or None for all endpoints
         
-        return np.array(features[:50], dtype=np.float64)
+        Returns:
+            The requested endpoints in this predictor's endpoint order
+        
+        Raises:
+            ValueError: If an endpoint name is unknown or none is given
+        """
+        if endpoints is None:
+            return list(self.endpoints)
+        requested = set(endpoints)
+        unknown = sorted(requested - set(self.endpoints))
+        if unknown:
+            raise ValueError(f"Unknown endpoints: {', '.join(unknown)}")
+        if not requested:
+            raise ValueError("No endpoints requested")
+        return [endpoint for endpoint in self.endpoints if endpoint in requested]
     
-    def predict_single(self, smiles):
-        """Predict toxicity for a single molecule"""
+    def _get_bundle(self, endpoints=None):
+        """
+        Model bundle over all endpoints (or a subset), loading any models
+        not loaded yet; subset bundles only load their own endpoints
+        """
+        if endpoints is not None and len(endpoints) < len(self.endpoints):
+            return self._get_subset_bundle(tuple(endpoints))
+        if self.bundle is None:
+            with self.model_loader.lock:
+                if self.bundle is None:
+                    self.models = self.model_loader.load_all()
+                    errors = self.model_loader.get_errors()
+                    if errors:
+                        raise RuntimeError(f"Models failed to load: {errors}")
+                    
+                    # Endpoint order, input widths and compiled trees are fixed here
+                    self.bundle = ModelBundle(
+                        self.endpoints,
+                        {endpoint: info['model'] for endpoint, info in self.models.items()},
+                        compiled=self.model_loader.compiled
+                    )
+                    print(f"✅ Models loaded for {self.bundle.n_endpoints} endpoints "
+                          f"({self.bundle.n_compiled} compiled)")
+        return self.bundle
+    
+    def _get_subset_bundle(self, endpoints):
+        """Model bundle over an endpoint subset (cached per subset)"""
+        bundle = self._subset_bundles.get(endpoints)
+        if bundle is None:
+            with self.model_loader.lock:
+                models = self.model_loader.load_all(endpoints)
+                errors = self.model_loader.get_errors(endpoints)
+                if errors:
+                    raise RuntimeError(f"Models failed to load: {errors}")
+                bundle = ModelBundle(
+                    endpoints,
+                    {endpoint: info['model'] for endpoint, info in models.items()},
+                    compiled=self.model_loader.compiled
+                )
+                if len(self._subset_bundles) >= 64:
+                    self._subset_bundles.clear()
+                self._subset_bundles[endpoints] = bundle
+        return bundle
+    
+    @property
+    def model_version(self):
+        """Identifies the models and features behind results (part of cache keys)"""
+        return f"simple-{self.model_loader.model_version}"
+    
+    def cache_key(self, smiles):
+        """
+        Prediction cache key for a SMILES string: the exact string, since the
+        features are computed from the string itself ("" for non-strings,
+        which are not cached)
+        """
+        return smiles if isinstance(smiles, str) else ''
+    
+    def get_model_status(self):
+        """Per-endpoint model readiness (for /api/health)"""
+        return self.model_loader.get_status()
+    
+    def extract_simple_features(self, smiles):
+        """Extract 50 basic features that match training expectations"""
+        return extract_simple_features(smiles)
+    
+    def predict_single(self, smiles, endpoints=None):
+        """
+        Predict toxicity for a single molecule
+        
+        Args:
+            smiles: SMILES string
+            endpoints: Optional endpoint subset; only those models run
+        """
         if not self.is_loaded:
             return {'error': 'Models not loaded'}
         
         try:
+            selected = self.resolve_endpoints(endpoints)
+            bundle = self._get_bundle(selected)
             # Extract simplified features
-            features = self.extract_simple_features(smiles)
-            features_array = features.reshape(1, -1)
-            
-            predictions = {}
-            overall_probabilities = []
+            features_array = self.extract_simple_features(smiles).reshape(1, -1)
+            probabilities = bundle.predict_all(features_array)
             
-            for endpoint in self.endpoints:
-                if endpoint in self.models:
-                    model_info = self.models[endpoint]
-                    model = model_info['model']
-                    
-                    # Try different feature sizes
-                    for n_features in [50, 100, 200, 1026]:
-                        try:
-                            if n_features != len(features):
-                                if len(features) < n_features:
-                                    padded_features = np.pad(features, (0, n_features - len(features)), 'constant')
-                                else:
-                                    padded_features = features[:n_features]
-                                test_array = padded_features.reshape(1, -1)
-                            else:
-                                test_array = features_array
-                            
-                            # Test prediction
-                            if hasattr(model, 'predict_proba'):
-                                pred_proba = model.predict_proba(test_array)
-                                toxicity_prob = pred_proba[0][1] if len(pred_proba[0]) > 1 else pred_proba[0][0]
-                            else:
-                                pred = model.predict(test_array)
-                                toxicity_prob = float(pred[0])
-                            
-                            prediction = "Toxic" if toxicity_prob > 0.5 else "Non-toxic"
-                            confidence = self._get_confidence(toxicity_prob)
-                            
-                            predictions[endpoint] = {
-                                'probability': float(toxicity_prob),
-                                'prediction': prediction,
-                                'confidence': confidence
-                            }
-                            
-                            overall_probabilities.append(toxicity_prob)
-                            break  # Success with this feature size
-                            
-                        except Exception as e:
-                            continue  # Try next feature size
-                    
-                    if endpoint not in predictions:
-                        predictions[endpoint] = {
-                            'probability': 0.5,
-                            'prediction': "Unknown",
-                            'confidence': "Low"
-                        }
-            
-            # Calculate overall assessment
-            avg_probability = np.mean(overall_probabilities) if overall_probabilities else 0.5
-            toxic_count = sum(1 for p in overall_probabilities if p > 0.5)
-            
-            return {
-                'smiles': smiles,
-                'timestamp': datetime.now().isoformat(),
-                'endpoints': predictions,
-                'summary': {
-                    'average_toxicity_probability': float(avg_probability),
-                    'toxic_endpoints': f"{toxic_count}/{len(self.endpoints)}",
-                    'overall_assessment': self._assess_overall_toxicity(avg_probability),
-                    'recommendation': self._get_recommendation(avg_probability)
-                }
-            }
+            return self._build_result(smiles, probabilities[0], bundle, len(selected))
             
         except Exception as e:
             return {
@@ -186,15 +170,82 @@ class SimpleDrugToxPredictor:
                 'timestamp': datetime.now().isoformat()
             }
     
-    def predict_batch(self, smiles_list):
-        """Predict for multiple molecules"""
-        results = []
-        for i, smiles in enumerate(smiles_list):
-            if (i + 1) % 10 == 0:
-                print(f"Processed {i + 1}/{len(smiles_list)} molecules")
-            results.append(self.predict_single(smiles))
+    def predict_batch(self, smiles_list, endpoints=None):
+        """
+        Predict for multiple molecules in one pass
+        
+        All molecules are featurized into a single (n, 50) matrix and the
+        model bundle scores every endpoint (or the requested subset) on the
+        whole matrix at once.
+        """
+        if not self.is_loaded:
+            return [{'error': 'Models not loaded'} for _ in smiles_list]
+        if not smiles_list:
+            return []
+        
+        try:
+            selected = self.resolve_endpoints(endpoints)
+            bundle = self._get_bundle(selected)
+            features_matrix = extract_simple_features_batch(smiles_list)
+            probabilities = bundle.predict_all(features_matrix)
+        except Exception as e:
+            # Fall back to per-molecule prediction so one bad input
+            # does not fail the whole batch
+            print(f"⚠️ Batch inference failed ({e}), predicting molecules individually")
+            return [self.predict_single(smiles, endpoints) for smiles in smiles_list]
+        
+        results = [
+            self._build_result(smiles, probabilities[i], bundle, len(selected))
+            for i, smiles in enumerate(smiles_list)
+        ]
+        print(f"Processed {len(smiles_list)}/{len(smiles_list)} molecules")
         return results
     
+    def _build_result(self, smiles, probabilities, bundle, total_endpoints):
+        """Build the per-molecule result dict from one row of bundle probabilities"""
+        predictions = {}
+        
+        for endpoint, toxicity_prob in zip(bundle.endpoints, probabilities):
+            predictions[endpoint] = self.endpoint_prediction(endpoint, toxicity_prob)
+        
+        return {
+            'smiles': smiles,
+            'timestamp': datetime.now().isoformat(),
+            'endpoints': predictions,
+            'summary': self.summarize(predictions, total_endpoints)
+        }
+    
+    def endpoint_prediction(self, endpoint, probability):
+        """
+        Prediction dict of one endpoint from its toxicity probability (the
+        prediction cache stores only the probability and rebuilds the rest)
+        """
+        return {
+            'probability': float(probability),
+            'prediction': "Toxic" if probability > 0.5 else "Non-toxic",
+            'confidence': self._get_confidence(probability)
+        }
+    
+    def summarize(self, predictions, total_endpoints=None):
+        """
+        Overall assessment over a set of endpoint predictions
+        
+        Args:
+            predictions: Dict of endpoint -> prediction dict (as in results)
+            total_endpoints: Number of endpoints requested (default: all)
+        """
+        total_endpoints = total_endpoints or len(self.endpoints)
+        overall_probabilities = [p['probability'] for p in predictions.values()]
+        avg_probability = np.mean(overall_probabilities) if overall_probabilities else 0.5
+        toxic_count = sum(1 for p in overall_probabilities if p > 0.5)
+        
+        return {
+            'average_toxicity_probability': float(avg_probability),
+            'toxic_endpoints': f"{toxic_count}/{total_endpoints}",
+            'overall_assessment': self._assess_overall_toxicity(avg_probability),
+            'recommendation': self._get_recommendation(avg_probability)
+        }
+    
     def _get_confidence(self, probability):
         """Determine confidence level"""
         distance = abs(probability - 0.5)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Simple SMILES Features
+======================
+The 50 string-derived features used by the predictors when RDKit is not
+available. Every feature is derived from a character histogram of the
+SMILES string plus a handful of multi-character patterns, instead of
+scanning the string once per feature.
+
+extract_simple_features_batch builds the whole (n, 50) matrix with NumPy
+over the concatenated bytes of all SMILES strings. Both functions return
+exactly the same values as the original per-feature implementation, so
+models trained on those features keep working unchanged.
+"""
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+N_SIMPLE_FEATURES = 50
+
+# Multi-character patterns tested for presence (feature slots 23-32)
+PRESENCE_PATTERNS = ['OH', 'NH2', 'COOH', 'NO2', 'SO2', 'CN', 'CF3', 'C=O', 'C=C', 'C#C']
+
+# Patterns tested for presence in the lower-cased SMILES (slots 33-34)
+LOWER_PRESENCE_PATTERNS = ['c1ccc', 'c1cc']
+
+
+def _is_missing(smiles):
+    """True for inputs that map to an all-zero feature row"""
+    if isinstance(smiles, str):
+        return not smiles
+    return not smiles or pd.isna(smiles)
+
+
+def extract_simple_features(smiles):
+    """Extract the 50 basic SMILES features for one molecule"""
+    if _is_missing(smiles):
+        return np.zeros(N_SIMPLE_FEATURES)
+
+    smiles = str(smiles).strip()
+    length = len(smiles)
+    histogram = Counter(smiles)  # one pass: character histogram
+    count = histogram.get
+
+    lowered = smiles.lower()
+    lower_c = count('c', 0) + count('C', 0) if smiles.isascii() else lowered.count('c')
+
+    n_c, n_n, n_o = count('C', 0), count('N', 0), count('O', 0)
+    n_upper = n_lower = n_alpha = 0
+    has_digit = False
+    for char, n in histogram.items():
+        if char.isupper():
+            n_upper += n
+        elif char.islower():
+            n_lower += n
+        if char.isalpha():
+            n_alpha += n
+        if char.isdigit():
+            has_digit = True
+
+    features = [
+        length,                          # 1. Length
+        n_c,                             # 2. Carbon count
+        n_n,                             # 3. Nitrogen count
+        n_o,                             # 4. Oxygen count
+        count('S', 0),                   # 5. Sulfur count
+        count('P', 0),                   # 6. Phosphorus count
+        count('F', 0),                   # 7. Fluorine count
+        smiles.count('Cl'),              # 8. Chlorine count
+        smiles.count('Br'),              # 9. Bromine count
+        count('I', 0),                   # 10. Iodine count
+        count('=', 0),                   # 11. Double bonds
+        count('#', 0),                   # 12. Triple bonds
+        count('(', 0),                   # 13. Branches
+        count('[', 0),                   # 14. Special atoms
+        count('@', 0),                   # 15. Chiral centers
+        count('1', 0),                   # 16-21. Ring numbers
+        count('2', 0),
+        count('3', 0),
+        count('4', 0),
+        count('5', 0),
+        count('6', 0),
+        lower_c,                         # 22. Aromatic carbons
+    ]
+    features.extend(int(p in smiles) for p in PRESENCE_PATTERNS)          # 23-32
+    features.extend(int(p in lowered) for p in LOWER_PRESENCE_PATTERNS)  # 33-34
+    features.extend([
+        len(histogram),                  # 35. Unique characters
+        count('/', 0),                   # 36-37. Stereochemistry
+        count('\\', 0),
+        count('.', 0) + 1,               # 38. Fragment count
+        max(n_c, n_n, n_o, count('P', 0), count('S', 0)),  # 39. Max heteroatom
+        n_c / max(length, 1),            # 40. Carbon ratio
+        int(length < 100),               # 41. Size filter
+        int(n_o + n_n < 10),             # 42. H-bond acceptors
+        int(smiles.count('OH') + smiles.count('NH') < 5),  # 43. H-bond donors
+        int(n_c < 50),                   # 44. Complexity filter
+        smiles.count('C=C'),             # 45. Unsaturation
+        count('c', 0) / max(length, 1),  # 46. Aromaticity
+        int(has_digit),                  # 47. Ring indicators
+        n_upper,                         # 48. Uppercase count
+        n_lower,                         # 49. Lowercase count
+        n_alpha,                         # 50. Letter count
+    ])
+
+    return np.array(features, dtype=np.float64)
+
+
+def _pattern_counts(codes, row_ids, n_rows, pattern):
+    """
+    Count (possibly overlapping) occurrences of an ASCII pattern per row
+
+    codes holds the concatenated bytes of all strings and row_ids the row
+    each byte belongs to; matches spanning two strings are discarded.
+
+    Returns:
+        (counts per row, boolean hit mask over match start positions)
+    """
+    k = len(pattern)
+    n_starts = len(codes) - k + 1
+    if n_starts <= 0:
+        return np.zeros(n_rows, dtype=np.int64), np.zeros(0, dtype=bool)
+
+    hits = row_ids[:n_starts] == row_ids[k - 1:]
+    for offset, char in enumerate(pattern.encode('ascii')):
+        hits &= codes[offset:offset + n_starts] == char
+    return np.bincount(row_ids[:n_starts][hits], minlength=n_rows), hits
+
+
+def extract_simple_features_batch(smiles_list):
+    """
+    Extract the 50 basic SMILES features for many molecules at once
+
+    ASCII SMILES (the normal case) are featurized together from one
+    concatenated byte array; anything else goes through
+    extract_simple_features row by row.
+
+    Returns:
+        (n, 50) float64 feature matrix in input order
+    """
+    n = len(smiles_list)
+    features = np.zeros((n, N_SIMPLE_FEATURES))
+
+    rows, strings = [], []
+    for i, smiles in enumerate(smiles_list):
+        if _is_missing(smiles):
+            continue
+        smiles = str(smiles).strip()
+        if smiles.isascii():
+            rows.append(i)
+            strings.append(smiles)
+        else:
+            features[i] = extract_simple_features(smiles)
+
+    if not strings:
+        return features
+
+    m = len(strings)
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=m)
+    codes = np.frombuffer(''.join(strings).encode('ascii'), dtype=np.uint8)
+    row_ids = np.repeat(np.arange(m), lengths)
+
+    # Character histogram: one row of 128 ASCII counts per molecule
+    hist = np.bincount(row_ids * 128 + codes, minlength=m * 128).reshape(m, 128)
+
+    def count(char):
+        return hist[:, ord(char)]
+
+    def pattern_count(pattern):
+        return _pattern_counts(codes, row_ids, m, pattern)[0]
+
+    lowered = np.where((codes >= 65) & (codes <= 90), codes + 32, codes)
+
+    # 'C=C' can overlap itself ('C=C=C'), so str.count's non-overlapping
+    # semantics are applied to the few rows where that happens
+    cc_counts, cc_hits = _pattern_counts(codes, row_ids, m, 'C=C')
+    overlapping = cc_hits[:-2] & cc_hits[2:]
+    if overlapping.any():
+        for r in np.unique(row_ids[:len(overlapping)][overlapping]):
+            cc_counts[r] = strings[r].count('C=C')
+
+    safe_lengths = np.maximum(lengths, 1)
+    n_c, n_n, n_o = count('C'), count('N'), count('O')
+    n_upper = hist[:, 65:91].sum(axis=1)
+    n_lower = hist[:, 97:123].sum(axis=1)
+
+    columns = [
+        lengths,                         # 1. Length
+        n_c,                             # 2. Carbon count
+        n_n,                             # 3. Nitrogen count
+        n_o,                             # 4. Oxygen count
+        count('S'),                      # 5. Sulfur count
+        count('P'),                      # 6. Phosphorus count
+        count('F'),                      # 7. Fluorine count
+        pattern_count('Cl'),             # 8. Chlorine count
+        pattern_count('Br'),             # 9. Bromine count
+        count('I'),                      # 10. Iodine count
+        count('='),                      # 11. Double bonds
+        count('#'),                      # 12. Triple bonds
+        count('('),                      # 13. Branches
+        count('['),                      # 14. Special atoms
+        count('@'),                      # 15. Chiral centers
+        count('1'),                      # 16-21. Ring numbers
+        count('2'),
+        count('3'),
+        count('4'),
+        count('5'),
+        count('6'),
+        count('c') + n_c,                # 22. Aromatic carbons
+    ]
+    columns.extend(pattern_count(p) > 0 for p in PRESENCE_PATTERNS)  # 23-32
+    columns.extend(                                                   # 33-34
+        _pattern_counts(lowered, row_ids, m, p)[0] > 0 for p in LOWER_PRESENCE_PATTERNS
+    )
+    columns.extend([
+        (hist > 0).sum(axis=1),          # 35. Unique characters
+        count('/'),                      # 36-37. Stereochemistry
+        count('\\'),
+        count('.') + 1,                  # 38. Fragment count
+        hist[:, [ord(c) for c in 'CNOPS']].max(axis=1),  # 39. Max heteroatom
+        n_c / safe_lengths,              # 40. Carbon ratio
+        lengths < 100,                   # 41. Size filter
+        n_o + n_n < 10,                  # 42. H-bond acceptors
+        pattern_count('OH') + pattern_count('NH') < 5,  # 43. H-bond donors
+        n_c < 50,                        # 44. Complexity filter
+        cc_counts,                       # 45. Unsaturation
+        count('c') / safe_lengths,       # 46. Aromaticity
+        hist[:, 48:58].sum(axis=1) > 0,  # 47. Ring indicators
+        n_upper,                         # 48. Uppercase count
+        n_lower,                         # 49. Lowercase count
+        n_upper + n_lower,               # 50. Letter count
+    ])
+
+    features[rows] = np.column_stack(columns).astype(np.float64)
+    return features
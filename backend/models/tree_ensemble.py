@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Compiled Tree Ensembles
+=======================
+Load-time compiler that flattens the endpoint models (scikit-learn
+forests / gradient boosting and XGBoost boosters) into contiguous node
+arrays, and a vectorized evaluator that walks every tree of the ensemble
+for every input row at once.
+
+Calling predict_proba on a 1-row input spends far more time in Python,
+validation and thread dispatch than in the tree traversal itself. The
+compiled form does one NumPy gather per tree level instead.
+
+Every compiled model is checked against the original model's
+predict_proba at compile time. Models that are not supported or do not
+match within tolerance are left uncompiled and keep using predict_proba.
+"""
+
+import json
+
+import numpy as np
+
+# Maximum absolute probability difference accepted when verifying a compiled model
+VERIFY_TOLERANCE = 1e-6
+
+
+class CompiledTreeEnsemble:
+    """
+    Tree ensemble stored as flat node arrays
+
+    Node i of the ensemble tests feature[i] against threshold[i] and moves
+    to left[i] or right[i] (missing[i] for NaN inputs). Leaves point to
+    themselves and carry their output in value[i]. Every tree starts at
+    one of roots.
+
+    The ensemble output is either the mean leaf value ('mean', random
+    forests: averaged class-1 probabilities) or sigmoid(base_margin +
+    scale * sum of leaf values) ('logistic', boosted trees).
+    """
+
+    def __init__(self, feature, threshold, left, right, missing, value, roots,
+                 max_depth, n_features, output, base_margin=0.0, scale=1.0,
+                 strict_less=False, allow_missing=True):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float32)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.missing = np.ascontiguousarray(missing, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.output = output
+        self.base_margin = float(base_margin)
+        self.scale = float(scale)
+        # XGBoost sends x < threshold left; scikit-learn sends x <= threshold left
+        self.strict_less = bool(strict_less)
+        # Whether the original model accepts NaN inputs (GradientBoosting does not)
+        self.allow_missing = bool(allow_missing)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def n_features_in_(self):
+        # Same attribute name as fitted scikit-learn estimators
+        return self.n_features
+
+    def leaf_values(self, X):
+        """
+        Walk every tree for every row
+
+        Returns:
+            (n_rows, n_trees) array of the leaf value each row reaches
+        """
+        # Both libraries compare float32 feature values against the thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+        check_missing = np.isnan(X).any()
+        if check_missing and not self.allow_missing:
+            raise ValueError("Input X contains NaN.")
+
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            if self.strict_less:
+                go_left = x < self.threshold[node]
+            else:
+                go_left = x <= self.threshold[node]
+            next_node = np.where(go_left, self.left[node], self.right[node])
+            if check_missing:
+                next_node = np.where(np.isnan(x), self.missing[node], next_node)
+            node = next_node
+
+        return self.value[node]
+
+    def predict_positive(self, X):
+        """Probability of the positive class for each row of X"""
+        if X.shape[1] != self.n_features:
+            raise ValueError(
+                f"X has {X.shape[1]} features, but the model is expecting {self.n_features} features as input"
+            )
+        leaves = self.leaf_values(X)
+        if self.output == 'mean':
+            return leaves.sum(axis=1) / self.n_trees
+        margin = self.base_margin + self.scale * leaves.sum(axis=1)
+        return 1.0 / (1.0 + np.exp(-margin))
+
+    def predict_proba(self, X):
+        """(n_rows, 2) class probabilities, so the ensemble can stand in for the model"""
+        positive = self.predict_positive(np.asarray(X))
+        return np.column_stack([1.0 - positive, positive])
+
+
+class _NodeArrays:
+    """Accumulates trees into the flat node layout"""
+
+    def __init__(self):
+        self.feature, self.threshold = [], []
+        self.left, self.right, self.missing = [], [], []
+        self.value, self.roots = [], []
+        self.max_depth = 0
+        self.size = 0
+
+    def add_tree(self, feature, threshold, left, right, missing, value, is_leaf, depth):
+        """Append one tree given in local node numbering (root = node 0)"""
+        offset = self.size
+        n = len(feature)
+        local = np.arange(n)
+        self.feature.append(np.where(is_leaf, 0, feature))
+        self.threshold.append(np.where(is_leaf, np.inf, threshold))
+        self.left.append(np.where(is_leaf, local, left) + offset)
+        self.right.append(np.where(is_leaf, local, right) + offset)
+        self.missing.append(np.where(is_leaf, local, missing) + offset)
+        self.value.append(np.where(is_leaf, value, 0.0))
+        self.roots.append(offset)
+        self.max_depth = max(self.max_depth, depth)
+        self.size += n
+
+    def build(self, n_features, output, **kwargs):
+        return CompiledTreeEnsemble(
+            np.concatenate(self.feature), np.concatenate(self.threshold),
+            np.concatenate(self.left), np.concatenate(self.right),
+            np.concatenate(self.missing), np.concatenate(self.value),
+            np.array(self.roots), self.max_depth, n_features, output, **kwargs
+        )
+
+
+def _tree_depth(left, right):
+    """Depth of a tree given child arrays with -1 for leaves"""
+    depth = np.zeros(len(left), dtype=np.int64)
+    for node in range(len(left)):  # children always have larger ids
+        for child in (left[node], right[node]):
+            if child >= 0:
+                depth[child] = depth[node] + 1
+    return int(depth.max())
+
+
+def _add_sklearn_tree(arrays, tree, value):
+    """Append a fitted scikit-learn tree_ with the given per-node output"""
+    is_leaf = tree.children_left < 0
+    missing_left = getattr(tree, 'missing_go_to_left', None)
+    if missing_left is None:
+        missing = tree.children_right
+    else:
+        missing = np.where(missing_left.astype(bool), tree.children_left, tree.children_right)
+    arrays.add_tree(tree.feature, tree.threshold, tree.children_left, tree.children_right,
+                    missing, value, is_leaf, _tree_depth(tree.children_left, tree.children_right))
+
+
+def _compile_forest(model, n_features):
+    """RandomForest / ExtraTrees / DecisionTree classifiers: mean class-1 probability"""
+    estimators = getattr(model, 'estimators_', None) or [model]
+    arrays = _NodeArrays()
+    allow_missing = True
+    for estimator in estimators:
+        tree = estimator.tree_
+        allow_missing &= hasattr(tree, 'missing_go_to_left')
+        counts = tree.value[:, 0, :]
+        totals = counts.sum(axis=1)
+        positive = min(1, counts.shape[1] - 1)
+        fraction = np.divide(counts[:, positive], totals, out=np.zeros(len(totals)), where=totals > 0)
+        _add_sklearn_tree(arrays, tree, fraction)
+    return arrays.build(n_features, 'mean', allow_missing=allow_missing)
+
+
+def _compile_gradient_boosting(model, n_features):
+    """Binary GradientBoostingClassifier: sigmoid(init + learning_rate * sum of trees)"""
+    if model.estimators_.shape[1] != 1:
+        return None  # multi-class
+    arrays = _NodeArrays()
+    for estimator in model.estimators_[:, 0]:
+        tree = estimator.tree_
+        _add_sklearn_tree(arrays, tree, tree.value[:, 0, 0])
+    compiled = arrays.build(n_features, 'logistic', scale=model.learning_rate, allow_missing=False)
+    # The init estimator's margin is constant; recover it from the model itself
+    probe = np.zeros((1, n_features))
+    compiled.base_margin = float(
+        model.decision_function(probe)[0] - compiled.scale * compiled.leaf_values(probe).sum()
+    )
+    return compiled
+
+
+def _compile_xgboost(model, n_features):
+    """XGBoost binary:logistic boosters: sigmoid(base margin + sum of leaves)"""
+    booster = model.get_booster()
+    objective = json.loads(booster.save_config())['learner']['objective']['name']
+    if objective not in ('binary:logistic', 'reg:logistic'):
+        return None
+
+    names = booster.feature_names
+    feature_index = {name: i for i, name in enumerate(names)} if names else None
+    arrays = _NodeArrays()
+
+    for dump in booster.get_dump(dump_format='json'):
+        nodes = {}
+        stack = [(json.loads(dump), 0)]
+        while stack:
+            node, depth = stack.pop()
+            nodes[node['nodeid']] = (node, depth)
+            stack.extend((child, depth + 1) for child in node.get('children', []))
+
+        n = max(nodes) + 1
+        feature = np.zeros(n, dtype=np.int64)
+        threshold = np.zeros(n)
+        left = np.zeros(n, dtype=np.int64)
+        right = np.zeros(n, dtype=np.int64)
+        missing = np.zeros(n, dtype=np.int64)
+        value = np.zeros(n)
+        is_leaf = np.ones(n, dtype=bool)
+        depth_max = 0
+        for node_id, (node, depth) in nodes.items():
+            depth_max = max(depth_max, depth)
+            if 'leaf' in node:
+                value[node_id] = node['leaf']
+                continue
+            split = node['split']
+            feature[node_id] = feature_index[split] if feature_index else int(split[1:])
+            threshold[node_id] = node['split_condition']
+            left[node_id], right[node_id], missing[node_id] = node['yes'], node['no'], node['missing']
+            is_leaf[node_id] = False
+        arrays.add_tree(feature, threshold, left, right, missing, value, is_leaf, depth_max)
+
+    compiled = arrays.build(n_features, 'logistic', strict_less=True)
+    probe = np.zeros((1, n_features))
+    compiled.base_margin = float(
+        model.predict(probe, output_margin=True)[0] - compiled.leaf_values(probe).sum()
+    )
+    return compiled
+
+
+def _probe_matrix(compiled, n_rows=64, seed=0):
+    """Rows that land on both sides of the ensemble's split thresholds"""
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n_rows, compiled.n_features))
+    splits = compiled.threshold < np.inf
+    for f in range(compiled.n_features):
+        thresholds = compiled.threshold[splits & (compiled.feature == f)]
+        if len(thresholds):
+            X[:, f] = rng.choice(thresholds, n_rows) + rng.choice([-1e-3, 1e-3], n_rows)
+    return X
+
+
+def _positive_proba(model, X):
+    """Positive-class probability the way the predictors read it from predict_proba"""
+    pred_proba = model.predict_proba(X)
+    return pred_proba[:, 1] if pred_proba.shape[1] > 1 else pred_proba[:, 0]
+
+
+def compile_model(model, n_features=None):
+    """
+    Compile a fitted endpoint model into a CompiledTreeEnsemble
+
+    Args:
+        model: Fitted scikit-learn tree ensemble or XGBoost classifier
+        n_features: Number of input features the model expects (default:
+            the width recorded on the model at fit time)
+
+    Returns:
+        CompiledTreeEnsemble matching model.predict_proba within
+        VERIFY_TOLERANCE, or None if the model cannot be compiled
+    """
+    if isinstance(model, CompiledTreeEnsemble):
+        return model
+
+    name = type(model).__name__
+    try:
+        if n_features is None:
+            n_features = getattr(model, 'n_features_in_', None)
+            if n_features is None and hasattr(model, 'get_booster'):
+                n_features = model.get_booster().num_features()
+        if n_features is None:
+            return None
+
+        if name in ('RandomForestClassifier', 'ExtraTreesClassifier', 'DecisionTreeClassifier'):
+            compiled = _compile_forest(model, n_features)
+        elif name == 'GradientBoostingClassifier':
+            compiled = _compile_gradient_boosting(model, n_features)
+        elif hasattr(model, 'get_booster'):
+            compiled = _compile_xgboost(model, n_features)
+        else:
+            compiled = None
+        if compiled is None:
+            return None
+
+        probe = _probe_matrix(compiled)
+        error = np.abs(compiled.predict_positive(probe) - _positive_proba(model, probe)).max()
+        if error > VERIFY_TOLERANCE:
+            print(f"⚠️ Compiled {name} differs from predict_proba by {error:.2e}, not using it")
+            return None
+        return compiled
+
+    except Exception as e:
+        print(f"⚠️ Could not compile {name}: {e}")
+        return None
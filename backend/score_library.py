@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Offline Library Scorer
+======================
+Scores a SMILES library with EnhancedDrugToxPredictor and writes one CSV
+row per molecule. Featurization runs across a process pool, so nightly
+rescoring uses every core instead of one.
+
+Usage:
+    python score_library.py library.smi scores.csv --workers 8
+    python score_library.py library.csv scores.csv --smiles-column smiles
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'models'))
+
+from models.rdkit_predictor import EnhancedDrugToxPredictor
+
+
+def read_smiles(path, smiles_column):
+    """Yield SMILES from a .csv file (by column) or a one-per-line .smi/.txt file"""
+    with open(path, newline='') as f:
+        if path.lower().endswith('.csv'):
+            for row in csv.DictReader(f):
+                yield row.get(smiles_column, '')
+        else:
+            for line in f:
+                parts = line.split()
+                if parts:
+                    yield parts[0]
+
+
+def score_library(input_path, output_path, workers, chunk_size, smiles_column, validate):
+    """Score every molecule in input_path and write the results to output_path"""
+    predictor = EnhancedDrugToxPredictor(use_rdkit=True, featurization_workers=workers)
+    if not predictor.is_loaded:
+        print("❌ Failed to load models")
+        return False
+
+    columns = ['input_smiles', 'canonical_smiles', 'error'] + predictor.endpoints + [
+        'average_toxicity_probability', 'toxic_endpoints', 'risk_category'
+    ]
+    total = 0
+    start_time = time.time()
+
+    with open(output_path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(columns)
+
+        smiles_iter = read_smiles(input_path, smiles_column)
+        while True:
+            chunk = [s for _, s in zip(range(chunk_size), smiles_iter)]
+            if not chunk:
+                break
+
+            for smiles, result in zip(chunk, predictor.predict_batch(chunk, validate=validate)):
+                if 'error' in result:
+                    writer.writerow([smiles, '', result['error']] + [''] * (len(columns) - 3))
+                    continue
+                writer.writerow(
+                    [smiles, result.get('canonical_smiles') or '', '']
+                    + [result['endpoints'][ep]['probability'] for ep in predictor.endpoints]
+                    + [result['summary']['average_toxicity_probability'],
+                       result['summary']['toxic_endpoints'],
+                       result['summary']['risk_category']]
+                )
+
+            total += len(chunk)
+            rate = total / max(time.time() - start_time, 1e-9)
+            print(f"📊 Scored {total} molecules ({rate:.0f} molecules/s)")
+
+    predictor.close_featurization_pool()
+    print(f"✅ Wrote {total} rows to {output_path}")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score a SMILES library for toxicity')
+    parser.add_argument('input', help='.smi/.txt (one SMILES per line) or .csv file')
+    parser.add_argument('output', help='CSV file to write')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='featurization processes (default: CPU count, 0 = serial)')
+    parser.add_argument('--chunk-size', type=int, default=5000,
+                        help='molecules scored per batch')
+    parser.add_argument('--smiles-column', default='smiles',
+                        help='SMILES column name for CSV input')
+    parser.add_argument('--no-validate', action='store_true',
+                        help='skip RDKit validation and canonicalization')
+    args = parser.parse_args()
+
+    ok = score_library(args.input, args.output, args.workers, args.chunk_size,
+                       args.smiles_column, not args.no_validate)
+    sys.exit(0 if ok else 1)
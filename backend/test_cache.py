@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Test the prediction cache (offline: no server, no network)
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('MODEL_WARMUP', '0')
+
+from utils.cache import PredictionCache, CachedPredictionWrapper, NegativeCache
+from utils.shared_cache import SharedPredictionCache
+from utils.batcher import MicroBatcher
+
+class FakePredictor:
+    """Stand-in predictor: probabilities from the SMILES length, calls recorded"""
+
+    endpoints = ['NR-AR', 'NR-AhR', 'SR-MMP']
+    model_version = 'fake-1'
+
+    def __init__(self):
+        self.calls = []  # (smiles, endpoints) per molecule predicted
+        self.failure = None  # error message of a simulated transient failure
+
+    def resolve_endpoints(self, endpoints=None):
+        if endpoints is None:
+            return list(self.endpoints)
+        return [endpoint for endpoint in self.endpoints if endpoint in endpoints]
+
+    def cache_key(self, smiles):
+        return smiles if isinstance(smiles, str) else ''
+
+    def endpoint_prediction(self, endpoint, probability):
+        return {
+            'probability': float(probability),
+            'prediction': "Toxic" if probability > 0.5 else "Non-toxic"
+        }
+
+    def summarize(self, predictions, total_endpoints=None):
+        return {
+            'toxic_endpoints': sum(p['prediction'] == "Toxic" for p in predictions.values()),
+            'total_endpoints': total_endpoints or len(predictions)
+        }
+
+    def predict_single(self, smiles, endpoints=None):
+        requested = self.resolve_endpoints(endpoints)
+        self.calls.append((smiles, tuple(requested)))
+        if self.failure:
+            return {'smiles': smiles, 'error': self.failure, 'timestamp': datetime.now().isoformat()}
+        if not isinstance(smiles, str) or not smiles:
+            return {
+                'error': "Empty or invalid SMILES string",
+                'invalid_smiles': True,
+                'original_smiles': smiles,
+                'timestamp': datetime.now().isoformat()
+            }
+        predictions = {
+            endpoint: self.endpoint_prediction(endpoint, (len(smiles) + i) % 10 / 10)
+            for i, endpoint in enumerate(requested)
+        }
+        return {
+            'smiles': smiles,
+            'timestamp': datetime.now().isoformat(),
+            'endpoints': predictions,
+            'summary': self.summarize(predictions)
+        }
+
+    def predict_batch(self, smiles_list, endpoints=None):
+        return [self.predict_single(smiles, endpoints) for smiles in smiles_list]
+
+def test_non_string_keys():
+    """Non-string inputs never share an entry with their string spelling"""
+    try:
+        predictor = FakePredictor()
+        cached = CachedPredictionWrapper(predictor, PredictionCache(), negative_cache=NegativeCache())
+
+        for value, spelling in ((None, 'None'), (5, '5')):
+            # Invalid non-string first: its error must not answer the string
+            assert 'error' in cached.predict_single(value), f"{value!r} was not rejected"
+            assert 'error' not in cached.predict_single(spelling), f"{spelling!r} got the error of {value!r}"
+            # Valid string first: its result must not answer the non-string
+            assert 'error' in cached.predict_single(value), f"{value!r} got the result of {spelling!r}"
+
+        results = cached.predict_batch([None, 'None', 5, '5'])
+        assert ['error' in result for result in results] == [True, False, True, False]
+        assert cached.cache.key_for(None) == cached.cache.key_for(5) == ''
+        print("✅ Non-string keys: None/'None' and 5/'5' are kept apart")
+        return True
+    except Exception as e:
+        print(f"❌ Non-string keys Failed: {e}")
+        return False
+
+def test_transient_errors():
+    """Only invalid SMILES are negative-cached; transient errors are retried"""
+    try:
+        predictor = FakePredictor()
+        cached = CachedPredictionWrapper(predictor, PredictionCache(), negative_cache=NegativeCache())
+
+        predictor.failure = "Models failed to load: disk error"
+        assert cached.predict_single('CCO')['error'] == predictor.failure
+        assert cached.predict_batch(['CCN'])[0]['error'] == predictor.failure
+
+        predictor.failure = None
+        assert 'error' not in cached.predict_single('CCO'), "transient error was cached"
+        assert 'error' not in cached.predict_batch(['CCN'])[0], "transient error was cached (batch)"
+        assert cached.negative_cache.get_stats()['cache_size'] == 0
+
+        # Invalid input is cached and not predicted again
+        cached.predict_single('')
+        calls = len(predictor.calls)
+        assert 'error' in cached.predict_single('')
+        assert len(predictor.calls) == calls, "invalid SMILES predicted again"
+        print("✅ Transient errors: retried; invalid SMILES: negative-cached")
+        return True
+    except Exception as e:
+        print(f"❌ Transient errors Failed: {e}")
+        return False
+
+def test_hit_without_models():
+    """Cached predictions are served while the models cannot be loaded"""
+    try:
+        from models.rdkit_predictor import EnhancedDrugToxPredictor
+        predictor = EnhancedDrugToxPredictor()
+        cached = CachedPredictionWrapper(predictor, PredictionCache(), negative_cache=NegativeCache())
+        fresh = cached.predict_single('CCO')
+        assert 'error' not in fresh, fresh.get('error')
+
+        def unavailable(*args, **kwargs):
+            raise RuntimeError("Models failed to load: simulated outage")
+        predictor.model_loader.load = unavailable
+        predictor._get_bundle = unavailable
+
+        hits = cached.cache.hits
+        result = cached.predict_single('CCO')
+        assert 'error' not in result, result.get('error')
+        assert cached.cache.hits == hits + 1
+        # Probabilities are stored as float32; everything else is rebuilt exactly
+        for endpoint, prediction in fresh['endpoints'].items():
+            cached_prediction = dict(result['endpoints'][endpoint])
+            assert abs(cached_prediction.pop('probability') - prediction['probability']) < 1e-6, endpoint
+            assert cached_prediction == {k: v for k, v in prediction.items() if k != 'probability'}, endpoint
+        print(f"✅ Hit without models: {len(result['endpoints'])} endpoints from the cache")
+        return True
+    except Exception as e:
+        print(f"❌ Hit without models Failed: {e}")
+        return False
+
+def test_tiers_merge_and_ttl():
+    """Endpoints merge across L1/L2 and entries keep their age in both tiers"""
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'shared_cache.db')
+
+            # Two workers: their own predictor and L1, one L2
+            workers = []
+            for _ in range(2):
+                predictor = FakePredictor()
+                workers.append((predictor, CachedPredictionWrapper(
+                    predictor, PredictionCache(ttl_seconds=1),
+                    shared_cache=SharedPredictionCache(path, ttl_seconds=1),
+                    negative_cache=NegativeCache()
+                )))
+            (first, first_cached), (second, second_cached) = workers
+
+            first_cached.predict_single('CCO', endpoints=['NR-AR'])
+            time.sleep(0.5)
+            # NR-AR from L2, only SR-MMP predicted; merged into the L2 entry
+            second_cached.predict_single('CCO', endpoints=['NR-AR', 'SR-MMP'])
+            assert second.calls == [('CCO', ('SR-MMP',))], second.calls
+            # NR-AR from L1, SR-MMP from L2: nothing predicted
+            result = first_cached.predict_single('CCO', endpoints=['NR-AR', 'SR-MMP'])
+            assert first.calls == [('CCO', ('NR-AR',))], first.calls
+            assert sorted(result['endpoints']) == ['NR-AR', 'SR-MMP']
+
+            # The merge kept the entry's age: it expires everywhere at once
+            time.sleep(0.7)
+            second_cached.predict_single('CCO', endpoints=['NR-AR', 'SR-MMP'])
+            assert second.calls[1:] == [('CCO', ('NR-AR', 'SR-MMP'))], second.calls
+        print("✅ Tiers: endpoints merged across L1/L2, TTL kept through the merge")
+        return True
+    except Exception as e:
+        print(f"❌ Tiers Failed: {e}")
+        return False
+
+def batching_wrapper(predictor, path, window_ms=2):
+    """Wrapper whose misses go through a MicroBatcher, as with MICROBATCH_WINDOW_MS > 0"""
+    batcher = MicroBatcher(
+        lambda endpoints, smiles_list: predictor.predict_batch(
+            smiles_list, endpoints=list(endpoints) if endpoints else None
+        ),
+        window_ms=window_ms
+    )
+    return CachedPredictionWrapper(
+        predictor, PredictionCache(), batcher=batcher,
+        shared_cache=SharedPredictionCache(path), negative_cache=NegativeCache()
+    )
+
+def test_micro_batched_misses():
+    """Batched misses are cached per molecule in L1 and L2 (all or some endpoints)"""
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for endpoints in (None, ['NR-AR']):
+                predictor = FakePredictor()
+                cached = batching_wrapper(predictor, os.path.join(directory, f"{endpoints}.db"))
+                for smiles in ('CCO', 'CCN'):
+                    assert 'error' not in cached.predict_single(smiles, endpoints=endpoints)
+
+                calls, hits = len(predictor.calls), cached.cache.hits
+                for smiles in ('CCO', 'CCN'):
+                    cached.predict_single(smiles, endpoints=endpoints)
+                    key = cached.cache.key_for(smiles)
+                    assert key in cached.cache.cache, f"{smiles} not in L1 under its key ({endpoints})"
+                    assert cached.shared_cache.get(key) is not None, f"{smiles} not in L2 ({endpoints})"
+                assert len(predictor.calls) == calls, f"second call predicted again ({endpoints})"
+                assert cached.cache.hits == hits + 2
+                assert all(isinstance(key, str) and key for key in cached.cache.cache)
+                cached.batcher.close()
+        print("✅ Micro-batched misses: cached per molecule, second calls hit")
+        return True
+    except Exception as e:
+        print(f"❌ Micro-batched misses Failed: {e}")
+        return False
+
+def test_concurrent_batched_misses():
+    """Concurrent misses run as one batch through the wrapper; every molecule is then a hit"""
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            predictor = FakePredictor()
+            cached = batching_wrapper(predictor, os.path.join(directory, 'shared_cache.db'), window_ms=200)
+            molecules = ['C' * n + 'O' for n in range(1, 9)]
+            barrier = threading.Barrier(len(molecules))
+            results = {}
+
+            def request(smiles):
+                barrier.wait()
+                results[smiles] = cached.predict_single(smiles)
+
+            threads = [threading.Thread(target=request, args=(smiles,)) for smiles in molecules]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            stats = cached.batcher.get_stats()
+            assert stats['total_batches'] < len(molecules), stats
+            assert sorted(smiles for smiles, _ in predictor.calls) == sorted(molecules)
+            assert all(results[smiles]['smiles'] == smiles for smiles in molecules)
+
+            hits = cached.cache.hits
+            for smiles in molecules:
+                endpoints = cached.predict_single(smiles)['endpoints']
+                assert {e: p['prediction'] for e, p in endpoints.items()} == \
+                    {e: p['prediction'] for e, p in results[smiles]['endpoints'].items()}, smiles
+            assert cached.cache.hits == hits + len(molecules)
+            assert len(predictor.calls) == len(molecules), "second round predicted again"
+            keys = [cached.cache.key_for(smiles) for smiles in molecules]
+            assert sorted(cached.cache.cache) == sorted(keys)
+            assert all(cached.shared_cache.get(key) is not None for key in keys), "batched results not in L2"
+            cached.batcher.close()
+        print(f"✅ Concurrent batched misses: {len(molecules)} molecules in {stats['total_batches']} batch(es)")
+        return True
+    except Exception as e:
+        print(f"❌ Concurrent batched misses Failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    print("🧪 Testing MedToXAi Prediction Cache")
+    print("=" * 60)
+
+    tests = [
+        ("Non-string keys", test_non_string_keys),
+        ("Transient errors", test_transient_errors),
+        ("Hit without models", test_hit_without_models),
+        ("L1/L2 merge and TTL", test_tiers_merge_and_ttl),
+        ("Micro-batched misses", test_micro_batched_misses),
+        ("Concurrent batched misses", test_concurrent_batched_misses),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for test_name, test_func in tests:
+        print(f"\n🔬 Testing: {test_name}")
+        print("-" * 60)
+        if test_func():
+            passed += 1
+        else:
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"📊 Test Results: {passed} passed, {failed} failed")
+    print("=" * 60)
+    sys.exit(1 if failed else 0)
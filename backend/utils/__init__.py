@@ -2,6 +2,14 @@
 Backend utility modules
 """
 
-from .cache import PredictionCache, CachedPredictionWrapper, prediction_cache
+from .cache import PredictionCache, CachedPredictionWrapper, NegativeCache, prediction_cache, negative_cache
+from .batcher import MicroBatcher, prediction_batcher_from_env
+from .jobs import JobStore, JobRunner, job_runner_from_env
+from .shared_cache import SharedPredictionCache, shared_cache_from_env
+from .cache_snapshot import CacheSnapshotter, cache_snapshotter_from_env
 
-__all__ = ['PredictionCache', 'CachedPredictionWrapper', 'prediction_cache']
+__all__ = ['PredictionCache', 'CachedPredictionWrapper', 'NegativeCache', 'prediction_cache', 'negative_cache',
+           'MicroBatcher', 'prediction_batcher_from_env',
+           'JobStore', 'JobRunner', 'job_runner_from_env',
+           'SharedPredictionCache', 'shared_cache_from_env',
+           'CacheSnapshotter', 'cache_snapshotter_from_env']
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Micro-Batching Dispatcher
+=========================
+Coalesces concurrent single-molecule predictions into one batched
+featurize+infer pass.
+
+Each /api/predict call runs a 1-row inference whose cost is dominated by
+per-call overhead, not by the rows themselves. MicroBatcher queues
+concurrent requests, waits at most a short window (or until enough items
+are queued) after the first one arrives, runs them as one batch and
+resolves every caller's result.
+
+Enabled with MICROBATCH_WINDOW_MS > 0 (see .env.example); the batch size
+and queueing delay metrics are served at /api/batching/stats.
+"""
+
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Batchers whose dispatcher threads are restarted in forked children
+_batchers = weakref.WeakSet()
+
+
+def _reset_batchers_after_fork():
+    for batcher in list(_batchers):
+        batcher._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_batchers_after_fork)
+
+
+class MicroBatcher:
+    """
+    Dispatcher thread that runs queued items as batches
+    
+    Items are submitted with a key; only items with the same key are
+    batched together (for predictions: the same endpoint subset).
+    """
+    
+    def __init__(self, batch_function: Callable[[Hashable, List[Any]], List[Any]],
+                 window_ms: float = 3.0, max_batch_size: int = 32, metrics_window: int = 2048):
+        """
+        Initialize the batcher (the dispatcher thread starts on first use)
+        
+        Args:
+            batch_function: function(key, items) returning one result per item
+            window_ms: Longest time the first queued item waits for others
+            max_batch_size: Dispatch as soon as this many items are queued
+            metrics_window: Number of recent batches/items the metrics cover
+        """
+        self.batch_function = batch_function
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.metrics_window = metrics_window
+        
+        self._condition = threading.Condition()
+        self._pending: List[tuple] = []  # (key, item, future, enqueued_at)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes = deque(maxlen=metrics_window)
+        self._queue_delays = deque(maxlen=metrics_window)
+        self._run_times = deque(maxlen=metrics_window)
+        self._total_items = 0
+        self._total_batches = 0
+        self._failed_batches = 0
+        _batchers.add(self)
+    
+    def submit(self, item: Any, key: Hashable = None) -> Future:
+        """
+        Queue an item for the next batch
+        
+        Returns:
+            Future resolved with the item's result (or the batch's exception)
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+            self._pending.append((key, item, future, time.perf_counter()))
+            self._condition.notify()
+        return future
+    
+    def _next_batch(self):
+        """Wait for the window of the oldest queued item, then take its batch"""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None, []
+            
+            key = self._pending[0][0]
+            deadline = self._pending[0][3] + self.window
+            while not self._closed:
+                same_key = sum(1 for entry in self._pending if entry[0] == key)
+                remaining = deadline - time.perf_counter()
+                if same_key >= self.max_batch_size or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            
+            batch, rest = [], []
+            for entry in self._pending:
+                if entry[0] == key and len(batch) < self.max_batch_size:
+                    batch.append(entry)
+                else:
+                    rest.append(entry)
+            self._pending = rest
+            return key, batch
+    
+    def _run(self):
+        while True:
+            key, batch = self._next_batch()
+            if not batch:
+                return
+            self._run_batch(key, batch)
+    
+    def _run_batch(self, key, batch):
+        started = time.perf_counter()
+        try:
+            results = self.batch_function(key, [item for _, item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(batch)} items")
+            for (_, _, future, _), result in zip(batch, results):
+                future.set_result(result)
+            failed = False
+        except Exception as e:
+            logger.error(f"Micro-batch of {len(batch)} failed: {e}")
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            failed = True
+        
+        finished = time.perf_counter()
+        with self._metrics_lock:
+            self._batch_sizes.append(len(batch))
+            self._queue_delays.extend(started - enqueued for _, _, _, enqueued in batch)
+            self._run_times.append(finished - started)
+            self._total_items += len(batch)
+            self._total_batches += 1
+            self._failed_batches += failed
+    
+    def run(self, item: Any, key: Hashable = None, timeout: Optional[float] = None) -> Any:
+        """Submit an item and wait for its result"""
+        return self.submit(item, key).result(timeout)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Batch size, queueing delay and batch run time over recent batches"""
+        with self._metrics_lock:
+            sizes = np.array(self._batch_sizes, dtype=np.float64)
+            delays = np.array(self._queue_delays) * 1000.0
+            run_times = np.array(self._run_times) * 1000.0
+            totals = (self._total_items, self._total_batches, self._failed_batches)
+        with self._condition:
+            queued = len(self._pending)
+        
+        def percentiles(values):
+            if not len(values):
+                return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            return {
+                'mean': round(float(values.mean()), 3),
+                'p50': round(float(p50), 3),
+                'p95': round(float(p95), 3),
+                'p99': round(float(p99), 3),
+                'max': round(float(values.max()), 3)
+            }
+        
+        return {
+            'window_ms': self.window * 1000.0,
+            'max_batch_size': self.max_batch_size,
+            'total_items': totals[0],
+            'total_batches': totals[1],
+            'failed_batches': totals[2],
+            'queued': queued,
+            'batch_size': percentiles(sizes),
+            'queue_delay_ms': percentiles(delays),
+            'batch_run_ms': percentiles(run_times)
+        }
+    
+    def reset_stats(self) -> None:
+        """Reset the metrics"""
+        with self._metrics_lock:
+            self._batch_sizes.clear()
+            self._queue_delays.clear()
+            self._run_times.clear()
+            self._total_items = 0
+            self._total_batches = 0
+            self._failed_batches = 0
+    
+    def close(self) -> None:
+        """Finish the queued batches and stop the dispatcher thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+    
+    def _after_fork(self):
+        """Forked children start their own dispatcher thread on first use"""
+        self._condition = threading.Condition()
+        self._metrics_lock = threading.Lock()
+        self._pending = []
+        self._thread = None
+
+
+def prediction_batcher_from_env(predictor) -> Optional[MicroBatcher]:
+    """
+    Micro-batcher for a predictor's single predictions, configured from
+    MICROBATCH_WINDOW_MS and MICROBATCH_MAX_SIZE
+    
+    Returns:
+        MicroBatcher whose items are SMILES strings and whose keys are
+        endpoint tuples (None for all endpoints), or None when disabled
+    """
+    window_ms = float(os.getenv('MICROBATCH_WINDOW_MS', '0'))
+    if window_ms <= 0:
+        return None
+    max_batch_size = int(os.getenv('MICROBATCH_MAX_SIZE', '32'))
+    
+    def predict(endpoints, smiles_list):
+        return predictor.predict_batch(smiles_list, endpoints=list(endpoints) if endpoints else None)
+    
+    return MicroBatcher(predict, window_ms=window_ms, max_batch_size=max_batch_size)
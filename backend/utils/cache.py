@@ -2,244 +2,1371 @@
 """
 Prediction Caching System
 Caches toxicity predictions to improve performance by 100-1000x
+
+Entries are stored per endpoint: a request for a subset of endpoints is
+answered from any earlier result that covered them, and a request that
+adds endpoints only predicts the ones not cached yet.
+
+Keys come from a pluggable key function and include the model version.
+CachedPredictionWrapper uses the predictor's own cache_key() when it has
+one (the enhanced predictor keys by RDKit canonical SMILES, so equivalent
+spellings share an entry); otherwise the exact SMILES string is the key.
+
+Eviction is least-recently-used and expiry is swept incrementally, both
+in O(1) amortized time per operation (see benchmark_cache.py). With
+CACHE_ADMISSION=tinylfu a full cache admits a new molecule only if a
+count-min sketch of recent lookups says it is requested more often than
+the entry it would evict, so batch runs of one-off molecules do not
+flush the molecules users keep asking for (see benchmark_admission.py).
+
+For predictors with endpoint_prediction(), entries are compact records
+(a float32 probability per endpoint, see CompactRecordCodec): labels,
+confidence and summaries are rebuilt on read, so an entry takes a fraction
+of the memory of the result dict.
+
+With a SharedPredictionCache (utils/shared_cache.py) the wrapper adds a
+second tier shared by all worker processes: L1 misses are looked up there
+and fresh predictions are written to both. CacheSnapshotter
+(utils/cache_snapshot.py) saves the in-process cache to disk and restores
+it when a worker starts.
+
+Concurrent misses for the same molecule are coalesced (SingleFlight) so
+only one caller predicts, and with CACHE_EARLY_REFRESH_BETA > 0 popular
+entries are refreshed shortly before they expire (probabilistic early
+expiration), so they do not all expire at once under load.
 """
 
 import hashlib
-import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Callable, Hashable, Sequence
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 
+def exact_smiles_key(smiles: str) -> str:
+    """Default cache key: the SMILES string exactly as given ("" for non-strings)"""
+    return smiles if isinstance(smiles, str) else ""
+
+
+def _deep_sizeof(value: Any) -> int:
+    """
+    Approximate memory of a value and the values it contains, in bytes
+    
+    Dict keys are not counted (result keys are shared string literals),
+    nor are None and booleans (singletons).
+    """
+    if value is None or isinstance(value, bool):
+        return 0
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_sizeof(item) for item in value.values())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_sizeof(item) for item in value)
+    return size
+
+
+class DictRecordCodec:
+    """
+    Stores cache entries as given: (result fields, endpoint -> prediction)
+    
+    Used when the predictor cannot rebuild predictions from probabilities.
+    Records are never modified in place (merge returns a new one), so they
+    can be read outside the cache lock.
+    """
+    
+    signature = 'dict'
+    
+    def encode(self, fields: Dict[str, Any], endpoints: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return fields, endpoints
+    
+    def merge(self, record, endpoints: Dict[str, Any]):
+        """A record with endpoint predictions added to (or replacing) the record's"""
+        return record[0], {**record[1], **endpoints}
+    
+    def is_error(self, record) -> bool:
+        return 'error' in record[0]
+    
+    def decode(self, record, endpoints: Optional[List[str]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """(fields, endpoint -> prediction) for the wanted endpoints that are stored"""
+        fields, cached = record
+        if endpoints is None:
+            return fields, dict(cached)
+        return fields, {endpoint: cached[endpoint] for endpoint in endpoints if endpoint in cached}
+    
+    def size(self, record) -> int:
+        """
+        Approximate memory of a record in bytes; an upper bound, since
+        objects shared between results (label strings, endpoint info) are
+        counted for every record
+        """
+        return _deep_sizeof(record)
+    
+    def __eq__(self, other):
+        return isinstance(other, DictRecordCodec)
+    
+    def __hash__(self):
+        return hash(self.signature)
+
+
+class CompactRecord:
+    """A cache entry as stored by CompactRecordCodec"""
+    
+    __slots__ = ('names', 'values', 'probabilities', 'exact')
+    
+    def __init__(self, names: Tuple[str, ...], values: Tuple[Any, ...], probabilities: Optional[bytes],
+                 exact: Optional[Dict[str, Any]] = None):
+        self.names = names                  # result field names (shared between records)
+        self.values = values                # result field values, timestamp as an int
+        self.probabilities = probabilities  # float32 per endpoint, NaN if not cached
+        self.exact = exact                  # endpoint -> prediction kept as given (rare)
+    
+    def __getstate__(self):
+        return self.names, self.values, self.probabilities, self.exact
+    
+    def __setstate__(self, state):
+        self.names, self.values, self.probabilities, self.exact = state
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _encode_timestamp(value: Any) -> Any:
+    """An ISO timestamp as integer microseconds, if that round-trips exactly"""
+    try:
+        encoded = (datetime.fromisoformat(value) - _EPOCH) // _MICROSECOND
+    except (TypeError, ValueError):
+        return value
+    return encoded if _decode_timestamp(encoded) == value else value
+
+
+def _decode_timestamp(value: Any) -> Any:
+    if isinstance(value, int):
+        return (_EPOCH + value * _MICROSECOND).isoformat()
+    return value
+
+
+class CompactRecordCodec:
+    """
+    Stores each endpoint prediction as one float32 probability
+    
+    A record keeps the result fields (smiles, canonical SMILES, timestamp,
+    ...) as a tuple and the probabilities as a float32 vector in endpoint
+    order (NaN for endpoints not cached); labels, confidence and the other
+    per-endpoint fields are rebuilt on read with the predictor's
+    endpoint_prediction(), and summaries by the wrapper. Served
+    probabilities are therefore rounded to float32 (~7 significant digits).
+    
+    A prediction that would not be rebuilt identically (a probability on a
+    label threshold such as 0.6, where float32 rounding moves it across,
+    or a prediction the predictor did not build) is kept as given instead.
+    """
+    
+    def __init__(self, endpoints: Sequence[str], endpoint_prediction: Callable[[str, float], Dict[str, Any]]):
+        """
+        Args:
+            endpoints: Every endpoint the predictor supports, in a fixed order
+            endpoint_prediction: function(endpoint, probability) returning
+                the endpoint's prediction dict
+        """
+        self.endpoints = tuple(endpoints)
+        self.endpoint_prediction = endpoint_prediction
+        self.signature = 'compact:' + ','.join(self.endpoints)
+        self._index = {endpoint: i for i, endpoint in enumerate(self.endpoints)}
+        self._names: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+    
+    def encode(self, fields: Dict[str, Any], endpoints: Dict[str, Any]) -> CompactRecord:
+        names = tuple(fields)
+        names = self._names.setdefault(names, names)
+        values = tuple(
+            _encode_timestamp(value) if name == 'timestamp' else value for name, value in fields.items()
+        )
+        if 'error' in fields:
+            return CompactRecord(names, values, None)
+        probabilities = [math.nan] * len(self.endpoints)
+        return CompactRecord(names, values, *self._pack(probabilities, {}, endpoints))
+    
+    def _pack(self, probabilities: List[float], exact: Dict[str, Any],
+              endpoints: Dict[str, Any]) -> Tuple[bytes, Optional[Dict[str, Any]]]:
+        """Add endpoint predictions to probabilities (or exact); returns the record's (probabilities, exact)"""
+        rounded = np.array(
+            [prediction.get('probability', math.nan) for prediction in endpoints.values()], dtype=np.float32
+        ).tolist()
+        for (endpoint, prediction), probability in zip(endpoints.items(), rounded):
+            i = self._index.get(endpoint)
+            if (i is not None and probability == probability  # not NaN
+                    and self.endpoint_prediction(endpoint, probability) == dict(prediction, probability=probability)):
+                probabilities[i] = probability
+                exact.pop(endpoint, None)
+            else:
+                if i is not None:
+                    probabilities[i] = math.nan
+                exact[endpoint] = prediction
+        return np.array(probabilities, dtype=np.float32).tobytes(), exact or None
+    
+    def merge(self, record: CompactRecord, endpoints: Dict[str, Any]) -> CompactRecord:
+        """A record with endpoint predictions added to (or replacing) the record's"""
+        probabilities = np.frombuffer(record.probabilities, dtype=np.float32).tolist()
+        return CompactRecord(record.names, record.values, *self._pack(probabilities, dict(record.exact or {}), endpoints))
+    
+    def is_error(self, record: CompactRecord) -> bool:
+        return record.probabilities is None
+    
+    def decode(self, record: CompactRecord, endpoints: Optional[List[str]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """(fields, endpoint -> prediction) for the wanted endpoints that are stored"""
+        fields = {
+            name: _decode_timestamp(value) if name == 'timestamp' else value
+            for name, value in zip(record.names, record.values)
+        }
+        if record.probabilities is None:
+            return fields, {}
+        
+        probabilities = np.frombuffer(record.probabilities, dtype=np.float32).tolist()
+        exact = record.exact or {}
+        cached = {}
+        for endpoint in (self.endpoints + tuple(exact) if endpoints is None else endpoints):
+            i = self._index.get(endpoint)
+            if endpoint in exact:
+                cached[endpoint] = exact[endpoint]
+            elif i is not None and probabilities[i] == probabilities[i]:  # not NaN
+                cached[endpoint] = self.endpoint_prediction(endpoint, probabilities[i])
+        return fields, cached
+    
+    def size(self, record: CompactRecord) -> int:
+        """Approximate memory of a record in bytes (field names are shared)"""
+        size = sys.getsizeof(record) + sys.getsizeof(record.values)
+        values = {id(value): value for value in record.values if value is not None and not isinstance(value, bool)}
+        size += sum(sys.getsizeof(value) for value in values.values())
+        if record.probabilities is not None:
+            size += sys.getsizeof(record.probabilities)
+        if record.exact:
+            size += _deep_sizeof(record.exact)
+        return size
+    
+    def __eq__(self, other):
+        return (isinstance(other, CompactRecordCodec) and self.endpoints == other.endpoints
+                and self.endpoint_prediction == other.endpoint_prediction)
+    
+    def __hash__(self):
+        return hash(self.signature)
+
+
+# Memory of a cache entry besides its key and record: its slots in both
+# OrderedDicts, the (record, created, size) tuple and the float (measured
+# with tracemalloc)
+_ENTRY_OVERHEAD = 300
+
+# Entry ages are counted in this many buckets per TTL for the percentiles
+_AGE_BUCKETS = 64
+
+# Admission policies of PredictionCache
+ADMISSION_POLICIES = ('lru', 'tinylfu')
+
+
+class FrequencySketch:
+    """
+    Count-min sketch of how often cache keys were requested (for TinyLFU)
+    
+    Four rows of one-byte counters, each indexed by 32 bits of the key
+    (the cache's keys are MD5 hex digests, so their bits are already
+    uniform); a key's frequency is the smallest of its four counters, so
+    collisions can only overestimate it. Counters saturate at 15, and
+    after sample_size increments all of them are halved, so the estimates
+    follow recent popularity and molecules that stopped being requested
+    fade out. Each row has four counters per cache entry (rounded up to a
+    power of two), so at most 16 bytes per entry; narrower rows let the
+    many one-off keys of a batch inflate each other's estimates.
+    """
+    
+    MAX_COUNT = 15
+    
+    def __init__(self, capacity: int):
+        """
+        Initialize the sketch
+        
+        Args:
+            capacity: Number of entries of the cache it serves
+        """
+        self.width = 1 << max(4, (4 * max(capacity, 1) - 1).bit_length())
+        self._mask = self.width - 1
+        self._table = bytearray(self.width * 4)
+        self._counters = np.frombuffer(self._table, dtype=np.uint8)  # view for the halving
+        self.sample_size = 10 * self.width
+        self.additions = 0
+        self.resets = 0
+    
+    def _indexes(self, key: str) -> Tuple[int, int, int, int]:
+        """The key's counter in each row (32 bits of the key per row)"""
+        try:
+            bits = int(key, 16)
+        except ValueError:
+            bits = int(hashlib.md5(key.encode()).hexdigest(), 16)
+        width, mask = self.width, self._mask
+        return (bits & mask, width + (bits >> 32 & mask),
+                2 * width + (bits >> 64 & mask), 3 * width + (bits >> 96 & mask))
+    
+    def increment(self, key: str) -> None:
+        """Count one request for key"""
+        table = self._table
+        for index in self._indexes(key):
+            if table[index] < self.MAX_COUNT:
+                table[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._counters >>= 1
+            self.additions //= 2
+            self.resets += 1
+    
+    def frequency(self, key: str) -> int:
+        """Estimated recent requests for key (at most MAX_COUNT)"""
+        table = self._table
+        a, b, c, d = self._indexes(key)
+        return min(table[a], table[b], table[c], table[d])
+    
+    def clear(self) -> None:
+        """Forget every count"""
+        self._counters[:] = 0
+        self.additions = 0
+
+
 class PredictionCache:
-    """In-memory cache for toxicity predictions"""
+    """
+    In-memory cache for toxicity predictions
     
-    def __init__(self, ttl_seconds: int = 3600, max_size: int = 10000):
+    Each molecule's entry holds the result fields shared by all endpoints
+    (smiles, timestamp, ...) and its endpoint predictions, in the record
+    format of the codec: as given (DictRecordCodec) or as float32
+    probabilities (CompactRecordCodec, set up by CachedPredictionWrapper
+    for predictors that can rebuild predictions). The summary is not
+    stored; it depends on which endpoints were requested and is rebuilt
+    by CachedPredictionWrapper.
+    
+    self.cache is kept in least-recently-used order, so a full cache evicts
+    its first entry. Entries expire ttl seconds after they were created;
+    since the TTL is the same for all of them, a second OrderedDict in
+    creation order lets every set() drop the expired entries from its front
+    without scanning the cache.
+    
+    All methods are thread-safe (Flask runs with threaded=True); a single
+    lock covers the dict updates and counters of each operation.
+    
+    With admission='tinylfu' a full cache only admits a new molecule if it
+    has been requested more often recently than the entry it would evict
+    (estimated by a FrequencySketch of every lookup), so a long batch of
+    one-off molecules cannot flush the frequently requested ones; with
+    'lru' (the default) every new molecule is admitted.
+    
+    Statistics are maintained as entries come and go, so get_stats() costs
+    the same at any cache size: memory is the sum of per-entry estimates
+    (computed once, when an entry is stored), and entry ages come from the
+    sum of creation times and a histogram of them in ttl/64 buckets.
+    """
+    
+    def __init__(self, ttl_seconds: int = 3600, max_size: int = 10000,
+                 key_function: Optional[Callable[[str], str]] = None, model_version: str = '',
+                 early_refresh_beta: float = 0.0, codec=None, admission: str = 'lru'):
         """
         Initialize prediction cache
         
         Args:
             ttl_seconds: Time to live for cache entries (default 1 hour)
             max_size: Maximum number of cached predictions (default 10000)
+            key_function: Maps a SMILES string to its cache key (default:
+                the exact string)
+            model_version: Identifier of the models whose results are cached
+            early_refresh_beta: Probabilistic early refresh strength (0 =
+                disabled, 1 = standard; higher refreshes earlier)
+            codec: Record format of entries (default: DictRecordCodec)
+            admission: 'lru' to admit every new entry, or 'tinylfu' to admit
+                one into a full cache only if it is requested more often
+                than the least recently used entry
         """
-        self.cache: Dict[str, tuple] = {}
+        if admission not in ADMISSION_POLICIES:
+            raise ValueError(f"Unknown cache admission policy {admission!r} (expected one of {ADMISSION_POLICIES})")
+        self.cache: OrderedDict = OrderedDict()  # key -> (record, created, size), LRU first
+        self._created: OrderedDict = OrderedDict()  # key -> created, oldest first
         self.ttl = ttl_seconds
         self.max_size = max_size
+        self.key_function = key_function or exact_smiles_key
+        self.model_version = model_version
+        self.codec = codec or DictRecordCodec()
         self.hits = 0
         self.misses = 0
+        self.partial_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bytes = 0  # estimated memory of the entries
+        self._created_total = 0.0  # sum of the entries' creation times
+        self._age_histogram: Dict[int, List] = {}  # creation time bucket -> [entries, sum of creation times]
+        self._age_bucket_seconds = max(ttl_seconds / _AGE_BUCKETS, 1e-3)
+        self.early_refresh_beta = early_refresh_beta
+        self.early_refreshes = 0
+        self._compute_seconds = 0.0  # moving average of one prediction's cost
+        self.writes = 0  # entries stored or merged since creation (not reset by clear)
+        self.admission = admission
+        self._sketch = FrequencySketch(max_size) if admission == 'tinylfu' else None
+        self.rejections = 0  # new entries not admitted into the full cache
+        
+        # Guards the dicts and counters above. Held only for dict operations:
+        # keys are computed (and SMILES parsed) before taking it, and
+        # predictions never run under it.
+        self._lock = threading.Lock()
+    
+    def configure_keys(self, key_function: Optional[Callable[[str], str]], model_version: str = '') -> None:
+        """
+        Set the key function and model version
         
+        Existing entries are dropped when either changes, since their keys
+        were computed differently.
+        """
+        key_function = key_function or exact_smiles_key
+        with self._lock:
+            if key_function == self.key_function and model_version == self.model_version:
+                return
+            self.key_function = key_function
+            self.model_version = model_version
+        self.clear()
+    
+    def configure_records(self, codec) -> None:
+        """Set the record codec (existing entries are dropped when it changes)"""
+        codec = codec or DictRecordCodec()
+        with self._lock:
+            if codec == self.codec:
+                return
+            self.codec = codec
+        self.clear()
+    
     def _hash_smiles(self, smiles: str) -> str:
-        """Generate hash key for SMILES string"""
+        """
+        Generate hash key for SMILES string (normalized by the key function)
+        
+        Returns "" (not cacheable) for anything but a string, so None and
+        "None" (or 5 and "5") never share an entry.
+        """
+        if not isinstance(smiles, str):
+            return ""
         try:
-            normalized_smiles = smiles.strip().upper()
-            return hashlib.md5(normalized_smiles.encode()).hexdigest()
+            normalized_smiles = self.key_function(smiles)
+            if not isinstance(normalized_smiles, str) or not normalized_smiles:
+                return ""
+            return hashlib.md5(f"{self.model_version}\n{normalized_smiles}".encode()).hexdigest()
         except Exception as e:
             logger.error(f"Error hashing SMILES: {e}")
             return ""
     
-    def get(self, smiles: str) -> Optional[Dict[str, Any]]:
+    def key_for(self, smiles: str) -> str:
+        """Cache key of a SMILES string (same molecule and models -> same key)"""
+        return self._hash_smiles(smiles)
+    
+    def record_compute_time(self, seconds: float) -> None:
+        """Report how long one prediction took (drives the early refresh)"""
+        with self._lock:
+            if self._compute_seconds:
+                self._compute_seconds += 0.2 * (seconds - self._compute_seconds)
+            else:
+                self._compute_seconds = seconds
+    
+    def _refresh_early(self, age: float) -> bool:
         """
-        Get cached prediction result
+        Whether a hit should be treated as a miss to refresh the entry early
+        
+        XFetch: refresh when age - compute_time * beta * ln(U) >= ttl, U
+        uniform in (0, 1], so the probability rises steeply as the entry
+        nears expiry and a popular entry is refreshed by one caller before
+        it expires for everyone (lock held).
+        """
+        if self.early_refresh_beta <= 0 or not self._compute_seconds:
+            return False
+        gap = -self._compute_seconds * self.early_refresh_beta * math.log(1.0 - random.random())
+        return age + gap >= self.ttl
+    
+    def refresh_early(self, age: float) -> bool:
+        """
+        Early refresh decision for an entry of the given age found outside
+        this cache (e.g. in the shared L2 cache); counted like the early
+        refreshes of lookup()
+        """
+        with self._lock:
+            refresh = self._refresh_early(age)
+            self.early_refreshes += refresh
+            return refresh
+    
+    def lookup(self, smiles: str, endpoints: Optional[List[str]] = None,
+               allow_refresh: bool = False, key: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Look up the cached endpoints of a molecule
         
         Args:
             smiles: SMILES string to look up
-            
+            endpoints: Endpoints wanted (default: whatever is cached)
+            allow_refresh: Let the early refresh report a live entry as a
+                miss; the caller must then store its result with
+                set(..., replace=True)
+            key: Cache key of smiles if the caller already has it
+                (default: computed with key_for)
+        
         Returns:
-            Cached prediction result or None if not found/expired
+            (fields, endpoint_predictions): the cached result fields without
+            'endpoints' and 'summary' (the whole result for cached errors),
+            or None if not found/expired, and endpoint -> prediction for the
+            wanted endpoints that are cached
         """
-        try:
+        fields, cached, _ = self.probe(smiles, endpoints, allow_refresh, key)
+        return fields, cached
+    
+    def probe(self, smiles: str, endpoints: Optional[List[str]] = None,
+              allow_refresh: bool = True, key: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any], bool]:
+        """
+        lookup() that also tells whether a miss is an early refresh
+        
+        Returns:
+            (fields, endpoint_predictions, refreshing); refreshing is True
+            when a live entry was reported as a miss to be refreshed, so
+            other cache tiers (holding the same entry) should be skipped
+        """
+        if key is None:
             key = self._hash_smiles(smiles)
-            if not key or key not in self.cache:
-                self.misses += 1
-                return None
-            
-            result, timestamp = self.cache[key]
-            
-            # Check if cache entry has expired
-            if datetime.now() - timestamp > timedelta(seconds=self.ttl):
-                logger.info(f"Cache entry expired for SMILES: {smiles}")
-                del self.cache[key]
-                self.misses += 1
-                return None
+        try:
+            with self._lock:
+                if key and self._sketch is not None:
+                    self._sketch.increment(key)
+                item = self.cache.get(key) if key else None
+                if item is None:
+                    self.misses += 1
+                    return None, {}, False
+                
+                record, created, _ = item
+                
+                # Check if cache entry has expired
+                age = time.monotonic() - created
+                refresh = False
+                if age > self.ttl:
+                    self._remove(key)
+                    self.expirations += 1
+                    self.misses += 1
+                    expired = True
+                elif allow_refresh and not self.codec.is_error(record) and self._refresh_early(age):
+                    # Other callers keep hitting the entry until it is replaced
+                    self.misses += 1
+                    self.early_refreshes += 1
+                    expired = refresh = True
+                else:
+                    expired = False
+                    self.cache.move_to_end(key)
             
-            self.hits += 1
-            logger.info(f"✅ Cache HIT - SMILES: {smiles[:30]}... | Hit ratio: {self.get_hit_ratio():.1%}")
-            return result
+            if expired:
+                if refresh:
+                    logger.info(f"🔄 Cache early refresh - SMILES: {str(smiles)[:30]}...")
+                else:
+                    logger.info(f"Cache entry expired for SMILES: {str(smiles)[:30]}")
+                return None, {}, refresh
             
+            # Records are immutable, so they are decoded outside the lock
+            fields, cached = self.codec.decode(record, endpoints)
+            hit = 'error' in fields or endpoints is None or len(cached) == len(endpoints)
+            with self._lock:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    self.partial_hits += bool(cached)
+            if hit:
+                logger.info(f"✅ Cache HIT - SMILES: {str(smiles)[:30]}... | Hit ratio: {self.get_hit_ratio():.1%}")
+            return fields, cached, False
+        
         except Exception as e:
             logger.error(f"Error retrieving from cache: {e}")
-            self.misses += 1
+            with self._lock:
+                self.misses += 1
+            return None, {}, False
+    
+    def get(self, smiles: str, endpoints: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get cached prediction result
+        
+        Args:
+            smiles: SMILES string to look up
+            endpoints: Endpoints that must all be cached (default: any)
+        
+        Returns:
+            Cached prediction result (without 'summary') or None if not
+            found/expired or an endpoint is missing
+        """
+        fields, cached = self.lookup(smiles, endpoints)
+        if fields is None or 'error' in fields:
+            return fields
+        if endpoints is not None and len(cached) < len(endpoints):
             return None
+        return dict(fields, endpoints=cached)
     
-    def set(self, smiles: str, result: Dict[str, Any]) -> bool:
+    def set(self, smiles: str, result: Dict[str, Any], replace: bool = False, age: float = 0.0,
+            key: Optional[str] = None) -> bool:
         """
         Store prediction result in cache
         
+        Endpoint predictions are merged into the molecule's existing entry;
+        endpoints that failed (carry an 'error') are not cached.
+        
         Args:
             smiles: SMILES string (key)
             result: Prediction result to cache
-            
+            replace: Start a new entry (with a fresh TTL) instead of merging
+                into an existing one
+            age: Age of the result in seconds when it comes from another
+                cache tier, so it expires when the original does
+            key: Cache key of smiles if the caller already has it
+                (default: computed with key_for)
+        
         Returns:
-            True if successfully cached, False otherwise
+            True if successfully cached, False otherwise (also when the
+            admission policy keeps a new entry out of the full cache)
         """
         try:
-            # Check cache size and evict oldest if needed
-            if len(self.cache) >= self.max_size:
-                self._evict_oldest()
-            
-            key = self._hash_smiles(smiles)
+            if key is None:
+                key = self._hash_smiles(smiles)
             if not key:
                 return False
             
-            self.cache[key] = (result, datetime.now())
-            logger.info(f"📦 Cache SET - SMILES: {smiles[:30]}... | Cache size: {len(self.cache)}/{self.max_size}")
-            return True
+            endpoints = {
+                endpoint: prediction
+                for endpoint, prediction in (result.get('endpoints') or {}).items()
+                if 'error' not in prediction
+            }
+            fields = {k: v for k, v in result.items() if k not in ('endpoints', 'summary')}
+            codec = self.codec
+            record = codec.encode(fields, endpoints)
+            size = self._entry_size(key, record)
+            
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                
+                if codec is not self.codec:
+                    return False  # reconfigured meanwhile; the record is in the old format
+                
+                existing = self.cache.get(key)
+                if (existing is not None and not replace
+                        and 'error' not in fields and not codec.is_error(existing[0])):
+                    # Keep the entry's age, so earlier endpoints still expire on time.
+                    # Records are replaced rather than updated, so one taken
+                    # under the lock can be read after releasing it
+                    old_record, created, old_size = existing
+                    merged = codec.merge(old_record, endpoints)
+                    size = self._entry_size(key, merged)
+                    self.cache[key] = (merged, created, size)
+                    self.cache.move_to_end(key)
+                    self.bytes += size - old_size
+                    self.writes += 1
+                    return True
+                
+                # Check cache size and evict the least recently used entry if
+                # needed (if the admission policy lets the new entry in)
+                evicted = existing is None and len(self.cache) >= self.max_size
+                if evicted and not self._admit(key):
+                    self.rejections += 1
+                    return False
+                if evicted:
+                    self._evict_oldest()
+                
+                # An entry with an age is appended out of creation order;
+                # lookups still expire it on time, the sweep may free it late
+                if existing is not None:
+                    self._remove(key)
+                self._insert(key, record, now - age, size)
+                self.writes += 1
+                entries = len(self.cache)
             
+            if evicted:
+                logger.info(f"🗑️  Evicted least recently used cache entry. Cache size: {entries - 1}/{self.max_size}")
+            logger.info(f"📦 Cache SET - SMILES: {str(smiles)[:30]}... | Cache size: {entries}/{self.max_size}")
+            return True
+        
         except Exception as e:
             logger.error(f"Error storing in cache: {e}")
             return False
     
+    def _entry_size(self, key: str, record) -> int:
+        """Estimated memory of an entry in bytes"""
+        return sys.getsizeof(key) + self.codec.size(record) + _ENTRY_OVERHEAD
+    
+    def _insert(self, key: str, record, created: float, size: int) -> None:
+        """Add a new entry as the most recently used and newest (lock held)"""
+        self.cache[key] = (record, created, size)
+        self._created[key] = created
+        self._account(created, size, 1)
+    
+    def _remove(self, key: str) -> None:
+        """Remove an entry (lock held)"""
+        _, created, size = self.cache.pop(key)
+        del self._created[key]
+        self._account(created, size, -1)
+    
+    def _account(self, created: float, size: int, sign: int) -> None:
+        """Add (sign=1) or subtract (sign=-1) an entry in the memory and age statistics (lock held)"""
+        self.bytes += sign * size
+        self._created_total += sign * created
+        bucket = int(created // self._age_bucket_seconds)
+        counts = self._age_histogram.get(bucket)
+        if counts is None:
+            counts = self._age_histogram[bucket] = [0, 0.0]
+        counts[0] += sign
+        counts[1] += sign * created
+        if not counts[0]:
+            del self._age_histogram[bucket]
+    
+    def _expire(self, now: float) -> None:
+        """Drop the entries that have expired (they are at the front of _created; lock held)"""
+        deadline = now - self.ttl
+        while self._created:
+            key, created = next(iter(self._created.items()))
+            if created >= deadline:
+                break
+            self._remove(key)
+            self.expirations += 1
+    
+    def purge_expired(self) -> None:
+        """Remove every expired entry now instead of on the next set()"""
+        with self._lock:
+            self._expire(time.monotonic())
+    
+    def _admit(self, key: str) -> bool:
+        """
+        Whether a new entry may replace the least recently used one in a
+        full cache (lock held): always with LRU; with TinyLFU only if its
+        key was requested more often (ties keep the cached entry)
+        """
+        if self._sketch is None or not self.cache:
+            return True
+        victim = next(iter(self.cache))
+        return self._sketch.frequency(key) > self._sketch.frequency(victim)
+    
     def _evict_oldest(self):
-        """Remove oldest cache entry when max size reached"""
-        try:
-            if not self.cache:
-                return
-            
-            oldest_key = min(self.cache.keys(), 
-                           key=lambda k: self.cache[k][1])
-            del self.cache[oldest_key]
-            logger.info(f"🗑️  Evicted oldest cache entry. Cache size: {len(self.cache)}/{self.max_size}")
+        """Remove the least recently used cache entry when max size reached (lock held)"""
+        if not self.cache:
+            return
+        
+        self._remove(next(iter(self.cache)))
+        self.evictions += 1
+    
+    def export_entries(self) -> List[Tuple[str, Any, float]]:
+        """
+        Live entries as (key, record, age_seconds), least recently used
+        first (for CacheSnapshotter); the records are shared, not copied
+        """
+        with self._lock:
+            now = time.monotonic()
+            items = list(self.cache.items())
+        return [(key, record, now - created) for key, (record, created, _) in items if now - created <= self.ttl]
+    
+    def import_entries(self, entries: List[Tuple[str, Any, float]]) -> int:
+        """
+        Add entries from export_entries() (e.g. a snapshot taken by another
+        process with the same model version and codec)
+        
+        Expired entries and keys already cached are skipped; when the cache
+        cannot hold them all, the most recently used are kept. Ages carry
+        over, so imported entries expire when the originals would have.
+        
+        Returns:
+            Number of entries added
+        """
+        entries = [(key, record, age, self._entry_size(key, record)) for key, record, age in entries]
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            entries = [entry for entry in entries if entry[2] <= self.ttl and entry[0] not in self.cache]
+            room = self.max_size - len(self.cache)
+            entries = entries[max(0, len(entries) - room):] if room > 0 else []
             
-        except Exception as e:
-            logger.error(f"Error evicting cache: {e}")
+            # Imported entries are older than the ones already cached: they go
+            # in front, in their own LRU order, and _created is rebuilt
+            cached = list(self.cache.items())
+            self.cache.clear()
+            for key, record, age, size in entries:
+                self.cache[key] = (record, now - age, size)
+                self._account(now - age, size, 1)
+            self.cache.update(cached)
+            self._created = OrderedDict(
+                sorted(((key, created) for key, (_, created, _) in self.cache.items()), key=lambda item: item[1])
+            )
+        if entries:
+            logger.info(f"📥 Cache import - {len(entries)} entries | Cache size: {len(self.cache)}/{self.max_size}")
+        return len(entries)
     
     def clear(self) -> None:
         """Clear entire cache"""
         try:
-            old_size = len(self.cache)
-            self.cache.clear()
-            self.hits = 0
-            self.misses = 0
+            with self._lock:
+                old_size = len(self.cache)
+                self.cache.clear()
+                self._created.clear()
+                self.bytes = 0
+                self._created_total = 0.0
+                self._age_histogram.clear()
+                self.hits = 0
+                self.misses = 0
+                self.partial_hits = 0
+                self.evictions = 0
+                self.expirations = 0
+                self.early_refreshes = 0
+                self.rejections = 0
+                if self._sketch is not None:
+                    self._sketch.clear()
             logger.info(f"🗑️  Cache cleared. Removed {old_size} entries")
         except Exception as e:
             logger.error(f"Error clearing cache: {e}")
     
+    def get_hit_ratio(self) -> float:
+        """Fraction of lookups answered entirely from the cache"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total_requests = hits + misses
+        return hits / total_requests if total_requests > 0 else 0
+    
+    def _entry_ages(self, now: float) -> Dict[str, float]:
+        """Mean and percentile entry age in seconds (lock held; percentiles within ttl/64)"""
+        if not self.cache:
+            return {'mean': 0.0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0}
+        count = len(self.cache)
+        ages = {'mean': round(max(0.0, now - self._created_total / count), 3)}
+        
+        # Walk the histogram from the newest bucket (youngest entries); a
+        # percentile falling in a bucket is the mean age of its entries
+        seen = 0
+        percentiles = iter((('p50', 0.5), ('p90', 0.9), ('p99', 0.99)))
+        name, fraction = next(percentiles)
+        for _, (entries, created_total) in sorted(self._age_histogram.items(), reverse=True):
+            seen += entries
+            while name is not None and seen >= fraction * count:
+                ages[name] = round(max(0.0, now - created_total / entries), 3)
+                name, fraction = next(percentiles, (None, None))
+        return ages
+    
     def get_stats(self) -> Dict[str, Any]:
-        """Get cache statistics"""
-        total_requests = self.hits + self.misses
-        hit_ratio = self.hits / total_requests if total_requests > 0 else 0
+        """
+        Get cache statistics (a consistent snapshot of the counters)
+        
+        Every value is maintained incrementally, so this is cheap at any
+        cache size.
+        """
+        with self._lock:
+            size = len(self.cache)
+            hits, misses, partial_hits, evictions = self.hits, self.misses, self.partial_hits, self.evictions
+            early_refreshes, expirations, memory = self.early_refreshes, self.expirations, self.bytes
+            rejections = self.rejections
+            ages = self._entry_ages(time.monotonic())
+        total_requests = hits + misses
+        hit_ratio = hits / total_requests if total_requests > 0 else 0
         
         return {
-            'cache_size': len(self.cache),
+            'cache_size': size,
             'max_size': self.max_size,
-            'cache_hits': self.hits,
-            'cache_misses': self.misses,
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'partial_hits': partial_hits,
+            'evictions': evictions,
+            'expirations': expirations,
+            'early_refreshes': early_refreshes,
+            'admission': self.admission,
+            'admission_rejections': rejections,
             'total_requests': total_requests,
             'hit_ratio': f"{hit_ratio:.1%}",
             'ttl_seconds': self.ttl,
-            'usage_percentage': f"{(len(self.cache) / self.max_size * 100):.1f}%"
+            'early_refresh_beta': self.early_refresh_beta,
+            'key_function': getattr(self.key_function, '__name__', repr(self.key_function)),
+            'model_version': self.model_version,
+            'record_format': self.codec.signature.split(':')[0],
+            'usage_percentage': f"{(size / self.max_size * 100):.1f}%",
+            'memory_bytes': memory,
+            'entry_age_seconds': ages
         }
     
     def get_cache_size_mb(self) -> float:
-        """Estimate cache size in MB"""
+        """Estimated cache memory in MB (kept up to date as entries come and go)"""
+        with self._lock:
+            return self.bytes / (1024 * 1024)
+
+
+class NegativeCache:
+    """
+    Short-lived cache of error results for invalid or unparseable SMILES
+    
+    Only results the predictor marks as invalid input ('invalid_smiles')
+    go here; other errors (e.g. models failing to load) are transient and
+    are not cached at all. Kept apart from PredictionCache, so junk inputs
+    (OCR garbage, retry loops) neither take room in it nor evict good
+    entries, and keyed by the exact input string, so a repeated bad input
+    is rejected without being parsed again. Entries expire ttl seconds
+    after they were stored and the oldest go first beyond max_size; one
+    OrderedDict in insertion order makes both O(1).
+    """
+    
+    def __init__(self, ttl_seconds: int = 300, max_size: int = 10000):
+        """
+        Initialize negative cache
+        
+        Args:
+            ttl_seconds: Time to live for error results (default 5 minutes)
+            max_size: Maximum number of cached error results
+        """
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()  # smiles -> (result, created), oldest first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, smiles: str) -> Optional[Dict[str, Any]]:
+        """Cached error result for a SMILES string, or None"""
+        if not isinstance(smiles, str):
+            return None
+        with self._lock:
+            item = self._entries.get(smiles)
+            if item is not None and time.monotonic() - item[1] > self.ttl:
+                del self._entries[smiles]
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            # Hits are not logged: bots repeating bad input would flood the log
+            self.hits += 1
+            return item[0]
+    
+    def set(self, smiles: str, result: Dict[str, Any]) -> None:
+        """Store an error result (with a fresh TTL)"""
+        if not isinstance(smiles, str):
+            return
+        with self._lock:
+            now = time.monotonic()
+            deadline = now - self.ttl
+            while self._entries:
+                key, (_, created) = next(iter(self._entries.items()))
+                if created >= deadline:
+                    break
+                del self._entries[key]
+                self.expirations += 1
+            
+            self._entries.pop(smiles, None)
+            while len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._entries[smiles] = (result, now)
+    
+    def clear(self) -> None:
+        """Remove every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Entry count and counters"""
+        with self._lock:
+            size, hits, misses = len(self._entries), self.hits, self.misses
+            evictions, expirations = self.evictions, self.expirations
+        total_requests = hits + misses
+        return {
+            'cache_size': size,
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'hit_ratio': f"{(hits / total_requests if total_requests else 0):.1%}",
+            'evictions': evictions,
+            'expirations': expirations
+        }
+
+
+class SingleFlight:
+    """
+    Per-key in-flight deduplication
+    
+    do(key, function) runs function for the first caller of a key; callers
+    that arrive with the same key while it runs wait for it and get the
+    same result (or exception) instead of computing it again.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.executions = 0
+        self.shared = 0
+    
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """Run function, or wait for the call already running for key"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.executions += 1
+            else:
+                self.shared += 1
+        
+        if not leader:
+            return future.result()
+        
         try:
-            total_size = 0
-            for key, (result, _) in self.cache.items():
-                total_size += len(key)
-                if isinstance(result, dict):
-                    total_size += len(json.dumps(result).encode())
-            return total_size / (1024 * 1024)
-        except Exception:
-            return 0.0
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Calls run, callers that shared a running call, and calls in flight"""
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'shared': self.shared,
+                'in_flight': len(self._calls)
+            }
 
 
 class CachedPredictionWrapper:
     """Wrapper to automatically cache predictions"""
     
-    def __init__(self, predictor, cache: Optional[PredictionCache] = None):
+    def __init__(self, predictor, cache: Optional[PredictionCache] = None, batcher=None,
+                 shared_cache=None, negative_cache: Optional[NegativeCache] = None):
         """
         Initialize wrapper
         
         Args:
             predictor: ML predictor instance
             cache: PredictionCache instance (creates new if not provided)
+            batcher: Optional MicroBatcher (utils/batcher.py) that runs cache
+                misses of concurrent predict_single calls as one batch
+            shared_cache: Optional SharedPredictionCache (utils/shared_cache.py)
+                used as an L2 tier shared by all worker processes
+            negative_cache: NegativeCache for invalid-input results (creates
+                new if not provided); no error result is stored in the other
+                tiers
+        
+        The cache is keyed with the predictor's cache_key() and
+        model_version when it provides them, and stores compact records
+        (probabilities only) when it can rebuild predictions with
+        endpoint_prediction().
         """
         self.predictor = predictor
         self.cache = cache or PredictionCache()
+        self.batcher = batcher
+        self.shared_cache = shared_cache
+        self.negative_cache = negative_cache if negative_cache is not None else NegativeCache()
+        self.negative_cache.clear()  # errors of the previous predictor
+        self.flights = SingleFlight()
+        self._batch_lock = threading.Lock()
+        self.batches = 0
+        self.batch_molecules = 0
+        self.batch_unique = 0  # distinct molecules of those batches
+        self.cache.configure_keys(
+            getattr(predictor, 'cache_key', None), getattr(predictor, 'model_version', '')
+        )
+        if hasattr(predictor, 'endpoint_prediction'):
+            self.cache.configure_records(CompactRecordCodec(predictor.endpoints, predictor.endpoint_prediction))
     
-    def predict_single(self, smiles: str) -> Dict[str, Any]:
+    @staticmethod
+    def _cached_error(fields: Dict[str, Any], smiles: str) -> Dict[str, Any]:
+        """A cached error result, reported for the SMILES as this caller wrote it"""
+        if 'original_smiles' in fields:
+            return dict(fields, original_smiles=smiles)
+        return fields
+    
+    def _assemble(self, fields: Dict[str, Any], cached: Dict[str, Any], endpoints: List[str]) -> Dict[str, Any]:
+        """Build a result for the requested endpoints from cached predictions"""
+        predictions = {endpoint: cached[endpoint] for endpoint in endpoints if endpoint in cached}
+        result = dict(fields)
+        result['endpoints'] = predictions
+        result['summary'] = self.predictor.summarize(predictions, len(endpoints))
+        return result
+    
+    def _lookup(self, smiles_list: List[str], keys: List[str],
+                requested: List[str]) -> List[Tuple[Optional[Dict[str, Any]], Dict[str, Any]]]:
+        """
+        Look molecules up in the in-process cache (L1), then the ones L1
+        cannot answer in the shared cache (L2); L2 hits are copied into L1
+        
+        Args:
+            smiles_list: SMILES strings to look up
+            keys: Their cache keys (PredictionCache.key_for)
+            requested: Endpoints wanted
+        
+        Returns:
+            (fields, cached endpoint predictions) per molecule, as
+            PredictionCache.lookup
+        """
+        if self.shared_cache is not None and self.shared_cache.generation_changed():
+            self.cache.clear()  # another worker cleared the shared cache
+            self.negative_cache.clear()
+        
+        lookups = [self.cache.probe(smiles, requested, key=key) for smiles, key in zip(smiles_list, keys)]
+        if self.shared_cache is None:
+            return [(fields, cached) for fields, cached, _ in lookups]
+        
+        # L1 misses and partial hits, except entries L1 is refreshing early
+        pending = {
+            i: keys[i]
+            for i, (fields, cached, refreshing) in enumerate(lookups)
+            if not refreshing and (fields is None or ('error' not in fields and len(cached) < len(requested)))
+        }
+        shared = self.shared_cache.get_many(pending.values()) if pending else {}
+        
+        results = []
+        for i, (fields, cached, _) in enumerate(lookups):
+            entry = shared.get(pending.get(i))
+            if entry is not None:
+                shared_fields, shared_endpoints, age = entry
+                if 'error' in shared_fields:
+                    entry = None  # errors belong in the negative cache
+                elif fields is None and self.cache.refresh_early(age):
+                    entry = None  # predicted again and replaced in both tiers
+            if entry is not None:
+                self.cache.set(smiles_list[i], dict(shared_fields, endpoints=shared_endpoints), age=age, key=keys[i])
+                fields = fields if fields is not None else shared_fields
+                cached = {
+                    **{endpoint: shared_endpoints[endpoint] for endpoint in requested if endpoint in shared_endpoints},
+                    **cached
+                }
+            results.append((fields, cached))
+        return results
+    
+    def _predict_and_store(self, smiles: str, key: str, endpoints: Optional[List[str]], replace: bool) -> Dict[str, Any]:
+        """Predict one molecule (through the batcher if enabled) and cache the result under key"""
+        start = time.perf_counter()
+        if self.batcher is not None:
+            # Batched with other molecules wanting the same endpoints
+            group = tuple(endpoints) if endpoints else None
+            result = self.batcher.run(smiles, key=group)
+        else:
+            result = self.predictor.predict_single(smiles, endpoints=endpoints)
+        self.cache.record_compute_time(time.perf_counter() - start)
+        
+        if 'error' in result:
+            if result.get('invalid_smiles'):
+                self.negative_cache.set(smiles, result)
+            return result
+        self.cache.set(smiles, result, replace=replace, key=key)
+        if self.shared_cache is not None:
+            self.shared_cache.set(key, result, replace=replace)
+        return result
+    
+    def predict_single(self, smiles: str, endpoints: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Predict with caching
         
+        Concurrent misses for the same molecule and endpoints wait for a
+        single prediction instead of each running their own.
+        
         Args:
             smiles: SMILES string to predict
-            
+            endpoints: Optional endpoint subset (default: all endpoints)
+        
         Returns:
-            Prediction result (from cache or fresh)
+            Prediction result (from cache or fresh); endpoints that are
+            cached are not predicted again
         """
-        # Try to get from cache first
-        cached_result = self.cache.get(smiles)
-        if cached_result is not None:
-            return cached_result
+        requested = self.predictor.resolve_endpoints(endpoints)
         
-        # Get fresh prediction
-        result = self.predictor.predict_single(smiles)
+        # Known-bad input: rejected without parsing it again
+        error = self.negative_cache.get(smiles)
+        if error is not None:
+            return self._cached_error(error, smiles)
         
-        # Store in cache
-        self.cache.set(smiles, result)
+        # Try to get from cache first (the key is computed once per request:
+        # for RDKit predictors it means parsing the SMILES)
+        key = self.cache.key_for(smiles)
+        [(fields, cached)] = self._lookup([smiles], [key], requested)
+        if fields is not None and 'error' in fields:
+            return self._cached_error(fields, smiles)
+        missing = [endpoint for endpoint in requested if endpoint not in cached]
+        if not missing:
+            return self._assemble(fields, cached, requested)
         
-        return result
+        # Get fresh prediction (only for the endpoints not cached yet) and
+        # store it; a result predicted without cached fields starts a new entry
+        predict_endpoints = missing if cached else endpoints
+        predict = lambda: self._predict_and_store(smiles, key, predict_endpoints, replace=fields is None)
+        # Inputs without a cache key (non-strings) share no entry, nor a prediction
+        result = self.flights.do(('predict', key, tuple(missing)), predict) if key else predict()
+        
+        if 'error' in result:
+            return self._cached_error(result, smiles)
+        if not cached:
+            return result
+        return self._assemble(fields, {**cached, **result['endpoints']}, requested)
+    
+    def deduplicate(self, smiles: str, tag: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Run function once for concurrent callers with the same molecule and
+        tag (e.g. the AI analysis of a prediction); the others wait for it
+        and share its result
+        """
+        return self.flights.do((tag, self.cache.key_for(smiles)), function)
     
-    def predict_batch(self, smiles_list: list) -> list:
+    def predict_batch(self, smiles_list: list, endpoints: Optional[List[str]] = None) -> list:
         """
         Batch predict with caching
         
+        Duplicates (the same string, or spellings of the same molecule, i.e.
+        the same cache key) are looked up and predicted once and their
+        result is copied to every position.
+        
         Args:
             smiles_list: List of SMILES strings
-            
+            endpoints: Optional endpoint subset (default: all endpoints)
+        
         Returns:
-            List of prediction results
+            List of prediction results, in input order
         """
-        results = []
-        uncached_smiles = []
-        uncached_indices = []
+        requested = self.predictor.resolve_endpoints(endpoints)
+        results = [None] * len(smiles_list)
+        uncached = {}  # index -> (fields, cached endpoint predictions)
         
-        # Check cache for each SMILES
+        # Collapse duplicates: identical strings first, then strings with the
+        # same cache key; known-bad inputs are answered by the negative cache
+        spellings: Dict[Hashable, List[int]] = {}  # SMILES string -> input positions
         for i, smiles in enumerate(smiles_list):
-            cached = self.cache.get(smiles)
-            if cached is not None:
-                results.append((i, cached))
+            spellings.setdefault(smiles if isinstance(smiles, str) else i, []).append(i)
+        molecules: Dict[Hashable, List[int]] = {}  # cache key -> input positions
+        keys: Dict[int, str] = {}  # first position of a spelling -> its cache key
+        rejected = 0
+        for spelling, positions in spellings.items():
+            smiles = smiles_list[positions[0]]
+            error = self.negative_cache.get(smiles)
+            if error is not None:
+                for i in positions:
+                    results[i] = self._cached_error(error, smiles)
+                rejected += 1
             else:
-                uncached_smiles.append(smiles)
-                uncached_indices.append(i)
+                keys[positions[0]] = self.cache.key_for(smiles)
+                molecules.setdefault(keys[positions[0]] or spelling, []).extend(positions)
+        pending = [positions[0] for positions in molecules.values()]
+        self._record_batch(len(smiles_list), len(molecules) + rejected)
         
-        # Predict uncached molecules
-        if uncached_smiles:
-            fresh_results = self.predictor.predict_batch(uncached_smiles)
+        # Check cache for each molecule
+        lookups = self._lookup([smiles_list[i] for i in pending], [keys[i] for i in pending], requested) if pending else []
+        for i, (fields, cached) in zip(pending, lookups):
+            smiles = smiles_list[i]
+            if fields is not None and 'error' in fields:
+                results[i] = self._cached_error(fields, smiles)
+            elif fields is not None and len(cached) == len(requested):
+                results[i] = self._assemble(fields, cached, requested)
+            else:
+                uncached[i] = (fields, cached)
+        
+        # Predict uncached molecules, for every endpoint any of them lacks
+        if uncached:
+            partial = any(cached for _, cached in uncached.values())
+            missing = [
+                endpoint for endpoint in requested
+                if any(endpoint not in cached for _, cached in uncached.values())
+            ]
+            start = time.perf_counter()
+            fresh_results = self.predictor.predict_batch(
+                [smiles_list[i] for i in uncached], endpoints=missing if partial else endpoints
+            )
+            self.cache.record_compute_time((time.perf_counter() - start) / len(uncached))
             
             # Cache and store results
-            for j, smiles in enumerate(uncached_smiles):
-                result = fresh_results[j]
-                self.cache.set(smiles, result)
-                results.append((uncached_indices[j], result))
+            for i, result in zip(uncached, fresh_results):
+                fields, cached = uncached[i]
+                if 'error' in result:
+                    if result.get('invalid_smiles'):
+                        self.negative_cache.set(smiles_list[i], result)
+                    results[i] = result
+                    continue
+                self.cache.set(smiles_list[i], result, replace=fields is None, key=keys[i])
+                if not cached:
+                    results[i] = result
+                else:
+                    results[i] = self._assemble(fields, {**cached, **result['endpoints']}, requested)
+            
+            if self.shared_cache is not None:
+                for replace in (True, False):
+                    items = [
+                        (keys[i], result)
+                        for i, result in zip(uncached, fresh_results)
+                        if 'error' not in result and (uncached[i][0] is None) == replace
+                    ]
+                    if items:
+                        self.shared_cache.set_many(items, replace=replace)
+        
+        # Copy each molecule's result to its duplicates
+        for positions in molecules.values():
+            result = results[positions[0]]
+            for i in positions[1:]:
+                results[i] = self._cached_error(result, smiles_list[i]) if 'error' in result else dict(result)
         
-        # Sort results by original index
-        results.sort(key=lambda x: x[0])
-        return [r[1] for r in results]
+        return results
+    
+    def _record_batch(self, molecules: int, unique: int) -> None:
+        with self._batch_lock:
+            self.batches += 1
+            self.batch_molecules += molecules
+            self.batch_unique += unique
+    
+    def get_batch_stats(self) -> Dict[str, Any]:
+        """Batches and molecules seen by predict_batch, and the share of duplicates"""
+        with self._batch_lock:
+            batches, molecules, unique = self.batches, self.batch_molecules, self.batch_unique
+        return {
+            'batches': batches,
+            'molecules': molecules,
+            'unique_molecules': unique,
+            'duplicates': molecules - unique,
+            'dedup_ratio': f"{((molecules - unique) / molecules if molecules else 0):.1%}"
+        }
     
     def get_cache_stats(self) -> Dict[str, Any]:
-        """Get cache statistics"""
-        return self.cache.get_stats()
+        """
+        Get cache statistics (L1, plus the shared L2 tier under 'l2', the
+        negative cache under 'negative' and batch deduplication under 'batch')
+        """
+        stats = self.cache.get_stats()
+        if self.shared_cache is not None:
+            stats['l2'] = self.shared_cache.get_stats()
+        stats['negative'] = self.negative_cache.get_stats()
+        stats['batch'] = self.get_batch_stats()
+        return stats
     
     def clear_cache(self) -> None:
-        """Clear cache"""
+        """Clear cache (both tiers and the negative cache; other workers drop their L1 too)"""
+        if self.shared_cache is not None:
+            self.shared_cache.clear()
         self.cache.clear()
+        self.negative_cache.clear()
 
 
 # Global cache instance
 prediction_cache = PredictionCache(
-    ttl_seconds=3600,  # 1 hour TTL
-    max_size=10000      # Max 10000 predictions
+    ttl_seconds=int(os.getenv('CACHE_TTL', '3600')),       # 1 hour TTL
+    max_size=int(os.getenv('CACHE_MAX_SIZE', '10000')),    # Max 10000 predictions
+    early_refresh_beta=float(os.getenv('CACHE_EARLY_REFRESH_BETA', '0')),
+    admission=os.getenv('CACHE_ADMISSION', 'lru')                  # or 'tinylfu'
+)
+
+# Global negative cache (error results for invalid SMILES)
+negative_cache = NegativeCache(
+    ttl_seconds=int(os.getenv('NEGATIVE_CACHE_TTL', '300')),         # 5 minute TTL
+    max_size=int(os.getenv('NEGATIVE_CACHE_MAX_SIZE', '10000'))
 )
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Prediction Cache Snapshots
+==========================
+Warm restarts for the in-process PredictionCache.
+
+Gunicorn recycles workers (max_requests) and deploys restart all of them;
+each time, the new process starts with an empty L1 cache. CacheSnapshotter
+writes the cache to a compact binary file every interval_seconds (and when
+the process exits) and loads it when the worker starts, so cached
+molecules are answered from memory again right away.
+
+File layout:
+    MAGIC, format version (1 byte), header length (4 bytes, big endian)
+    header: JSON with the model version, key function, record format, save
+            time and entry count
+    body:   zlib-compressed pickle of [(key, record, age_seconds), ...]
+
+Snapshots are tagged with the cache's model version and record codec: a
+snapshot written for other models (or in another format) is ignored
+without reading its body, and entries keep their age, so they expire on
+the original TTL.
+Workers share one file and each replaces it atomically; the last writer
+wins, which is fine since every worker sees roughly the same hot set (and
+the shared L2 cache holds the rest).
+
+Configuration (see .env.example): CACHE_SNAPSHOT_SECONDS and
+CACHE_SNAPSHOT_PATH.
+"""
+
+import atexit
+import json
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from typing import Any, Dict, Optional
+import logging
+
+from .cache import PredictionCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'prediction_cache.snapshot'
+)
+
+MAGIC = b'MTXCACHE'
+FORMAT_VERSION = 2
+_PREAMBLE = struct.Struct('>BI')  # format version, header length
+
+
+class CacheSnapshotter:
+    """Periodically saves a PredictionCache to disk and restores it on start"""
+    
+    def __init__(self, cache: PredictionCache, path: str = DEFAULT_SNAPSHOT_PATH,
+                 interval_seconds: float = 60.0):
+        """
+        Initialize the snapshotter (the thread starts with start())
+        
+        Args:
+            cache: PredictionCache to save and restore
+            path: Snapshot file
+            interval_seconds: Time between snapshots; a snapshot is only
+                written when the cache changed since the last one
+        """
+        self.cache = cache
+        self.path = path
+        self.interval = interval_seconds
+        self.saves = 0
+        self.loaded = 0
+        self.last_saved_entries = 0
+        self.last_save_seconds = 0.0
+        self._saved_writes = -1  # cache.writes at the last save
+        self._save_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = False
+        _snapshotters.add(self)
+    
+    def load(self) -> int:
+        """
+        Add the entries of the snapshot file to the cache
+        
+        Returns:
+            Number of entries added (0 when there is no usable snapshot)
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    logger.warning(f"Ignoring cache snapshot {self.path}: not a snapshot file")
+                    return 0
+                version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+                if version != FORMAT_VERSION:
+                    logger.info(f"Ignoring cache snapshot {self.path}: format {version}")
+                    return 0
+                header = json.loads(f.read(header_length))
+                if header.get('model_version') != self.cache.model_version:
+                    logger.info(f"Ignoring cache snapshot {self.path}: written for model version "
+                                f"{header.get('model_version')!r}")
+                    return 0
+                if header.get('key_function') != self._key_function_name():
+                    logger.info(f"Ignoring cache snapshot {self.path}: different cache keys")
+                    return 0
+                if header.get('record_format') != self.cache.codec.signature:
+                    logger.info(f"Ignoring cache snapshot {self.path}: different record format")
+                    return 0
+                entries = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError, EOFError, struct.error, zlib.error, pickle.UnpicklingError) as e:
+            logger.error(f"Error reading cache snapshot {self.path}: {e}")
+            return 0
+        
+        elapsed = max(0.0, time.time() - header['saved_at'])
+        loaded = self.cache.import_entries([(key, entry, age + elapsed) for key, entry, age in entries])
+        self.loaded += loaded
+        return loaded
+    
+    def save(self, force: bool = False) -> int:
+        """
+        Write the cache to the snapshot file (atomically replacing it)
+        
+        Args:
+            force: Write even if the cache did not change since the last save
+        
+        Returns:
+            Number of entries written (0 when skipped or on error)
+        """
+        with self._save_lock:
+            writes = self.cache.writes
+            if writes == self._saved_writes and not force:
+                return 0
+            start = time.perf_counter()
+            entries = self.cache.export_entries()
+            header = json.dumps({
+                'model_version': self.cache.model_version,
+                'key_function': self._key_function_name(),
+                'record_format': self.cache.codec.signature,
+                'saved_at': time.time(),
+                'entries': len(entries)
+            }).encode()
+            
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                body = zlib.compress(pickle.dumps(entries, protocol=pickle.HIGHEST_PROTOCOL), 1)
+                os.makedirs(directory, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.cache-snapshot-')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(MAGIC + _PREAMBLE.pack(FORMAT_VERSION, len(header)) + header + body)
+                    os.replace(temp_path, self.path)
+                except BaseException:
+                    os.unlink(temp_path)
+                    raise
+            except (OSError, pickle.PicklingError, TypeError) as e:
+                logger.error(f"Error writing cache snapshot {self.path}: {e}")
+                return 0
+            
+            self._saved_writes = writes
+            self.saves += 1
+            self.last_saved_entries = len(entries)
+            self.last_save_seconds = time.perf_counter() - start
+        logger.info(f"💾 Cache snapshot - {len(entries)} entries in {self.last_save_seconds * 1000:.0f} ms")
+        return len(entries)
+    
+    def start(self) -> int:
+        """
+        Load the snapshot, then save periodically (and at exit)
+        
+        Returns:
+            Number of entries loaded
+        """
+        loaded = self.load()
+        self._saved_writes = self.cache.writes  # nothing new to save yet
+        if not self._started:
+            atexit.register(self.save)
+        self._started = True
+        self._start_thread()
+        return loaded
+    
+    def stop(self) -> None:
+        """Stop the periodic snapshots and write a final one"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._started = False
+        self.save()
+    
+    def _start_thread(self):
+        if self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='cache-snapshot', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"Cache snapshot failed: {e}")
+    
+    def _key_function_name(self) -> str:
+        return getattr(self.cache.key_function, '__qualname__', repr(self.cache.key_function))
+    
+    def _after_fork(self):
+        """Forked children save their own cache (inherited entries are not new)"""
+        self._save_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._saved_writes = self.cache.writes
+        if self._started:
+            self._start_thread()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot file, interval and what was saved/loaded by this process"""
+        return {
+            'path': self.path,
+            'interval_seconds': self.interval,
+            'loaded_entries': self.loaded,
+            'saves': self.saves,
+            'last_saved_entries': self.last_saved_entries,
+            'last_save_ms': round(self.last_save_seconds * 1000, 1),
+            'size_mb': round(os.path.getsize(self.path) / (1024 * 1024), 3) if os.path.exists(self.path) else 0
+        }
+
+
+# Snapshotters whose threads are restarted in forked children
+_snapshotters = weakref.WeakSet()
+
+
+def _reset_snapshotters_after_fork():
+    for snapshotter in list(_snapshotters):
+        snapshotter._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_snapshotters_after_fork)
+
+
+def save_snapshots() -> None:
+    """Save every started snapshotter now (gunicorn's worker_exit hook)"""
+    for snapshotter in list(_snapshotters):
+        if snapshotter._started:
+            snapshotter.save()
+
+
+def cache_snapshotter_from_env(cache: PredictionCache) -> Optional[CacheSnapshotter]:
+    """
+    CacheSnapshotter configured from CACHE_SNAPSHOT_PATH and
+    CACHE_SNAPSHOT_SECONDS, or None when CACHE_SNAPSHOT_SECONDS=0
+    """
+    interval = float(os.getenv('CACHE_SNAPSHOT_SECONDS', '60'))
+    if interval <= 0:
+        return None
+    return CacheSnapshotter(cache, os.getenv('CACHE_SNAPSHOT_PATH', DEFAULT_SNAPSHOT_PATH), interval)
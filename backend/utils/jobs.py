@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Asynchronous Batch Prediction Jobs
+==================================
+SQLite-backed job store and background runner for prediction batches
+too large for a synchronous request.
+
+POST /api/jobs stores the SMILES list and returns a job id straight away.
+Runner threads claim queued jobs, predict them chunk by chunk and write
+each chunk's results in the same transaction that advances the job's
+progress, so GET /api/jobs/<id> can report progress and page through the
+results while the job is still running. Jobs interrupted by a restart
+resume from their last finished chunk.
+
+Configuration (see .env.example): JOB_DB_PATH, JOB_WORKERS,
+JOB_CHUNK_SIZE, JOB_MAX_MOLECULES.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'jobs.sqlite')
+
+# A running job whose owner has not reported progress for this long is
+# considered abandoned and can be claimed by another runner
+STALE_JOB_SECONDS = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    options TEXT NOT NULL,
+    owner TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_inputs (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    smiles TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+"""
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _json_default(value):
+    """Serialize NumPy scalars (and anything else) found in results"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class JobStore:
+    """Jobs, their inputs and their results in one SQLite database"""
+    
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        """
+        Open (creating if needed) the job database
+        
+        Args:
+            path: SQLite file; shared by every process on the host
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Per-thread (and per-process) connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def create_job(self, smiles_list: List[str], options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Store a new queued job
+        
+        Args:
+            smiles_list: Molecules to predict
+            options: JSON-serializable prediction options (endpoints, validate)
+        
+        Returns:
+            Job id
+        """
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, total, options, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, 'queued', len(smiles_list), json.dumps(options or {}), datetime.now().isoformat())
+            )
+            conn.executemany(
+                'INSERT INTO job_inputs (job_id, idx, smiles) VALUES (?, ?, ?)',
+                ((job_id, i, smiles) for i, smiles in enumerate(smiles_list))
+            )
+        return job_id
+    
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status and progress, or None if the job does not exist"""
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        job['progress'] = round(job['processed'] / job['total'] * 100, 1) if job['total'] else 100.0
+        job.pop('heartbeat')
+        job.pop('owner')
+        return job
+    
+    def get_results(self, job_id: str, offset: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        """Stored results in input order, starting at input index offset"""
+        rows = self._connect().execute(
+            'SELECT idx, result FROM job_results WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?',
+            (job_id, offset, limit)
+        ).fetchall()
+        return [dict(json.loads(row['result']), index=row['idx']) for row in rows]
+    
+    def claim_next_job(self, owner: str) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the oldest queued job (or an abandoned running one)
+        
+        Returns:
+            The claimed job, or None if there is nothing to do
+        """
+        conn = self._connect()
+        stale_before = time.time() - STALE_JOB_SECONDS
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND heartbeat < ?) ORDER BY created_at LIMIT 1",
+                (stale_before,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (owner, time.time(), datetime.now().isoformat(), row['id'])
+            )
+        return self.get_job(row['id'])
+    
+    def get_inputs(self, job_id: str, start: int, count: int) -> List[str]:
+        """SMILES of inputs start..start+count"""
+        rows = self._connect().execute(
+            'SELECT smiles FROM job_inputs WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?',
+            (job_id, start, count)
+        ).fetchall()
+        return [row['smiles'] for row in rows]
+    
+    def save_chunk(self, job_id: str, owner: str, start: int, results: List[Dict[str, Any]]) -> bool:
+        """
+        Store a finished chunk and advance the job's progress
+        
+        Returns:
+            False if the job was cancelled or taken over meanwhile (nothing
+            is stored then)
+        """
+        failed = sum(1 for result in results if 'error' in result)
+        conn = self._connect()
+        with conn:
+            updated = conn.execute(
+                "UPDATE jobs SET processed = ?, failed = failed + ?, heartbeat = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running' AND processed = ?",
+                (start + len(results), failed, time.time(), job_id, owner, start)
+            ).rowcount
+            if not updated:
+                return False
+            conn.executemany(
+                'INSERT OR REPLACE INTO job_results (job_id, idx, result) VALUES (?, ?, ?)',
+                ((job_id, start + i, json.dumps(result, default=_json_default))
+                 for i, result in enumerate(results))
+            )
+        return True
+    
+    def finish_job(self, job_id: str, owner: str, status: str, error: Optional[str] = None) -> None:
+        """Mark a running job completed or failed"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (status, error, datetime.now().isoformat(), job_id, owner)
+            )
+    
+    def cancel_job(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False if it already finished"""
+        conn = self._connect()
+        with conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+                "WHERE id = ? AND status IN ('queued', 'running')",
+                (datetime.now().isoformat(), job_id)
+            ).rowcount
+        return bool(updated)
+    
+    def requeue_orphaned_jobs(self, hostname: str) -> int:
+        """
+        Put running jobs back in the queue whose owning process on this
+        host no longer exists (the server was restarted mid-job)
+        
+        Returns:
+            Number of jobs requeued
+        """
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT id, owner FROM jobs WHERE status = 'running' AND owner LIKE ?", (f"{hostname}:%",)
+        ).fetchall()
+        requeued = 0
+        for row in rows:
+            pid = int(row['owner'].rsplit(':', 1)[1])
+            if pid != os.getpid() and _process_exists(pid):
+                continue
+            with conn:
+                requeued += conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ? AND owner = ? AND status = 'running'",
+                    (row['id'], row['owner'])
+                ).rowcount
+        return requeued
+    
+    def queue_counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        rows = self._connect().execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+
+# Runners whose threads are restarted in forked children
+_runners = weakref.WeakSet()
+
+
+def _reset_runners_after_fork():
+    for runner in list(_runners):
+        runner._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_runners_after_fork)
+
+
+class JobRunner:
+    """Background threads that process queued jobs chunk by chunk"""
+    
+    def __init__(self, store: JobStore, predict_batch: Callable[[List[str], Dict[str, Any]], List[Dict[str, Any]]],
+                 workers: int = 1, chunk_size: int = 500, poll_seconds: float = 2.0):
+        """
+        Initialize the runner (threads start with start())
+        
+        Args:
+            store: JobStore to take jobs from
+            predict_batch: function(smiles_list, options) returning one
+                result dict per molecule
+            workers: Number of runner threads in this process
+            chunk_size: Molecules predicted (and stored) per step
+            poll_seconds: How often idle threads look for jobs submitted
+                by other processes
+        """
+        self.store = store
+        self.predict_batch = predict_batch
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.poll_seconds = poll_seconds
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._started = False
+        _runners.add(self)
+    
+    @property
+    def owner(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+    
+    def start(self) -> None:
+        """Start the runner threads (resuming jobs interrupted by a restart)"""
+        requeued = self.store.requeue_orphaned_jobs(socket.gethostname())
+        if requeued:
+            print(f"🔄 Resuming {requeued} interrupted batch job(s)")
+        self._started = True
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'job-runner-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self) -> None:
+        """Stop the runner threads after their current chunk"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._started = False
+    
+    def submit(self, smiles_list: List[str], options: Optional[Dict[str, Any]] = None) -> str:
+        """Store a job and wake an idle runner thread"""
+        job_id = self.store.create_job(smiles_list, options)
+        self._wakeup.set()
+        return job_id
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim_next_job(self.owner)
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+                continue
+            self._process(job)
+    
+    def _process(self, job):
+        job_id, owner = job['id'], self.owner
+        start = job['processed']
+        print(f"🧪 Job {job_id}: {job['total'] - start} molecules to predict")
+        try:
+            while start < job['total'] and not self._stop.is_set():
+                smiles_chunk = self.store.get_inputs(job_id, start, self.chunk_size)
+                results = self.predict_batch(smiles_chunk, job['options'])
+                if not self.store.save_chunk(job_id, owner, start, results):
+                    print(f"⚠️ Job {job_id} was cancelled or taken over, stopping")
+                    return
+                start += len(smiles_chunk)
+            if start >= job['total']:
+                self.store.finish_job(job_id, owner, 'completed')
+                print(f"✅ Job {job_id} completed ({job['total']} molecules)")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            self.store.finish_job(job_id, owner, 'failed', str(e))
+    
+    def _after_fork(self):
+        """Forked children run their own threads"""
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        if self._started:
+            self.start()
+
+
+def job_runner_from_env(predict_batch) -> JobRunner:
+    """JobRunner configured from JOB_DB_PATH, JOB_WORKERS and JOB_CHUNK_SIZE"""
+    store = JobStore(os.getenv('JOB_DB_PATH', DEFAULT_DB_PATH))
+    return JobRunner(
+        store,
+        predict_batch,
+        workers=int(os.getenv('JOB_WORKERS', '1')),
+        chunk_size=int(os.getenv('JOB_CHUNK_SIZE', '500'))
+    )
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Shared Prediction Cache (L2)
+============================
+Prediction cache tier shared by every gunicorn worker on the host.
+
+Each worker keeps its own in-process PredictionCache (L1), so without a
+shared tier a molecule predicted by one worker is a miss for all the
+others. SharedPredictionCache stores results in a SQLite database in WAL
+mode (readers never block each other or the writer), under the same keys
+as L1: a digest of the model version and the normalized (canonical)
+SMILES. CachedPredictionWrapper consults it after an L1 miss and writes
+every fresh prediction to both tiers.
+
+Clearing the shared tier bumps a generation counter; other workers notice
+it within GENERATION_CHECK_SECONDS and clear their L1 as well.
+
+Configuration (see .env.example): SHARED_CACHE, SHARED_CACHE_PATH,
+SHARED_CACHE_MAX_SIZE and CACHE_TTL.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'prediction_cache.sqlite'
+)
+
+# How often a worker checks whether another worker cleared the cache
+GENERATION_CHECK_SECONDS = 1.0
+
+# Keys per SELECT ... IN (...) query
+_LOOKUP_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    key TEXT PRIMARY KEY,
+    fields TEXT NOT NULL,
+    endpoints TEXT NOT NULL,
+    created REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS predictions_created ON predictions (created);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0);
+"""
+
+
+def _json_default(value):
+    """Serialize NumPy scalars (and anything else) found in results"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _split_result(result: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Cacheable (fields, endpoint predictions) of a result, as stored by PredictionCache"""
+    endpoints = {
+        endpoint: prediction
+        for endpoint, prediction in (result.get('endpoints') or {}).items()
+        if 'error' not in prediction
+    }
+    fields = {k: v for k, v in result.items() if k not in ('endpoints', 'summary')}
+    return fields, endpoints
+
+
+class SharedPredictionCache:
+    """
+    SQLite-backed prediction cache shared across processes
+    
+    Entries expire ttl seconds after they were created. Beyond max_size
+    the oldest entries are removed (by creation time, so hits stay
+    read-only); expiry and the size bound are enforced by a sweep every
+    sweep_every writes.
+    """
+    
+    def __init__(self, path: str = DEFAULT_DB_PATH, ttl_seconds: int = 3600,
+                 max_size: int = 200000, sweep_every: int = 256):
+        """
+        Open (creating if needed) the shared cache database
+        
+        Args:
+            path: SQLite file; shared by every process on the host
+            ttl_seconds: Time to live for entries
+            max_size: Approximate maximum number of molecules kept
+            sweep_every: Writes (per process) between expiry/size sweeps
+        """
+        self.path = path
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self.sweep_every = sweep_every
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+        
+        # Counters are this process's; the entry count is the host's
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self._writes_since_sweep = 0
+        self._generation = self._read_generation()
+        self._generation_checked = time.monotonic()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Per-thread (and per-process) connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def _read_generation(self) -> int:
+        row = self._connect().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        return row[0] if row else 0
+    
+    def generation_changed(self) -> bool:
+        """
+        Whether the cache was cleared (by any process) since the last check
+        
+        Checks the database at most once per GENERATION_CHECK_SECONDS.
+        """
+        now = time.monotonic()
+        if now - self._generation_checked < GENERATION_CHECK_SECONDS:
+            return False
+        self._generation_checked = now
+        try:
+            generation = self._read_generation()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading shared cache generation: {e}")
+            return False
+        changed = generation != self._generation
+        self._generation = generation
+        return changed
+    
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any], float]]:
+        """
+        Look up one entry
+        
+        Returns:
+            (fields, endpoint_predictions, age_seconds), or None if the key
+            is not cached or has expired
+        """
+        return self.get_many([key]).get(key)
+    
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Tuple[Dict[str, Any], Dict[str, Any], float]]:
+        """Look up several entries; returns key -> (fields, endpoint_predictions, age_seconds)"""
+        keys = list(dict.fromkeys(key for key in keys if key))
+        found = {}
+        try:
+            conn = self._connect()
+            now = time.time()
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[start:start + _LOOKUP_CHUNK]
+                rows = conn.execute(
+                    f"SELECT key, fields, endpoints, created FROM predictions "
+                    f"WHERE key IN ({','.join('?' * len(chunk))}) AND created >= ?",
+                    (*chunk, now - self.ttl)
+                ).fetchall()
+                for key, fields, endpoints, created in rows:
+                    found[key] = (json.loads(fields), json.loads(endpoints), max(0.0, now - created))
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error reading shared cache: {e}")
+            with self._lock:
+                self.errors += 1
+        
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+    
+    def set(self, key: str, result: Dict[str, Any], replace: bool = False) -> bool:
+        """Store one prediction result (see set_many)"""
+        return self.set_many([(key, result)], replace=replace)
+    
+    def set_many(self, items: List[Tuple[str, Dict[str, Any]]], replace: bool = False) -> bool:
+        """
+        Store prediction results in one transaction
+        
+        As in PredictionCache.set, endpoint predictions are merged into a
+        live entry (keeping its age) unless replace is set or either side
+        is an error; failed endpoints are not stored.
+        
+        Args:
+            items: (key, result) pairs
+            replace: Start new entries (fresh TTL) instead of merging
+        
+        Returns:
+            True if stored, False on a database error
+        """
+        items = [(key, _split_result(result)) for key, result in items if key]
+        if not items:
+            return True
+        
+        try:
+            conn = self._connect()
+            now = time.time()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                for key, (fields, endpoints) in items:
+                    created = now
+                    if not replace and 'error' not in fields:
+                        row = conn.execute(
+                            'SELECT fields, endpoints, created FROM predictions WHERE key = ? AND created >= ?',
+                            (key, now - self.ttl)
+                        ).fetchone()
+                        if row is not None and 'error' not in json.loads(row[0]):
+                            # Keep the entry's age, so earlier endpoints still expire on time
+                            endpoints = {**json.loads(row[1]), **endpoints}
+                            fields = json.loads(row[0])
+                            created = row[2]
+                    conn.execute(
+                        'INSERT OR REPLACE INTO predictions (key, fields, endpoints, created) VALUES (?, ?, ?, ?)',
+                        (key, json.dumps(fields, default=_json_default),
+                         json.dumps(endpoints, default=_json_default), created)
+                    )
+                
+                with self._lock:
+                    self.writes += len(items)
+                    self._writes_since_sweep += len(items)
+                    sweep = self._writes_since_sweep >= self.sweep_every
+                    if sweep:
+                        self._writes_since_sweep = 0
+                if sweep:
+                    self._sweep(conn, now)
+            return True
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Error writing shared cache: {e}")
+            with self._lock:
+                self.errors += 1
+            return False
+    
+    def _sweep(self, conn: sqlite3.Connection, now: float) -> None:
+        """Delete expired entries, then the oldest ones beyond max_size (in a transaction)"""
+        conn.execute('DELETE FROM predictions WHERE created < ?', (now - self.ttl,))
+        excess = conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0] - self.max_size
+        if excess > 0:
+            conn.execute(
+                'DELETE FROM predictions WHERE key IN (SELECT key FROM predictions ORDER BY created LIMIT ?)',
+                (excess,)
+            )
+    
+    def clear(self) -> None:
+        """Remove every entry, for all processes (their L1 caches follow via the generation)"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM predictions')
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+        self._generation = self._read_generation()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.writes = 0
+            self.errors = 0
+        logger.info("🗑️  Shared cache cleared")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Entry count and file size (host-wide) plus this process's counters"""
+        try:
+            entries = self._connect().execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        size = sum(
+            os.path.getsize(path) for path in (self.path, self.path + '-wal') if os.path.exists(path)
+        )
+        with self._lock:
+            hits, misses, writes, errors = self.hits, self.misses, self.writes, self.errors
+        total_requests = hits + misses
+        
+        return {
+            'path': self.path,
+            'entries': entries,
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'size_mb': round(size / (1024 * 1024), 3),
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'hit_ratio': f"{(hits / total_requests if total_requests else 0):.1%}",
+            'writes': writes,
+            'errors': errors,
+            'generation': self._generation
+        }
+
+
+def shared_cache_from_env() -> Optional[SharedPredictionCache]:
+    """
+    SharedPredictionCache configured from SHARED_CACHE_PATH,
+    SHARED_CACHE_MAX_SIZE and CACHE_TTL, or None when SHARED_CACHE=0 or
+    the database cannot be opened
+    """
+    if os.getenv('SHARED_CACHE', '1') == '0':
+        return None
+    try:
+        return SharedPredictionCache(
+            os.getenv('SHARED_CACHE_PATH', DEFAULT_DB_PATH),
+            ttl_seconds=int(os.getenv('CACHE_TTL', '3600')),
+            max_size=int(os.getenv('SHARED_CACHE_MAX_SIZE', '200000'))
+        )
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Shared prediction cache disabled: {e}")
+        return None
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point for gunicorn (gunicorn --config gunicorn.conf.py wsgi:app)
+===========================================================================
+`gunicorn app:app` imports the dashboard package in app/, which shadows
+app.py, so the API module is loaded here from its file instead. Services
+are not initialized on import: gunicorn's post_worker_init hook (see
+gunicorn.conf.py) calls initialize_services() in every worker.
+"""
+
+import importlib.util
+import os
+import sys
+
+_API_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+_spec = importlib.util.spec_from_file_location('drugtox_api', _API_PATH)
+api = importlib.util.module_from_spec(_spec)
+sys.modules[_spec.name] = api  # Flask resolves the app's module by its import name
+_spec.loader.exec_module(api)
+
+app = api.app
+initialize_services = api.initialize_services